@@ -0,0 +1,363 @@
+"""
+Device actuation: turns EnergyDecision rows into light/AC/fan commands.
+
+New decisions are planned into DeviceCommand rows, skipping any device whose
+confirmed DeviceState (or in-flight command) already matches. A dispatcher
+thread per worker claims due commands atomically, coalesces them into one
+message per building, and publishes at a bounded message rate through a
+pluggable transport. Unacknowledged commands are retried with jittered
+exponential backoff until ACTUATION_MAX_ATTEMPTS, then marked failed.
+
+Transports:
+    inprocess  stand-in broker with simulated building gateways that ack
+    mqtt       MQTT broker via paho-mqtt (optional dependency)
+
+Actuation is off by default. With ACTUATION_TRANSPORT unset the simulator is
+only used in development and testing; elsewhere the dispatcher refuses to
+start rather than record states no device confirmed.
+"""
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from energy_engine import LEVEL_DUTY
+
+DEVICES = (('lights', 'num_lights'), ('ac', 'num_acs'), ('fans', 'num_fans'))
+LEVEL_BY_NAME = {'Low': 0, 'Medium': 1, 'High': 2}
+WATERMARK = 'actuation_watermark'
+IN_FLIGHT = ('pending', 'sending', 'sent')
+
+def desired_states(level_idx):
+    """{device: (state, level)} the policy wants for a predicted level."""
+    duty = LEVEL_DUTY[int(level_idx)]
+    lights = duty['lights']
+    return {
+        'lights': ('OFF' if lights == 0 else ('ON' if lights >= 1 else 'DIM'), lights),
+        'ac': ('ON' if duty['acs'] > 0 else 'OFF', duty['acs']),
+        'fans': ('ON' if duty['fans'] > 0 else 'OFF', duty['fans']),
+    }
+
+class InProcessTransport:
+    """Local stand-in for a broker: messages go to simulated building gateways that ack.
+
+    `failure_rate` drops that share of commands without an ack so retry paths
+    can be exercised without hardware.
+    """
+    name = 'inprocess'
+
+    def __init__(self, failure_rate=0.0, latency=0.005):
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self._inbox = queue.Queue()
+        self._on_ack = None
+        self._thread = None
+        self.published = 0
+
+    def connect(self, on_ack):
+        self._on_ack = on_ack
+        self._thread = threading.Thread(target=self._gateways, name='actuation-gateways', daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, payload):
+        self.published += 1
+        self._inbox.put((topic, json.dumps(payload)))
+
+    def _gateways(self):
+        while True:
+            topic, body = self._inbox.get()
+            if topic is None:
+                return
+            time.sleep(self.latency)
+            commands = json.loads(body)['commands']
+            acked = [c['id'] for c in commands if random.random() >= self.failure_rate]
+            if acked and self._on_ack:
+                self._on_ack(acked)
+
+    def close(self):
+        self._inbox.put((None, None))
+
+class MqttTransport:
+    """Publishes to <prefix>/<building>/commands and listens on <prefix>/+/acks ({"ids": [...]})."""
+    name = 'mqtt'
+
+    def __init__(self, host, port, prefix):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise RuntimeError("ACTUATION_TRANSPORT=mqtt requires paho-mqtt (pip install paho-mqtt)")
+        self.prefix = prefix
+        self.client = mqtt.Client(client_id=f'smartenergy-{uuid.uuid4().hex[:8]}')
+        self.host, self.port = host, port
+        self.published = 0
+
+    def connect(self, on_ack):
+        def on_message(client, userdata, message):
+            try:
+                on_ack(json.loads(message.payload)['ids'])
+            except (ValueError, KeyError, TypeError):
+                pass
+        self.client.on_message = on_message
+        self.client.connect(self.host, self.port)
+        self.client.subscribe(f'{self.prefix}/+/acks', qos=1)
+        self.client.loop_start()
+
+    def publish(self, topic, payload):
+        info = self.client.publish(f'{self.prefix}/{topic}', json.dumps(payload), qos=1)
+        info.wait_for_publish(timeout=5)
+        self.published += 1
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def make_transport(config):
+    transport = config.get('ACTUATION_TRANSPORT')
+    if transport == 'mqtt':
+        return MqttTransport(config['MQTT_HOST'], config['MQTT_PORT'], config['ACTUATION_TOPIC_PREFIX'])
+    if transport is None and config.get('FLASK_ENV') not in ('development', 'testing') and not config.get('TESTING'):
+        # The simulator confirms commands no device received; never fall back to it silently
+        raise RuntimeError("ACTUATION_TRANSPORT is not set; choose mqtt, or inprocess to run the simulator")
+    if transport not in (None, 'inprocess'):
+        raise RuntimeError(f"Unknown ACTUATION_TRANSPORT '{transport}' (expected inprocess or mqtt)")
+    return InProcessTransport(failure_rate=config.get('ACTUATION_SIM_FAILURE_RATE', 0.0))
+
+class Dispatcher:
+    def __init__(self, app, transport):
+        self.app = app
+        self.transport = transport
+        cfg = app.config
+        self.tick_seconds = cfg['ACTUATION_TICK_SECONDS']
+        self.max_batch = cfg['ACTUATION_MAX_BATCH']
+        self.message_rate = cfg['ACTUATION_MAX_MESSAGES_PER_SEC']
+        self.ack_timeout = cfg['ACTUATION_ACK_TIMEOUT']
+        self.max_attempts = cfg['ACTUATION_MAX_ATTEMPTS']
+        self.retry_base = cfg['ACTUATION_RETRY_BASE']
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.transport.connect(self.handle_acks)
+        self._thread = threading.Thread(target=self._run, name='actuation-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.transport.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self.tick()
+            except Exception as e:
+                self.app.logger.error(f">>> ACTUATION ERROR: {e}")
+            self._stopped.wait(self.tick_seconds)
+
+    def tick(self):
+        planned = self.plan_new_decisions()
+        retried, failed = self.expire_unacked()
+        published, sent = self.dispatch_due()
+        return {'planned': planned, 'retried': retried, 'failed': failed, 'messages': published, 'commands_sent': sent}
+
+    # --- Planning ---
+
+    def plan_new_decisions(self):
+        """Plan commands for decisions logged since the shared watermark."""
+        from models import db, EnergyDecision, CacheVersion
+
+        mark = CacheVersion.query.get(WATERMARK)
+        last_id = mark.version if mark else 0
+        rows = db.session.query(EnergyDecision.id, EnergyDecision.classroom_id, EnergyDecision.predicted_occupancy) \
+            .filter(EnergyDecision.id > last_id).order_by(EnergyDecision.id).limit(50000).all()
+        if not rows:
+            return 0
+
+        # Compare-and-swap the watermark so only one worker plans this range
+        new_id = rows[-1][0]
+        if mark:
+            claimed = CacheVersion.query.filter_by(name=WATERMARK, version=last_id).update(
+                {CacheVersion.version: new_id}, synchronize_session=False)
+        else:
+            db.session.add(CacheVersion(name=WATERMARK, version=new_id))
+            claimed = 1
+        if not claimed:
+            db.session.rollback()
+            return 0
+
+        latest = {}
+        for decision_id, classroom_id, occupancy in rows:
+            latest[classroom_id] = (decision_id, LEVEL_BY_NAME.get(occupancy, 0))
+        try:
+            planned = self.plan(latest)
+        except Exception:
+            db.session.rollback()
+            raise
+        return planned
+
+    def plan(self, latest):
+        """Insert pending commands for {classroom_id: (decision_id, level_idx)}; returns how many."""
+        from models import db, Classroom, DeviceState, DeviceCommand
+
+        room_ids = list(latest)
+        rooms = {c.id: c for c in Classroom.query.filter(Classroom.id.in_(room_ids), Classroom.is_active == True).all()}
+        confirmed = {(s.classroom_id, s.device): s.state for s in DeviceState.query.filter(DeviceState.classroom_id.in_(room_ids)).all()}
+        in_flight = {}
+        for cmd in DeviceCommand.query.filter(DeviceCommand.classroom_id.in_(room_ids), DeviceCommand.status.in_(IN_FLIGHT)) \
+                .order_by(DeviceCommand.id).all():
+            in_flight[(cmd.classroom_id, cmd.device)] = cmd
+
+        now = datetime.utcnow()
+        new_rows, superseded = [], []
+        for room_id, (decision_id, level_idx) in latest.items():
+            room = rooms.get(room_id)
+            if room is None:
+                continue
+            for device, (state, level) in desired_states(level_idx).items():
+                if not getattr(room, dict(DEVICES)[device]):
+                    continue  # room has none of this device
+                pending = in_flight.get((room_id, device))
+                target = pending.state if pending else confirmed.get((room_id, device))
+                if target == state:
+                    continue  # no-op: already there or already on its way
+                if pending:
+                    # Newer intent wins: never retry or confirm the older command
+                    superseded.append(pending.id)
+                new_rows.append({
+                    'classroom_id': room_id, 'building': room.building, 'device': device,
+                    'state': state, 'level': level, 'decision_id': decision_id, 'status': 'pending',
+                    'attempts': 0, 'next_attempt_at': now, 'created_at': now
+                })
+
+        if superseded:
+            DeviceCommand.query.filter(DeviceCommand.id.in_(superseded), DeviceCommand.status.in_(IN_FLIGHT)) \
+                .update({DeviceCommand.status: 'superseded'}, synchronize_session=False)
+        if new_rows:
+            db.session.execute(DeviceCommand.__table__.insert(), new_rows)
+        db.session.commit()
+        return len(new_rows)
+
+    # --- Delivery ---
+
+    def _backoff(self, attempts):
+        # Full jitter keeps retries from thousands of devices from landing together
+        return random.uniform(0, self.retry_base * (2 ** attempts))
+
+    def expire_unacked(self):
+        from models import db, DeviceCommand
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ack_timeout)
+        stale = DeviceCommand.query.filter(DeviceCommand.status == 'sent', DeviceCommand.sent_at < cutoff).all()
+        retried = failed = 0
+        now = datetime.utcnow()
+        for cmd in stale:
+            if cmd.attempts >= self.max_attempts:
+                cmd.status, cmd.last_error = 'failed', 'No acknowledgement'
+                failed += 1
+            else:
+                cmd.status = 'pending'
+                cmd.next_attempt_at = now + timedelta(seconds=self._backoff(cmd.attempts))
+                retried += 1
+        if stale:
+            db.session.commit()
+        return retried, failed
+
+    def _claim(self, limit):
+        """Atomically take up to `limit` due commands for this worker."""
+        from models import db, DeviceCommand
+
+        token = uuid.uuid4().hex
+        due = db.session.query(DeviceCommand.id).filter(
+            DeviceCommand.status == 'pending', DeviceCommand.next_attempt_at <= datetime.utcnow()
+        ).order_by(DeviceCommand.id).limit(limit).subquery()
+        DeviceCommand.query.filter(DeviceCommand.id.in_(db.session.query(due.c.id)), DeviceCommand.status == 'pending') \
+            .update({DeviceCommand.status: 'sending', DeviceCommand.claim_token: token}, synchronize_session=False)
+        db.session.commit()
+        return DeviceCommand.query.filter_by(claim_token=token, status='sending').order_by(DeviceCommand.id).all()
+
+    def dispatch_due(self):
+        from models import db, DeviceCommand
+
+        budget = max(1, int(self.message_rate * self.tick_seconds))
+        claimed = self._claim(budget * self.max_batch)
+        if not claimed:
+            return 0, 0
+
+        by_building = {}
+        for cmd in claimed:
+            by_building.setdefault(cmd.building or 'default', []).append(cmd)
+        messages = []
+        for building, cmds in by_building.items():
+            for i in range(0, len(cmds), self.max_batch):
+                messages.append((building, cmds[i:i + self.max_batch]))
+        random.shuffle(messages)  # no building is always first at a slot boundary
+
+        interval = 1.0 / self.message_rate
+        published = sent = 0
+        now = datetime.utcnow()
+        for building, cmds in messages:
+            # Mark 'sent' before publishing so a fast ack is never overwritten; the
+            # status guard leaves commands superseded since the claim untouched, and
+            # the per-message token tells which ones the update actually moved
+            token = uuid.uuid4().hex
+            DeviceCommand.query.filter(DeviceCommand.id.in_([c.id for c in cmds]), DeviceCommand.status == 'sending').update(
+                {DeviceCommand.status: 'sent', DeviceCommand.sent_at: now, DeviceCommand.claim_token: token,
+                 DeviceCommand.attempts: DeviceCommand.attempts + 1}, synchronize_session=False)
+            db.session.commit()
+            moved = {row.id for row in db.session.query(DeviceCommand.id).filter_by(claim_token=token, status='sent')}
+            cmds = [c for c in cmds if c.id in moved]
+            if not cmds:
+                continue
+            ids = [c.id for c in cmds]
+            payload = {'sent_at': now.isoformat(), 'commands': [
+                {'id': c.id, 'classroom_id': c.classroom_id, 'device': c.device, 'state': c.state, 'level': c.level}
+                for c in cmds
+            ]}
+            try:
+                self.transport.publish(f'{building}/commands', payload)
+            except Exception as e:
+                retry_at = now + timedelta(seconds=self._backoff(cmds[0].attempts or 0))
+                DeviceCommand.query.filter(DeviceCommand.id.in_(ids), DeviceCommand.status == 'sent').update(
+                    {DeviceCommand.status: 'pending', DeviceCommand.last_error: str(e)[:255],
+                     DeviceCommand.next_attempt_at: retry_at}, synchronize_session=False)
+                db.session.commit()
+                continue
+            published += 1
+            sent += len(cmds)
+            time.sleep(interval)  # bounded message rate towards the broker
+        return published, sent
+
+    def handle_acks(self, ids):
+        """Mark commands acknowledged and record the devices' new confirmed state."""
+        from models import db, DeviceCommand, DeviceState
+
+        with self.app.app_context():
+            cmds = DeviceCommand.query.filter(DeviceCommand.id.in_(ids), DeviceCommand.status.in_(('sending', 'sent'))).all()
+            if not cmds:
+                return
+            now = datetime.utcnow()
+            keys = {(c.classroom_id, c.device) for c in cmds}
+            states = {(s.classroom_id, s.device): s for s in DeviceState.query.filter(
+                DeviceState.classroom_id.in_({k[0] for k in keys})).all()}
+            for c in sorted(cmds, key=lambda c: c.id):
+                c.status, c.acked_at = 'acked', now
+                state = states.get((c.classroom_id, c.device))
+                if state is None:
+                    state = DeviceState(classroom_id=c.classroom_id, device=c.device)
+                    db.session.add(state)
+                    states[(c.classroom_id, c.device)] = state
+                state.state, state.level, state.updated_at = c.state, c.level, now
+            db.session.commit()
+
+def get_dispatcher(app):
+    return app.extensions.get('actuation')
+
+def start_dispatcher(app):
+    """Create and start this worker's dispatcher (called from setup_automation)."""
+    dispatcher = Dispatcher(app, make_transport(app.config))
+    dispatcher.start()
+    app.extensions['actuation'] = dispatcher
+    return dispatcher
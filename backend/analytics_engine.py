@@ -0,0 +1,317 @@
+"""
+Time-bucketed decision analytics.
+
+Savings, decision counts and the Low/Medium/High occupancy mix per
+(time bucket, building or classroom). Queries read DecisionRollup, which
+holds one row per room and day with a (5 metrics x 24 hours) array, instead
+of bucketing raw decisions. A month across 500 rooms is then 15k rows rather
+than hundreds of thousands, and hour/day/week buckets plus building or room
+grouping come from summing axes of one dense array.
+
+Rollups are maintained incrementally: each refresh folds in the decisions
+logged since a shared id watermark (compare-and-swap on CacheVersion, as the
+actuation dispatcher does), so concurrent workers never count a row twice.
+The first refresh also backfills monthly partitions and archived months.
+Refreshes run on the write path (after decisions are logged) and from the
+scheduler; queries only read, and the watermark doubles as the version the
+analytics response cache keys off.
+
+Postgres hands out ids before commit, so a lower id can become visible
+after a higher one. A refresh therefore stops at the first gap in the ids
+until the row after it is GAP_GRACE_SECONDS old; by then the transaction
+that took the missing id has committed or rolled back.
+"""
+from datetime import datetime, date, timedelta
+
+import numpy as np
+from sqlalchemy import select, func, bindparam, case
+
+import retention
+
+GRAINS = ('hour', 'day', 'week')
+GROUPS = ('building', 'classroom', 'none')
+METRICS = ('energy_saved', 'decisions', 'occupancy_pct', 'low', 'medium', 'high')
+DEFAULT_METRICS = ('energy_saved', 'decisions', 'occupancy_pct')
+LEVELS = ('Low', 'Medium', 'High')
+# Attendance share each predicted level stands for: midpoints of the model's
+# label bands (<30%, 30-60%, >60%)
+OCCUPANCY_LEVEL_PERCENT = np.array([15.0, 45.0, 80.0])
+
+WATERMARK = 'rollup_watermark'
+REFRESH_BATCH = 200000
+GAP_GRACE_SECONDS = 120
+# Rows of a rollup array, stored as little-endian float32 (exact for counts below 2**24)
+KWH, DECISIONS, LOW, MEDIUM, HIGH = range(5)
+ROLLUP_DTYPE = np.dtype('<f4')
+
+_BUCKET_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d'}
+
+def parse_range(start_arg, end_arg, default_days=30, max_days=None):
+    """(start, end) datetimes from ISO dates/datetimes, end exclusive. Returns (range, error).
+
+    Both ends are widened to whole hours, the finest bucket the rollups hold,
+    so equivalent requests share one cache key.
+    """
+    try:
+        end = datetime.fromisoformat(end_arg) if end_arg else \
+            datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        start = datetime.fromisoformat(start_arg) if start_arg else end - timedelta(days=default_days)
+    except ValueError:
+        return None, 'Invalid start/end, expected ISO dates (YYYY-MM-DD)'
+    if start.tzinfo or end.tzinfo:
+        return None, 'start/end must be UTC times without an offset'
+    start = start.replace(minute=0, second=0, microsecond=0)
+    if end != end.replace(minute=0, second=0, microsecond=0):
+        end = end.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if start >= end:
+        return None, 'start must be before end'
+    if max_days and end - start > timedelta(days=max_days):
+        return None, f'Range is limited to {max_days} days'
+    return (start, end), None
+
+# --- Rollup maintenance ----------------------------------------------------------
+
+def aggregate(frame):
+    """{(classroom_id, day): (5, 24) array} from decision rows."""
+    import pandas as pd
+
+    if frame.empty:
+        return {}
+    stamps = pd.to_datetime(frame['timestamp']).to_numpy(dtype='datetime64[h]')
+    day_numbers = stamps.astype('datetime64[D]').astype(np.int64)
+    hours = (stamps - stamps.astype('datetime64[D]')).astype(np.int64)
+    rooms = frame['classroom_id'].to_numpy(dtype=np.int64)
+    codes, uniques = pd.factorize(rooms * 1000000 + day_numbers)
+    tensor = np.zeros((len(uniques), 5, 24))
+    np.add.at(tensor, (codes, KWH, hours), frame['energy_saved_kwh'].fillna(0).to_numpy(dtype=float))
+    np.add.at(tensor, (codes, DECISIONS, hours), 1.0)
+    occupancy = frame['predicted_occupancy'].to_numpy()
+    for row, level in zip((LOW, MEDIUM, HIGH), LEVELS):
+        hit = occupancy == level
+        np.add.at(tensor, (codes[hit], row, hours[hit]), 1.0)
+    epoch = date(1970, 1, 1)
+    return {(int(key // 1000000), epoch + timedelta(days=int(key % 1000000))): tensor[i] for i, key in enumerate(uniques)}
+
+def _merge(session, partial):
+    """Add aggregated arrays into DecisionRollup rows (caller commits)."""
+    from models import DecisionRollup
+
+    if not partial:
+        return
+    table = DecisionRollup.__table__
+    rooms = {room for room, _ in partial}
+    days = [day for _, day in partial]
+    existing = {(r.classroom_id, r.day): (r.id, r.hourly) for r in session.execute(
+        select(table.c.id, table.c.classroom_id, table.c.day, table.c.hourly).where(
+            table.c.classroom_id.in_(rooms), table.c.day >= min(days), table.c.day <= max(days)))}
+    inserts, updates = [], []
+    now = datetime.utcnow()
+    for (room, day), values in partial.items():
+        found = existing.get((room, day))
+        if found is None:
+            inserts.append({'classroom_id': room, 'day': day, 'hourly': values.astype(ROLLUP_DTYPE).tobytes(), 'updated_at': now})
+        else:
+            merged = np.frombuffer(found[1], dtype=ROLLUP_DTYPE).reshape(5, 24) + values
+            updates.append({'row_id': found[0], 'hourly': merged.astype(ROLLUP_DTYPE).tobytes(), 'updated_at': now})
+    if inserts:
+        session.execute(table.insert(), inserts)
+    if updates:
+        session.execute(table.update().where(table.c.id == bindparam('row_id'))
+                        .values(hourly=bindparam('hourly'), updated_at=bindparam('updated_at')), updates)
+
+def _backfill(session, engine, config):
+    """Aggregate decisions that already left the hot table (first refresh only)."""
+    import pandas as pd
+
+    names = ['id', 'classroom_id', 'timestamp', 'predicted_occupancy', 'energy_saved_kwh']
+    frames = []
+    warm = retention.decision_partitions.union(engine, columns=names)
+    if warm is not None:
+        with engine.connect() as conn:
+            frames.append(pd.DataFrame(conn.execute(select(warm)).fetchall(), columns=names))
+    archive = retention.get_archive(config)
+    for month_key in archive.months():
+        frames.append(archive.frame(month_key, names))
+    for frame in frames:
+        _merge(session, aggregate(frame))
+
+def _settled(rows, last_id, now):
+    """Leading rows that can be folded: stop at an id gap whose next row is still recent."""
+    expected = last_id + 1
+    for i, row in enumerate(rows):
+        if row[0] != expected and row[2] is not None and (now - row[2]).total_seconds() < GAP_GRACE_SECONDS:
+            return rows[:i]
+        expected = row[0] + 1
+    return rows
+
+def refresh_rollups(engine, config, backfill=True):
+    """Fold decisions logged since the watermark into DecisionRollup. Returns rows folded in.
+
+    With backfill=False nothing happens until a refresh with backfill has created the
+    watermark, so request paths never pay for the one-off history scan.
+    """
+    import pandas as pd
+    from models import db, EnergyDecision, CacheVersion
+
+    folded = 0
+    while True:
+        mark = CacheVersion.query.get(WATERMARK)
+        if mark is None and not backfill:
+            return folded
+        last_id = mark.version if mark else 0
+        hot = EnergyDecision.__table__
+        fetched = db.session.execute(
+            select(hot.c.id, hot.c.classroom_id, hot.c.timestamp, hot.c.predicted_occupancy, hot.c.energy_saved_kwh)
+            .where(hot.c.id > last_id).order_by(hot.c.id).limit(REFRESH_BATCH)).fetchall()
+        rows = _settled(fetched, last_id, datetime.utcnow())
+        if not rows and mark:
+            return folded
+        new_id = rows[-1][0] if rows else 0
+
+        # Compare-and-swap the watermark so only one worker folds this range
+        if mark:
+            claimed = CacheVersion.query.filter_by(name=WATERMARK, version=last_id).update(
+                {CacheVersion.version: new_id}, synchronize_session=False)
+        else:
+            db.session.add(CacheVersion(name=WATERMARK, version=new_id))
+            claimed = 1
+        if not claimed:
+            db.session.rollback()
+            return folded
+        try:
+            if not mark:
+                _backfill(db.session, engine, config)
+            frame = pd.DataFrame(rows, columns=['id', 'classroom_id', 'timestamp', 'predicted_occupancy', 'energy_saved_kwh'])
+            _merge(db.session, aggregate(frame))
+            db.session.commit()
+        except Exception:
+            # Another worker created the watermark or a rollup row first; it will fold these rows
+            db.session.rollback()
+            return folded
+        folded += len(rows)
+        if len(fetched) < REFRESH_BATCH or len(rows) < len(fetched):
+            return folded
+
+# --- Queries ------------------------------------------------------------------
+
+def _load(start, end, building, classroom_id):
+    """(room ids, buildings, day offsets, (n, 5, 24) arrays) for rollup rows in range."""
+    from models import db, DecisionRollup, Classroom
+
+    rollup, rooms_table = DecisionRollup.__table__, Classroom.__table__
+    query = select(rollup.c.classroom_id, rooms_table.c.building, rollup.c.day, rollup.c.hourly) \
+        .select_from(rollup.outerjoin(rooms_table, rooms_table.c.id == rollup.c.classroom_id)) \
+        .where(rollup.c.day >= start.date(), rollup.c.day <= (end - timedelta(microseconds=1)).date())
+    if building:
+        query = query.where(rooms_table.c.building == building)
+    if classroom_id is not None:
+        query = query.where(rollup.c.classroom_id == classroom_id)
+    rows = db.session.execute(query).fetchall()
+    first_day = start.date()
+    rooms = np.array([r[0] for r in rows], dtype=int)
+    buildings = np.array([r[1] for r in rows], dtype=object)
+    offsets = np.array([(r[2] - first_day).days for r in rows], dtype=int)
+    values = np.frombuffer(b''.join(r[3] for r in rows), dtype=ROLLUP_DTYPE).reshape(len(rows), 5, 24).astype(np.float64)
+    return rooms, buildings, offsets, values
+
+def series(engine, config, start, end, grain='day', group_by='building', building=None,
+           classroom_id=None, metrics=DEFAULT_METRICS):
+    """Dense per-group series over the bucket axis of [start, end)."""
+    import pandas as pd
+    from models import Classroom
+
+    rooms, buildings, offsets, values = _load(start, end, building, classroom_id)
+
+    # Hour axis from midnight of the first day, trimmed to [start, end)
+    first = datetime.combine(start.date(), datetime.min.time())
+    lo = int((start - first).total_seconds() // 3600)
+    hi = int(-(-(end - first).total_seconds() // 3600))
+
+    if group_by == 'building':
+        labels_raw = buildings
+    elif group_by == 'classroom':
+        labels_raw = rooms.astype(object)
+    else:
+        labels_raw = np.full(len(rooms), 'all', dtype=object)
+    keys = sorted(set(labels_raw.tolist()), key=lambda k: (k is None, str(k)))
+    key_index = {k: i for i, k in enumerate(keys)}
+    groups = np.array([key_index[k] for k in labels_raw], dtype=int)
+
+    n_days = max(-(-hi // 24), 1)
+    cells = 5 * 24
+    # Sum every (group, day) cell block with one bincount instead of np.add.at
+    slots = ((groups * n_days + offsets)[:, None] * cells + np.arange(cells)).ravel()
+    summed = np.bincount(slots, weights=values.reshape(-1), minlength=len(keys) * n_days * cells)
+    hourly = summed.reshape(len(keys), n_days, 5, 24).transpose(0, 2, 1, 3) \
+        .reshape(len(keys), 5, n_days * 24)[:, :, lo:hi]              # (G, 5, H)
+
+    hour_stamps = pd.date_range(first + timedelta(hours=lo), periods=hi - lo, freq='h')
+    if grain == 'hour':
+        bucketed, buckets = hourly, list(hour_stamps.strftime(_BUCKET_FORMATS['hour']))
+    else:
+        if grain == 'day':
+            bucket_start = hour_stamps.normalize()
+        else:
+            bucket_start = hour_stamps.normalize() - pd.to_timedelta(hour_stamps.weekday, unit='D')
+        codes, uniques = pd.factorize(bucket_start)
+        membership = np.zeros((len(codes), len(uniques)))
+        membership[np.arange(len(codes)), codes] = 1.0
+        bucketed = hourly @ membership
+        buckets = list(pd.DatetimeIndex(uniques).strftime(_BUCKET_FORMATS[grain]))
+
+    mix = bucketed[:, LOW:HIGH + 1]                                      # (G, 3, B)
+    counted = mix.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        occupancy = np.where(counted > 0, np.einsum('gmb,m->gb', mix, OCCUPANCY_LEVEL_PERCENT) / counted, 0.0)
+    columns = {
+        'energy_saved': lambda: np.round(bucketed[:, KWH], 3), 'decisions': lambda: np.rint(bucketed[:, DECISIONS]).astype(int),
+        'occupancy_pct': lambda: np.round(occupancy, 1),
+        'low': lambda: np.rint(mix[:, 0]).astype(int), 'medium': lambda: np.rint(mix[:, 1]).astype(int),
+        'high': lambda: np.rint(mix[:, 2]).astype(int)
+    }
+    columns = {metric: columns[metric]() for metric in metrics}
+
+    names = {}
+    if group_by == 'classroom' and keys:
+        names = dict(Classroom.query.with_entities(Classroom.id, Classroom.name).filter(Classroom.id.in_(keys)).all())
+    result = []
+    for i, k in enumerate(keys):
+        entry = {'key': k, 'label': names.get(k, k if k is not None else 'Unassigned')}
+        for metric in metrics:
+            entry[metric] = columns[metric][i].tolist()
+        result.append(entry)
+
+    totals_mix = mix.sum(axis=(0, 2))
+    return {
+        'grain': grain, 'group_by': group_by,
+        'start': start.isoformat(), 'end': end.isoformat(),
+        'buckets': buckets, 'series': result,
+        'totals': {
+            'energy_saved': round(float(bucketed[:, KWH].sum()), 2),
+            'decisions': int(round(bucketed[:, DECISIONS].sum())),
+            'occupancy_mix': {level.lower(): int(round(n)) for level, n in zip(LEVELS, totals_mix)},
+            'avg_occupancy': round(float(totals_mix @ OCCUPANCY_LEVEL_PERCENT / totals_mix.sum()), 1) if totals_mix.sum() else 0.0
+        }
+    }
+
+def average_occupancy(engine, config, days=30):
+    """Mean seat occupancy % over recent recorded sessions, else estimated from the decision mix.
+
+    Attendance is a head count, so each session is divided by its room's
+    capacity (an over-full room counts as 100%). Sessions in rooms without a
+    known capacity are left out.
+    """
+    from models import AttendanceHistory, Timetable, Classroom
+
+    since = datetime.utcnow() - timedelta(days=days)
+    percent = AttendanceHistory.actual_attendance * 100.0 / Classroom.capacity
+    measured = AttendanceHistory.query \
+        .join(Timetable, Timetable.id == AttendanceHistory.timetable_id) \
+        .join(Classroom, Classroom.id == Timetable.classroom_id) \
+        .with_entities(func.avg(case((percent > 100.0, 100.0), else_=percent))) \
+        .filter(AttendanceHistory.date >= since.date(), Classroom.capacity > 0,
+                AttendanceHistory.actual_attendance.isnot(None)).scalar()
+    if measured is not None:
+        return round(float(measured), 1)
+    summary = series(engine, config, since, datetime.utcnow(), grain='week', group_by='none', metrics=())
+    return summary['totals']['avg_occupancy']
@@ -1,14 +1,17 @@
 import os
-import logging
-from logging.handlers import RotatingFileHandler
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_talisman import Talisman
 from flask_jwt_extended import JWTManager
 
 from config import config_by_name
-from models import db, User, Classroom, Timetable
-from services import PasswordService
+from models import db, User, Classroom, Timetable, upgrade_schema
+from services import PasswordService, CacheService
+import metrics
+import profiling
+import log_pipeline
+import serialization
+import compression
 
 def create_app(config_name=None):
     if config_name is None:
@@ -17,9 +20,17 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config_by_name[config_name])
     
+    # Logging first so request IDs exist before the other request hooks run
+    configure_logging(app)
+    serialization.init_app(app)
+    # Registered early so it runs after the other after_request hooks have set their headers
+    compression.init_app(app)
+
     # Initialize Extensions
     db.init_app(app)
     jwt = JWTManager(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
     
     # CORS Configuration
     frontend_url = app.config.get('FRONTEND_URL', 'http://localhost:5173')
@@ -29,9 +40,6 @@ def create_app(config_name=None):
     is_dev = app.config.get('DEBUG', True)
     Talisman(app, content_security_policy=None, force_https=not is_dev)
     
-    # Logging
-    configure_logging(app)
-    
     # Register Blueprints
     from routes.auth import auth_bp
     from routes.classroom import classroom_bp
@@ -39,6 +47,9 @@ def create_app(config_name=None):
     from routes.ml import ml_bp
     from routes.analytics import analytics_bp
     from routes.system import system_bp
+    from routes.sensors import sensors_bp
+    from routes.actuation import actuation_bp
+    from routes.export import export_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(classroom_bp)
@@ -46,6 +57,9 @@ def create_app(config_name=None):
     app.register_blueprint(ml_bp)
     app.register_blueprint(analytics_bp)
     app.register_blueprint(system_bp)
+    app.register_blueprint(sensors_bp)
+    app.register_blueprint(actuation_bp)
+    app.register_blueprint(export_bp)
 
     # Initialize Automation (Admin Reporting)
     setup_automation(app)
@@ -67,45 +81,101 @@ def setup_automation(app):
     import threading
     import time
     from datetime import datetime
-    from services import ReportingService
+    from services import ReportingService, PredictionService
+
+    def run_job(name, job):
+        """Run one scheduled job; a failure is logged and never skips the jobs after it."""
+        try:
+            with app.app_context(), metrics.track_job(name):
+                job()
+        except Exception as e:
+            app.logger.error(f">>> AUTOMATION ERROR: {name}: {e}", exc_info=True)
+
+    def rollup_refresh():
+        # Fold decisions into the analytics rollups; the first pass backfills history.
+        # Request paths only read them (log_decisions folds its own rows)
+        from analytics_engine import refresh_rollups
+        refresh_rollups(db.engine, app.config)
+
+    def snapshot_refresh():
+        # Roll the prediction snapshot window forward and rescore entries left dirty by
+        # bulk imports or a retrained model (timetable writes only score their own rows)
+        summary, error = PredictionService.refresh_snapshots()
+        if error:
+            app.logger.error(f">>> AUTOMATION: Snapshot refresh failed: {error}")
+        else:
+            app.logger.info(f">>> AUTOMATION: Prediction snapshots refreshed {summary}")
+
+    def decision_retention():
+        # Every worker wakes at 3 AM; only the one that claims today's run moves partitions
+        if not CacheService.claim('job:decision_retention', datetime.now().date().toordinal()):
+            return
+        from retention import apply_retention
+        summary = apply_retention(db.engine, app.config)
+        app.logger.info(f">>> AUTOMATION: Decision retention applied {summary}")
+
+    def sensor_retention():
+        if not CacheService.claim('job:sensor_retention', datetime.now().date().toordinal()):
+            return
+        from telemetry import drop_expired_partitions
+        dropped = drop_expired_partitions(db.engine, app.config['SENSOR_RETENTION_DAYS'])
+        if dropped:
+            app.logger.info(f">>> AUTOMATION: Dropped sensor partitions {dropped}")
+
+    def weekend_briefing():
+        ReportingService.trigger_weekend_briefing()
+        app.logger.info(">>> AUTOMATION: Weekend briefing dispatched.")
 
     def run_scheduler():
         while True:
-            try:
-                # Check every hour
-                now = datetime.now()
-                # If Sunday at 9 AM, trigger the briefing
-                if now.weekday() == 6 and now.hour == 9:
-                    with app.app_context():
-                         ReportingService.trigger_weekend_briefing()
-                         app.logger.info(">>> AUTOMATION: Weekend briefing dispatched.")
-                         # Sleep for a bit to avoid double-triggering in the same hour
-                         time.sleep(3600) 
-            except Exception as e:
-                print(f">>> AUTOMATION ERROR: {e}")
+            # Check every hour
+            now = datetime.now()
+            run_job('rollup_refresh', rollup_refresh)
+            run_job('snapshot_refresh', snapshot_refresh)
+            # Nightly at 3 AM, move aged decisions to monthly partitions, archive old months
+            # and drop expired sensor partitions
+            if now.hour == 3:
+                run_job('decision_retention', decision_retention)
+                run_job('sensor_retention', sensor_retention)
+            # If Sunday at 9 AM, trigger the briefing
+            if now.weekday() == 6 and now.hour == 9:
+                run_job('weekend_briefing', weekend_briefing)
+                # Sleep for a bit to avoid double-triggering in the same hour
+                time.sleep(3600)
             time.sleep(3600) # Re-check every hour
 
+    # Tests drive jobs directly; a background thread would share their in-memory database
+    if app.testing:
+        return
     thread = threading.Thread(target=run_scheduler, daemon=True)
     thread.start()
 
+    # Device actuation runs on its own short tick, independent of the hourly scheduler
+    if app.config.get('ACTUATION_ENABLED') and not app.testing:
+        from actuation import start_dispatcher
+        try:
+            start_dispatcher(app)
+        except RuntimeError as e:
+            app.logger.error(f">>> ACTUATION: Not started: {e}")
+
 def configure_logging(app):
-    if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/smart_energy.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('SmartEnergy Backend Startup')
+    log_pipeline.init_app(app)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.logger.info(">>> DATABASE: Using Local SQLite Cache (Offline/Lag Mode)")
+    else:
+        app.logger.info(">>> DATABASE: Connected to Supabase Cloud")
+    app.logger.info('SmartEnergy Backend Startup')
 
 def seed_database(app):
     """Initialize database and seed initial data."""
     with app.app_context():
         try:
             db.create_all()
+            # create_all() never alters existing tables; add newer columns and backfill them
+            added = upgrade_schema(db.engine)
+            if added:
+                app.logger.info(f">>> DATABASE: Upgraded schema, added {', '.join(added)}")
+            CacheService.seed()
             app.logger.info(f"Database connected: {app.config['SQLALCHEMY_DATABASE_URI']}")
             
             # Seed Superior Admin (admin@smart.com - Permanent & Highest Authority)
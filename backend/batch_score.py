@@ -0,0 +1,175 @@
+"""
+Offline batch scoring for large schedule exports.
+
+Scores CSV or Parquet files far beyond the 16MB HTTP limit of
+/api/ml/predict-batch by sharding the input across a process pool. Each
+worker loads the model once and writes its own part file, so an
+interrupted run can be resumed and only missing shards are re-scored.
+A resume is refused when the input file, shard size or format differ from
+the manifest, since shard ids would then describe different rows; add
+--force to discard the earlier output and start over.
+
+Usage:
+    python batch_score.py semester.csv --out scored/ --workers 8
+    python batch_score.py campus.parquet --out scored/ --resume
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+MANIFEST_NAME = '_manifest.json'
+PART_PATTERN = re.compile(r'^part-\d{5}\.(csv|parquet)(\.tmp)?$')
+OUTPUT_COLUMNS = ['day', 'hour', 'predicted_occupancy', 'confidence', 'reasoning', 'recommendation']
+
+_engine = None
+
+def _init_worker(model_path):
+    """Load the model once per worker process."""
+    global _engine
+    import ml_engine
+    if model_path:
+        ml_engine.MODEL_PATH = model_path
+    _engine = ml_engine.MLEngine()
+
+def _score_shard(shard_id, df, out_dir, fmt):
+    scored = _engine.predict_frame(df)
+    for col in ('day', 'hour'):
+        scored[col] = df[col].values if col in df.columns else None
+    scored = scored[OUTPUT_COLUMNS]
+
+    # Write to a temp name and rename so a killed run never leaves a half shard
+    final_path = os.path.join(out_dir, f'part-{shard_id:05d}.{fmt}')
+    tmp_path = final_path + '.tmp'
+    if fmt == 'parquet':
+        scored.to_parquet(tmp_path, index=False)
+    else:
+        scored.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, final_path)
+    return shard_id, len(scored)
+
+def iter_shards(path, shard_rows):
+    """Yield (shard_id, DataFrame) without loading the whole input."""
+    if path.lower().endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet input requires pyarrow (pip install pyarrow)")
+        parquet = pq.ParquetFile(path)
+        for shard_id, batch in enumerate(parquet.iter_batches(batch_size=shard_rows)):
+            yield shard_id, batch.to_pandas()
+    else:
+        for shard_id, chunk in enumerate(pd.read_csv(path, chunksize=shard_rows)):
+            yield shard_id, chunk
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'completed': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def input_identity(args):
+    """What a resumed run must match: the input file (path, size, mtime) and how it is sharded."""
+    stat = os.stat(args.input)
+    return {'input': os.path.abspath(args.input), 'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns, 'shard_rows': args.shard_rows, 'format': args.format}
+
+def resume_mismatch(manifest, identity):
+    """Names of the manifest fields that differ from this run's."""
+    return [key for key, value in identity.items() if manifest.get(key) != value]
+
+def clear_parts(out_dir):
+    """Remove part files and the manifest of an earlier run, so outputs never mix."""
+    for name in os.listdir(out_dir):
+        if PART_PATTERN.match(name) or name == MANIFEST_NAME:
+            os.remove(os.path.join(out_dir, name))
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    identity = input_identity(args)
+    manifest = load_manifest(args.out) if args.resume else {'completed': {}}
+    if args.resume and manifest['completed']:
+        mismatch = resume_mismatch(manifest, identity)
+        if mismatch and not args.force:
+            sys.exit(f"Cannot resume: {', '.join(mismatch)} differ from {os.path.join(args.out, MANIFEST_NAME)}. "
+                     f"Re-run with the original arguments, or add --force to discard it and start over.")
+        if mismatch:
+            manifest = {'completed': {}}
+    if not manifest['completed']:
+        clear_parts(args.out)
+    manifest.update(identity)
+    completed = manifest['completed']
+
+    print(f"\n⚡ --- SmartEnergy Batch Scoring ---\n")
+    print(f"   Input:   {args.input}")
+    print(f"   Output:  {args.out} ({args.format})")
+    print(f"   Workers: {args.workers}, shard size: {args.shard_rows} rows")
+    if completed:
+        print(f"   Resuming: {len(completed)} shards already scored")
+
+    started = time.time()
+    rows_scored = 0
+    skipped_rows = 0
+    in_flight = set()
+    max_in_flight = args.workers * 2  # bounds how many shards sit in memory
+
+    def collect(done):
+        nonlocal rows_scored
+        for future in done:
+            shard_id, count = future.result()
+            completed[str(shard_id)] = count
+            rows_scored += count
+            save_manifest(args.out, manifest)
+            elapsed = time.time() - started
+            print(f"   [OK] shard {shard_id:05d}: {count} rows ({rows_scored / max(elapsed, 1e-6):,.0f} rows/sec)")
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.model,)) as pool:
+        for shard_id, df in iter_shards(args.input, args.shard_rows):
+            part = os.path.join(args.out, f'part-{shard_id:05d}.{args.format}')
+            if str(shard_id) in completed and os.path.exists(part):
+                skipped_rows += completed[str(shard_id)]
+                continue
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(pool.submit(_score_shard, shard_id, df, args.out, args.format))
+        done, _ = wait(in_flight)
+        collect(done)
+
+    elapsed = time.time() - started
+    manifest['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    manifest['rows_per_sec'] = round(rows_scored / max(elapsed, 1e-6), 1)
+    save_manifest(args.out, manifest)
+
+    print(f"\n   Scored {rows_scored:,} rows in {elapsed:.1f}s ({manifest['rows_per_sec']:,} rows/sec)")
+    if skipped_rows:
+        print(f"   Skipped {skipped_rows:,} rows from earlier runs")
+    print("\n--- Batch Scoring Complete ---\n")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Score large schedule files with the occupancy model.')
+    parser.add_argument('input', help='CSV or Parquet file with day, hour, type, attendance columns')
+    parser.add_argument('--out', default='scored', help='Output directory for part files (default: scored/)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output file format')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of scoring processes')
+    parser.add_argument('--shard-rows', type=int, default=100000, help='Rows per shard / part file')
+    parser.add_argument('--model', default=None, help='Path to a model .pkl (default: occupancy_model.pkl)')
+    parser.add_argument('--resume', action='store_true', help='Skip shards already listed in the output manifest')
+    parser.add_argument('--force', action='store_true',
+                        help='With --resume, start over instead of refusing when the input or sharding changed')
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1 @@
+"""Reproducible benchmarks for the backend hot paths (run with `python -m benchmarks.run`)."""
@@ -0,0 +1,156 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+Everything is generated from one seed, so two runs at the same scale load
+identical rows and time the same work. Database rows are written with Core
+executemany batches; the CSV builders produce the upload payloads the bulk
+import routes expect.
+"""
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+BUILDINGS = ['A', 'B', 'C', 'D', 'E']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+HOURS = list(range(8, 18))
+LEVEL_NAMES = ['Low', 'Medium', 'High']
+INSERT_BATCH = 10000
+
+# name -> (classrooms, timetable entries, decisions, attendance history rows, training rows, notifications, import rows)
+SCALES = {
+    'small': dict(classrooms=20, timetable=200, decisions=20000, history=5000,
+                  training=2000, notifications=200, import_rows=200, import_users=5),
+    'medium': dict(classrooms=100, timetable=1000, decisions=200000, history=50000,
+                   training=10000, notifications=1000, import_rows=1000, import_users=10),
+    'large': dict(classrooms=400, timetable=4000, decisions=1000000, history=200000,
+                  training=10000, notifications=5000, import_rows=5000, import_users=20),
+}
+
+def _insert(connection, table, rows):
+    for offset in range(0, len(rows), INSERT_BATCH):
+        connection.execute(table.insert(), rows[offset:offset + INSERT_BATCH])
+
+def _slot(index):
+    """Distinct weekday/hour pairs for the sessions of one room."""
+    day = WEEKDAYS[(index // len(HOURS)) % len(WEEKDAYS)]
+    hour = HOURS[index % len(HOURS)]
+    return day, f'{hour:02d}:00', hour
+
+def populate(engine, classrooms, timetable, decisions, history, notifications, seed=42, days=120, **_):
+    """Load classrooms, timetable, energy decisions, attendance history and notifications."""
+    from models import Classroom, Timetable, EnergyDecision, AttendanceHistory, Notification
+    from timeslots import week_window
+
+    rng = np.random.RandomState(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    rooms = [{
+        'id': i + 1, 'name': f'Room {i + 1:04d}', 'building': BUILDINGS[i % len(BUILDINGS)],
+        'capacity': int(rng.choice([30, 50, 80, 120])), 'num_lights': int(rng.randint(4, 16)),
+        'num_acs': int(rng.randint(1, 4)), 'num_fans': int(rng.randint(2, 8)), 'is_active': True,
+    } for i in range(classrooms)]
+
+    entries = []
+    for i in range(timetable):
+        room = rooms[i % classrooms]
+        day, time_slot, hour = _slot(i // classrooms)
+        start_minute, end_minute = week_window(day, time_slot)
+        entries.append({
+            'id': i + 1, 'classroom_id': room['id'], 'day_of_week': day, 'time_slot': time_slot,
+            'subject': f'Course {i % 97}', 'subject_type': 'lab' if i % 4 == 0 else 'theory',
+            'teacher_name': f'Teacher {i % 150}', 'teacher_email': f'teacher{i % 150}@bench.local',
+            'expected_attendance': float(rng.randint(10, room['capacity'] + 1)),
+            'start_minute': start_minute, 'end_minute': end_minute,
+        })
+
+    # Decision ids grow with their timestamps, as they do in production
+    offsets = np.sort(rng.randint(0, days * 86400, size=decisions))[::-1]
+    levels = rng.randint(0, 3, size=decisions)
+    room_ids = rng.randint(1, classrooms + 1, size=decisions)
+    saved = np.round(rng.gamma(2.0, 0.6, size=decisions), 2)
+    decision_rows = [{
+        'classroom_id': int(room_ids[i]), 'timestamp': now - timedelta(seconds=int(offsets[i])),
+        'predicted_occupancy': LEVEL_NAMES[levels[i]],
+        'lights_action': ('OFF', 'DIM', 'ON')[levels[i]], 'ac_action': ('OFF', 'OFF', 'ON')[levels[i]],
+        'energy_saved_kwh': float(saved[i]),
+    } for i in range(decisions)]
+
+    history_rows = []
+    for i in range(history):
+        entry = entries[rng.randint(len(entries))]
+        history_rows.append({
+            'timetable_id': entry['id'], 'date': (now - timedelta(days=int(rng.randint(0, days)))).date(),
+            'actual_attendance': float(rng.randint(0, int(entry['expected_attendance']) + 1)),
+            'day_of_week': entry['day_of_week'], 'hour': int(entry['time_slot'][:2]),
+            'subject_type': entry['subject_type'], 'expected_attendance': entry['expected_attendance'],
+        })
+
+    notification_rows = [{
+        'type': 'system_update', 'message': f'Benchmark notification {i}',
+        'target_role': ('admin', 'faculty', 'all')[i % 3], 'is_read': bool(i % 2),
+        'created_at': now - timedelta(minutes=i),
+    } for i in range(notifications)]
+
+    with engine.begin() as connection:
+        _insert(connection, Classroom.__table__, rooms)
+        _insert(connection, Timetable.__table__, entries)
+        _insert(connection, EnergyDecision.__table__, decision_rows)
+        _insert(connection, AttendanceHistory.__table__, history_rows)
+        _insert(connection, Notification.__table__, notification_rows)
+
+    # Postgres sequences do not move when ids are supplied explicitly
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            for table in ('classroom', 'timetable'):
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+
+def training_frame(rows, seed=42):
+    """Labelled day/hour/type/attendance rows shaped like an uploaded training CSV."""
+    rng = np.random.RandomState(seed)
+    day = rng.randint(0, 7, size=rows)
+    hour = rng.randint(8, 22, size=rows)
+    busy = (day < 5) & (hour >= 9) & (hour <= 16)
+    attendance = np.where(busy, rng.randint(30, 100, size=rows), rng.randint(0, 40, size=rows))
+    return pd.DataFrame({
+        'day': [WEEKDAYS[d] if d < 5 else ('Saturday', 'Sunday')[d - 5] for d in day],
+        'hour': [f'{h:02d}:00' for h in hour],
+        'type': np.where(rng.rand(rows) < 0.25, 'lab', 'theory'),
+        'attendance': attendance,
+    })
+
+def _csv(frame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False)
+    return buffer.getvalue().encode()
+
+def classroom_csv(rows, tag):
+    return _csv(pd.DataFrame({
+        'name': [f'{tag} Room {i}' for i in range(rows)],
+        'building': [BUILDINGS[i % len(BUILDINGS)] for i in range(rows)],
+        'capacity': [40 + i % 60 for i in range(rows)],
+        'lights': 8, 'acs': 2, 'fans': 4,
+    }))
+
+def timetable_csv(rows, classrooms, tag):
+    slots = [_slot(i) for i in range(rows)]
+    return _csv(pd.DataFrame({
+        'classroom_id': [i % classrooms + 1 for i in range(rows)],
+        'day': [day for day, _, _ in slots],
+        'time': [time_slot for _, time_slot, _ in slots],
+        'subject': [f'{tag} Course {i}' for i in range(rows)],
+        'type': ['lab' if i % 4 == 0 else 'theory' for i in range(rows)],
+        'teacher': [f'Teacher {i % 150}' for i in range(rows)],
+        'email': [f'teacher{i % 150}@bench.local' for i in range(rows)],
+        'attendance': [20 + i % 30 for i in range(rows)],
+    }))
+
+def users_csv(rows, tag):
+    return _csv(pd.DataFrame({
+        'email': [f'{tag}.{i}@import.bench.local' for i in range(rows)],
+        'username': [f'{tag}_{i}' for i in range(rows)],
+        'password': 'bench-password',
+        'role': 'faculty',
+    }))
@@ -0,0 +1,98 @@
+"""
+Import-time budget for the web entry point.
+
+Imports `wsgi` in a fresh interpreter under `python -X importtime` and fails
+when a module that should load lazily (pandas, scikit-learn, joblib, ...) is
+pulled in at import, or when the total import time goes over the budget.
+Worker boot and autoscaling cold starts pay this cost on every process.
+
+Run from backend/:
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 1500 --top 25
+    python -m benchmarks.import_budget --json benchmarks/results/imports.json
+
+Import times vary with the machine and a warm page cache; the best of
+--runs interpreters is compared with the budget.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINT = 'wsgi'
+FORBIDDEN = ('pandas', 'sklearn', 'joblib', 'scipy', 'pyarrow')
+LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Import-time budget for the web entry point')
+    parser.add_argument('--module', default=ENTRY_POINT, help='Module to import (default: wsgi)')
+    parser.add_argument('--budget-ms', type=float, default=2000.0, help='Maximum total import time')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to try; the fastest is used')
+    parser.add_argument('--forbid', action='append', help='Top-level package that must not be imported (repeatable)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to print')
+    parser.add_argument('--json', dest='json_out', help='Also write the report to this file')
+    return parser.parse_args(argv)
+
+def measure(module):
+    """Run one interpreter and return [(name, self_us, cumulative_us, depth)] in import order."""
+    env = dict(os.environ, ACTUATION_ENABLED='false', MAIL_SERVER='', LOG_LEVEL='WARNING', PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+    imports = []
+    for line in result.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+def report(imports, module, budget_ms, forbidden):
+    total_ms = sum(self_us for _, self_us, _, _ in imports) / 1000
+    loaded = {name.split('.')[0] for name, _, _, _ in imports}
+    violations = sorted(loaded & set(forbidden))
+    slowest = sorted(imports, key=lambda i: i[2], reverse=True)
+    return {
+        'module': module,
+        'python': sys.version.split()[0],
+        'total_ms': round(total_ms, 1),
+        'budget_ms': budget_ms,
+        'modules': len(imports),
+        'forbidden_imported': violations,
+        'slowest': [{'name': name, 'cumulative_ms': round(cum / 1000, 1), 'self_ms': round(own / 1000, 1)}
+                    for name, own, cum, _ in slowest],
+        'passed': not violations and total_ms <= budget_ms,
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    forbidden = args.forbid or FORBIDDEN
+    runs = [measure(args.module) for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda imports: sum(i[1] for i in imports))
+    result = report(best, args.module, args.budget_ms, forbidden)
+
+    print(f"import {result['module']}: {result['total_ms']:.0f} ms across {result['modules']} modules "
+          f"(budget {args.budget_ms:.0f} ms, best of {len(runs)})")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for entry in result['slowest'][:args.top]:
+        print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>9.1f}  {entry['name']}")
+
+    if args.json_out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_out)), exist_ok=True)
+        with open(args.json_out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if result['forbidden_imported']:
+        print(f"FAIL: imported at startup: {', '.join(result['forbidden_imported'])}")
+    if result['total_ms'] > args.budget_ms:
+        print(f"FAIL: {result['total_ms']:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    if result['passed']:
+        print('OK')
+    return 0 if result['passed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
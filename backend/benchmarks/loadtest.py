@@ -0,0 +1,326 @@
+"""
+Multi-user load generator modelling real dashboard traffic.
+
+Every virtual user logs in with a JWT and then behaves like an open
+dashboard: it polls /api/dashboard/stats and /api/notifications every
+--poll-interval seconds and refreshes /api/predict every --predict-interval
+seconds, with jitter so users drift apart the way real browsers do. At the
+end of every (compressed) timetable slot, a share of the faculty users submit
+attendance within a short window, reproducing the bursts that follow each
+class.
+
+The report gives throughput, latency percentiles and error rates per endpoint.
+Run it against gunicorn with different --workers counts to size a deployment.
+Attendance submissions write history rows and retrain the model on the
+target, so point it at a scratch environment.
+
+Run from backend/ against a running server:
+    gunicorn --workers 4 --bind 127.0.0.1:5000 wsgi:app
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000 --create-users --faculty 200 --admins 10 --duration 300
+"""
+import ssl
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+PERCENTILES = (50, 90, 95, 99)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartEnergy dashboard load test')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL of the running backend')
+    parser.add_argument('--faculty', type=int, default=50, help='Faculty dashboards')
+    parser.add_argument('--admins', type=int, default=5, help='Admin dashboards')
+    parser.add_argument('--duration', type=float, default=120, help='Seconds of load after ramp-up starts')
+    parser.add_argument('--ramp', type=float, default=10, help='Seconds over which users log in')
+    parser.add_argument('--poll-interval', type=float, default=15, help='Seconds between stats/notification polls')
+    parser.add_argument('--predict-interval', type=float, default=60, help='Seconds between prediction refreshes')
+    parser.add_argument('--slot-seconds', type=float, default=60, help='Length of one timetable slot (compressed time)')
+    parser.add_argument('--burst-fraction', type=float, default=0.3, help='Share of faculty submitting attendance per slot')
+    parser.add_argument('--burst-window', type=float, default=5, help='Seconds over which a burst is spread')
+    parser.add_argument('--user-prefix', default='loadtest', help='Usernames are <prefix>_<role>_<n>')
+    parser.add_argument('--password', default='loadtest-password', help='Password of the load test users')
+    parser.add_argument('--create-users', action='store_true', help='Create missing load test users through the admin API')
+    parser.add_argument('--admin-login', default='admin@smart.com', help='Admin used by --create-users')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='Write the report as JSON to this file')
+    return parser.parse_args(argv)
+
+# --- Recording ----------------------------------------------------------------------
+
+class Recorder:
+    """Latency, status and error tallies per endpoint, shared by all users."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, endpoint, seconds, status, failed):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][str(status)] += 1
+            if failed:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        import numpy as np
+
+        endpoints = {}
+        with self._lock:
+            for endpoint, samples in sorted(self.latencies.items()):
+                ms = np.array(samples) * 1000
+                endpoints[endpoint] = dict({
+                    'requests': len(ms),
+                    'throughput_rps': round(len(ms) / elapsed, 2),
+                    'errors': self.errors[endpoint],
+                    'error_rate': round(self.errors[endpoint] / len(ms), 4),
+                    'mean_ms': round(float(ms.mean()), 2),
+                    'max_ms': round(float(ms.max()), 2),
+                    'statuses': dict(self.statuses[endpoint]),
+                }, **{f'p{p}_ms': round(float(np.percentile(ms, p)), 2) for p in PERCENTILES})
+            total = sum(e['requests'] for e in endpoints.values())
+            errors = sum(e['errors'] for e in endpoints.values())
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'endpoints': endpoints,
+        }
+
+class Session:
+    """One keep-alive connection and JWT per virtual user."""
+    def __init__(self, base_url, recorder, timeout, insecure=False):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.context = ssl._create_unverified_context() if insecure else None
+        self.token = None
+        self.connection = None
+
+    def _connect(self):
+        if self.https:
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def request(self, method, path, endpoint, body=None):
+        """(status, parsed JSON or None); status is 0 when the request never completed."""
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        started = time.perf_counter()
+        status, data = 0, None
+        # A kept-alive connection the server already closed is retried once on a fresh one, as browsers do
+        for attempt in range(2):
+            reused = self.connection is not None
+            try:
+                if self.connection is None:
+                    self.connection = self._connect()
+                self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                raw = response.read()
+                status = response.status
+                if response.getheader('Content-Type', '').startswith('application/json'):
+                    data = json.loads(raw)
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if not reused:
+                    break
+            except (OSError, http.client.HTTPException, ValueError):
+                self.close()
+                break
+        self.recorder.record(endpoint, time.perf_counter() - started, status, status == 0 or status >= 400)
+        return status, data
+
+    def login(self, username, password):
+        status, data = self.request('POST', '/api/login', 'POST /api/login',
+                                    {'username': username, 'password': password})
+        if status == 200 and data and data.get('token'):
+            self.token = data['token']
+            return True
+        return False
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+
+# --- Virtual users ------------------------------------------------------------------
+
+class DashboardUser(threading.Thread):
+    """Polls like an open dashboard; submits attendance when a burst schedules it."""
+    def __init__(self, username, role, args, recorder, stop, rng, timetable_ids):
+        super().__init__(name=username, daemon=True)
+        self.username = username
+        self.role = role
+        self.args = args
+        self.stop = stop
+        self.rng = rng
+        self.timetable_ids = timetable_ids
+        self.session = Session(args.url, recorder, args.timeout, args.insecure)
+        self.wake = threading.Event()
+        self.attendance_due = None
+        self.logged_in = False
+
+    def _jitter(self, interval):
+        return interval * self.rng.uniform(0.8, 1.2)
+
+    def submit_attendance_at(self, when):
+        self.attendance_due = when
+        self.wake.set()
+
+    def run(self):
+        if self.stop.wait(self.rng.uniform(0, self.args.ramp)):
+            return
+        self.logged_in = self.session.login(self.username, self.args.password)
+        if not self.logged_in:
+            return
+
+        now = time.monotonic()
+        next_poll = now
+        next_predict = now + self.rng.uniform(0, self.args.predict_interval)
+        while not self.stop.is_set():
+            now = time.monotonic()
+            if self.attendance_due is not None and now >= self.attendance_due and self.timetable_ids:
+                self.attendance_due = None
+                self.session.request('POST', '/api/timetable/attendance', 'POST /api/timetable/attendance', {
+                    'timetable_id': self.rng.choice(self.timetable_ids),
+                    'actual_attendance': self.rng.randint(0, 100),
+                })
+            if now >= next_poll:
+                self.session.request('GET', '/api/dashboard/stats', 'GET /api/dashboard/stats')
+                self.session.request('GET', '/api/notifications', 'GET /api/notifications')
+                next_poll = now + self._jitter(self.args.poll_interval)
+            if now >= next_predict:
+                self.session.request('GET', '/api/predict', 'GET /api/predict')
+                next_predict = now + self._jitter(self.args.predict_interval)
+
+            deadline = min(next_poll, next_predict, self.attendance_due or float('inf'))
+            self.wake.wait(max(0.0, deadline - time.monotonic()))
+            self.wake.clear()
+        self.session.close()
+
+def run_bursts(faculty, args, stop, rng):
+    """At the end of every slot, schedule attendance submissions for a share of the faculty."""
+    while not stop.wait(args.slot_seconds):
+        active = [user for user in faculty if user.logged_in]
+        count = int(round(len(active) * args.burst_fraction))
+        now = time.monotonic()
+        for user in rng.sample(active, min(count, len(active))):
+            user.submit_attendance_at(now + rng.uniform(0, args.burst_window))
+
+# --- Setup --------------------------------------------------------------------------
+
+def usernames(args):
+    return ([(f'{args.user_prefix}_faculty_{i:04d}', 'faculty') for i in range(args.faculty)] +
+            [(f'{args.user_prefix}_admin_{i:04d}', 'admin') for i in range(args.admins)])
+
+def create_users(args, recorder):
+    """Create (auto-activated) load test users; existing accounts are left alone."""
+    admin = Session(args.url, recorder, args.timeout, args.insecure)
+    if not admin.login(args.admin_login, args.admin_password):
+        sys.exit(f"❌ Could not log in as {args.admin_login} to create users")
+    created = 0
+    for username, role in usernames(args):
+        status, _ = admin.request('POST', '/api/users/create-single', 'setup', {
+            'username': username, 'email': f'{username}@loadtest.local', 'password': args.password,
+            'role': role, 'auto_activate': True,
+        })
+        created += status == 200
+    admin.close()
+    print(f">>> LOADTEST: Created {created} users ({len(usernames(args)) - created} already existed or failed)")
+
+def fetch_timetable_ids(args, recorder):
+    session = Session(args.url, recorder, args.timeout, args.insecure)
+    name, role = next(((n, r) for n, r in usernames(args) if r == 'admin'), usernames(args)[0])
+    if not session.login(name, args.password):
+        sys.exit(f"❌ Could not log in as {name}; run with --create-users first")
+    status, data = session.request('GET', '/api/timetable', 'setup')
+    session.close()
+    return [entry['id'] for entry in data] if status == 200 and isinstance(data, list) else []
+
+def print_report(report):
+    print(f"\n{'endpoint':<36} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for endpoint, e in report['endpoints'].items():
+        print(f"{endpoint:<36} {e['requests']:>7} {e['throughput_rps']:>8.2f} {e['error_rate'] * 100:>5.1f}% "
+              f"{e['p50_ms']:>8.1f} {e['p90_ms']:>8.1f} {e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f} {e['max_ms']:>8.1f}")
+    print(f"\n>>> LOADTEST: {report['requests']} requests in {report['elapsed_s']}s = "
+          f"{report['throughput_rps']} req/s, {report['error_rate'] * 100:.2f}% errors (latencies in ms)")
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    setup = Recorder()
+    if args.create_users:
+        create_users(args, setup)
+    timetable_ids = fetch_timetable_ids(args, setup)
+    if not timetable_ids:
+        print("⚠️  No timetable entries found; attendance bursts are disabled")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    users = [DashboardUser(name, role, args, recorder, stop, random.Random(rng.random()), timetable_ids)
+             for name, role in usernames(args)]
+    faculty = [user for user in users if user.role == 'faculty']
+    bursts = threading.Thread(target=run_bursts, args=(faculty, args, stop, random.Random(rng.random())),
+                              name='attendance-bursts', daemon=True)
+
+    print(f">>> LOADTEST: {len(faculty)} faculty + {len(users) - len(faculty)} admin dashboards "
+          f"against {args.url} for {args.duration:.0f}s")
+    started = time.monotonic()
+    for user in users:
+        user.start()
+    if timetable_ids:
+        bursts.start()
+    try:
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        print("\n>>> LOADTEST: Interrupted, reporting what ran")
+    stop.set()
+    for user in users:
+        user.wake.set()
+    for user in users:
+        user.join(timeout=args.timeout)
+    elapsed = time.monotonic() - started
+
+    report = recorder.report(elapsed)
+    report['logged_in'] = sum(user.logged_in for user in users)
+    report['meta'] = {
+        'timestamp': datetime.utcnow().isoformat(), 'url': args.url, 'faculty': args.faculty,
+        'admins': args.admins, 'duration_s': args.duration, 'ramp_s': args.ramp,
+        'poll_interval_s': args.poll_interval, 'predict_interval_s': args.predict_interval,
+        'slot_seconds': args.slot_seconds, 'burst_fraction': args.burst_fraction,
+        'burst_window_s': args.burst_window,
+    }
+    print_report(report)
+    if report['logged_in'] < len(users):
+        print(f"⚠️  Only {report['logged_in']} of {len(users)} users logged in")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f">>> LOADTEST: Report written to {args.out}")
+    return 1 if report['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
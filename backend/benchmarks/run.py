@@ -0,0 +1,457 @@
+"""
+Benchmark suite for the ML, API and database hot paths.
+
+Builds a synthetic dataset (see datagen.SCALES), then times the model
+(predict, batch scoring, digest and training), the dashboard API routes and
+the bulk imports through the Flask test client, so routing, auth and
+serialization are included. The list endpoints are also measured per
+response shape and Content-Encoding (payload.*, with the body size in
+bytes) and their payloads are serialized with the stdlib and the configured
+JSON provider (json.*). Results are written as JSON; pass a previous
+result file as --baseline to fail the run when a benchmark's median got
+slower than the threshold allows.
+
+Run from backend/:
+    python -m benchmarks.run                                  # small scale, temporary SQLite file
+    python -m benchmarks.run --scale medium --database-url postgresql://localhost/smartenergy_bench
+    python -m benchmarks.run --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.run --only 'api.*' --repeat 10
+
+The database is dropped and recreated, so --database-url must name a
+database with "bench" in its name (or pass --allow-any-database). Model
+files, training history and logs go to a temporary working directory;
+nothing in the checkout is modified.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+BASE_URL = 'https://localhost'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartEnergy benchmark suite')
+    parser.add_argument('--scale', default='small', help='Dataset size: small, medium or large')
+    for name in ('classrooms', 'timetable', 'decisions', 'history', 'training', 'notifications', 'import_rows', 'import_users'):
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name, help=f'Override the scale\'s {name} count')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='SQLAlchemy URL of a scratch database (default: temporary SQLite file)')
+    parser.add_argument('--allow-any-database', action='store_true', help='Skip the "bench" database name check')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before measuring')
+    parser.add_argument('--only', action='append', help='Glob of benchmark names to run (repeatable)')
+    parser.add_argument('--out', help='Result file (default: benchmarks/results/<time>-<db>-<scale>.json)')
+    parser.add_argument('--baseline', help='Result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed median slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--noise-floor-ms', type=float, default=1.0, help='Ignore slowdowns smaller than this')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep the temporary working directory')
+    args = parser.parse_args(argv)
+
+    from benchmarks.datagen import SCALES
+    if args.scale not in SCALES:
+        parser.error(f"--scale must be one of {', '.join(SCALES)}")
+    args.sizes = dict(SCALES[args.scale])
+    for name in args.sizes:
+        if getattr(args, name) is not None:
+            args.sizes[name] = getattr(args, name)
+    if args.database_url and not args.allow_any_database:
+        database = args.database_url.rsplit('/', 1)[-1].split('?')[0]
+        if 'bench' not in database:
+            parser.error(f"refusing to drop database '{database}': its name must contain 'bench' (or pass --allow-any-database)")
+    return args
+
+# --- Measurement ------------------------------------------------------------------
+
+def summarize(seconds, **extra):
+    import numpy as np
+    ms = np.array(seconds) * 1000
+    return dict({
+        'runs': len(ms),
+        'min_ms': round(float(ms.min()), 3),
+        'median_ms': round(float(np.median(ms)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }, **extra)
+
+def measure(fn, repeat, warmup, setup=None):
+    """Seconds per call of `fn`; `setup` runs untimed before every call."""
+    timings = []
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed)
+    return timings
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.benchmarks = []
+
+    def add(self, name, fn, setup=None, repeat=None, **extra):
+        self.benchmarks.append((name, fn, setup, repeat, extra))
+
+    def selected(self, name):
+        return not self.args.only or any(fnmatch.fnmatch(name, pattern) for pattern in self.args.only)
+
+    def run(self):
+        results = {}
+        for name, fn, setup, repeat, extra in self.benchmarks:
+            if not self.selected(name):
+                continue
+            print(f">>> BENCH: {name} ...", end=' ', flush=True)
+            timings = measure(fn, repeat or self.args.repeat, self.args.warmup, setup)
+            results[name] = summarize(timings, **extra)
+            print(f"median {results[name]['median_ms']:.2f} ms")
+        return results
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+# --- Environment ------------------------------------------------------------------
+
+def prepare_workdir(args):
+    """Temporary cwd holding the model, training history and logs for this run."""
+    workdir = tempfile.mkdtemp(prefix='smartenergy-bench-')
+    model = os.path.join(BACKEND_DIR, 'occupancy_model.pkl')
+    if os.path.exists(model):
+        shutil.copy(model, workdir)
+    os.makedirs(os.path.join(workdir, 'data'))
+
+    # Benchmarks never start device dispatch or reach a mail server
+    os.environ['ACTUATION_ENABLED'] = 'false'
+    os.environ['MAIL_SERVER'] = ''
+    # Only warnings reach the console, so progress lines stay readable
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return workdir
+
+def build_app(args, workdir):
+    import config
+    config.TestingConfig.SQLALCHEMY_DATABASE_URI = args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    config.TestingConfig.UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+    config.TestingConfig.PROFILE_DIR = os.path.join(workdir, 'logs', 'profiles')
+    config.TestingConfig.ENERGY_ARCHIVE_DIR = os.path.join(workdir, 'archive')
+
+    import ml_engine
+    ml_engine.MODEL_PATH = os.path.join(workdir, 'occupancy_model.pkl')
+    ml_engine.MASTER_HISTORY_PATH = os.path.join(workdir, 'data', 'processed_history.csv')
+    ml_engine.MODEL_CACHE_DIR = os.path.join(workdir, 'data', 'model_cache')
+    ml_engine.DIGEST_REGISTRY_PATH = os.path.join(workdir, 'data', 'digested_uploads.json')
+    ml_engine.INGEST_PROGRESS_DIR = os.path.join(workdir, 'data', 'ingest_progress')
+
+    from app import create_app
+    return create_app('testing')
+
+def seed(app, args):
+    """Fresh schema, synthetic rows and one admin plus one faculty token."""
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+    from services import PasswordService
+    from security import identity_claims
+    from benchmarks import datagen
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        datagen.populate(db.engine, seed=args.seed, **args.sizes)
+        # The scheduler folds decisions into the analytics rollups in production; do it up front here
+        from analytics_engine import refresh_rollups
+        refresh_rollups(db.engine, app.config)
+        print(f">>> BENCH: Loaded {args.sizes} in {time.perf_counter() - started:.1f}s")
+
+        password = PasswordService.hash_password('bench-password')
+        users = [User(username=role, email=f'{role}@bench.local', password_hash=password,
+                      role=role, is_active_account=True) for role in ('admin', 'faculty')]
+        db.session.add_all(users)
+        db.session.commit()
+        return {u.role: {'Authorization': f'Bearer {create_access_token(identity=str(u.id), additional_claims=identity_claims(u))}'}
+                for u in users}
+
+def metadata(args, app):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    from models import db
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'database': dialect,
+        'scale': args.scale,
+        'sizes': args.sizes,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'warmup': args.warmup,
+    }
+
+# --- Benchmarks -------------------------------------------------------------------
+
+def register_ml(suite, app, args):
+    import ml_engine
+    from benchmarks import datagen
+
+    ml = ml_engine.MLEngine()
+    training = datagen.training_frame(args.sizes['training'], args.seed)
+    history = datagen.training_frame(min(args.sizes['history'], ml_engine.HISTORY_LIMIT), args.seed + 1)
+    history_csv = os.path.join(os.getcwd(), 'data', 'base_history.csv')
+    ml._preprocess_dataframe(history).to_csv(history_csv, index=False)
+
+    def reset_history():
+        shutil.copyfile(history_csv, ml_engine.MASTER_HISTORY_PATH)
+        shutil.rmtree(ml_engine.MODEL_CACHE_DIR, ignore_errors=True)
+        if os.path.exists(ml_engine.DIGEST_REGISTRY_PATH):
+            os.remove(ml_engine.DIGEST_REGISTRY_PATH)
+
+    def clear_model_cache():
+        shutil.rmtree(ml_engine.MODEL_CACHE_DIR, ignore_errors=True)
+
+    reset_history()
+    ml.train_from_history()
+    batch_csv = training.to_csv(index=False).encode()
+
+    suite.add('ml.model_load', ml_engine.MLEngine, repeat=args.repeat * 4)
+    suite.add('ml.predict', lambda: ml.predict('Monday', '10:00', 'theory', 45), repeat=args.repeat * 20)
+    suite.add('ml.predict_frame', lambda: ml.predict_frame(training), rows=len(training))
+    suite.add('ml.digest_and_train', lambda: ml.digest_and_train(training), setup=reset_history,
+              rows=len(training))
+    suite.add('ml.train_from_history', ml.train_from_history, setup=clear_model_cache,
+              rows=len(history))
+    suite.add('ml.train_from_history.cached', ml.train_from_history, rows=len(history))
+
+    client = app.test_client()
+    return client, batch_csv
+
+def register_api(suite, app, args, tokens, client, batch_csv):
+    import io
+
+    def get(path, role):
+        return lambda: _check(client.get(BASE_URL + path, headers=tokens[role]))
+
+    def post_csv(path, role, payload, filename='upload.csv'):
+        return lambda: _check(client.post(BASE_URL + path, headers=tokens[role],
+                                          data={'file': (io.BytesIO(payload), filename)},
+                                          content_type='multipart/form-data'))
+
+    suite.add('api.predict', get('/api/predict', 'admin'), entries=args.sizes['timetable'])
+    suite.add('api.predict_batch', post_csv('/api/ml/predict-batch', 'admin', batch_csv),
+              rows=args.sizes['training'])
+    suite.add('api.dashboard_stats.admin', get('/api/dashboard/stats', 'admin'), decisions=args.sizes['decisions'])
+    suite.add('api.dashboard_stats.faculty', get('/api/dashboard/stats', 'faculty'), decisions=args.sizes['decisions'])
+    suite.add('api.analytics_series', get('/api/analytics/series?grain=day&group_by=building', 'admin'))
+    suite.add('api.notifications.admin', get('/api/notifications', 'admin'), notifications=args.sizes['notifications'])
+    suite.add('api.notifications.faculty', get('/api/notifications', 'faculty'), notifications=args.sizes['notifications'])
+
+def register_payloads(suite, app, args, tokens, client, batch_csv):
+    """Size and time of the list endpoints per shape and encoding, plus serialization alone."""
+    import io
+    from flask.json.provider import DefaultJSONProvider
+    import compression
+
+    endpoints = {
+        'timetable': ('GET', '/api/timetable', args.sizes['timetable']),
+        'users': ('GET', '/api/users', None),
+        'notifications': ('GET', '/api/notifications', args.sizes['notifications']),
+        'predict_batch': ('POST', '/api/ml/predict-batch', args.sizes['training']),
+    }
+    encodings = ('identity',) + compression.available_encodings()
+    providers = {'stdlib': DefaultJSONProvider(app)}
+    if type(app.json) is not DefaultJSONProvider:
+        providers[app.config.get('JSON_PROVIDER', 'custom')] = app.json
+
+    def call(method, path, encoding):
+        headers = dict(tokens['admin'], **{'Accept-Encoding': encoding})
+        if method == 'POST':
+            return lambda: _check(client.post(BASE_URL + path, headers=headers,
+                                              data={'file': (io.BytesIO(batch_csv), 'upload.csv')},
+                                              content_type='multipart/form-data'))
+        return lambda: _check(client.get(BASE_URL + path, headers=headers))
+
+    for endpoint, (method, path, rows) in endpoints.items():
+        for shape in ('records', 'columns'):
+            shaped_path = path if shape == 'records' else f'{path}?shape=columns'
+            for encoding in encodings:
+                name = f'payload.{endpoint}.{shape}.{encoding}'
+                if not suite.selected(name):
+                    continue
+                fn = call(method, shaped_path, encoding)
+                response = fn()
+                suite.add(name, fn, bytes=len(response.data), rows=rows,
+                          content_encoding=response.headers.get('Content-Encoding', 'identity'))
+
+            payload = None
+            for provider_name, provider in providers.items():
+                name = f'json.{endpoint}.{shape}.{provider_name}'
+                if not suite.selected(name):
+                    continue
+                if payload is None:
+                    payload = call(method, shaped_path, 'identity')().get_json()
+                with app.app_context():
+                    size = len(provider.dumps(payload).encode())
+                suite.add(name, lambda provider=provider, payload=payload: provider.dumps(payload),
+                          repeat=args.repeat * 10, bytes=size, rows=rows)
+
+def print_payloads(results):
+    """Body size per shape and encoding against records/identity, and provider speedups."""
+    sizes = {name: r for name, r in results.items() if name.startswith('payload.')}
+    if sizes:
+        print(f"\n{'payload':<42} {'bytes':>10} {'vs plain':>9} {'median':>12}")
+        for name, result in sizes.items():
+            endpoint = name.split('.')[1]
+            plain = results.get(f'payload.{endpoint}.records.identity', {}).get('bytes')
+            ratio = f"{result['bytes'] / plain:.1%}" if plain else '-'
+            print(f"{name:<42} {result['bytes']:>10} {ratio:>9} {result['median_ms']:>9.2f} ms")
+
+    timings = {name: r for name, r in results.items() if name.startswith('json.') and not name.endswith('.stdlib')}
+    if timings:
+        print(f"\n{'serialization':<42} {'stdlib':>12} {'provider':>12} {'speedup':>8}")
+        for name, result in timings.items():
+            stdlib = results.get(name.rsplit('.', 1)[0] + '.stdlib')
+            if stdlib:
+                speedup = stdlib['median_ms'] / result['median_ms'] if result['median_ms'] else float('inf')
+                print(f"{name:<42} {stdlib['median_ms']:>9.2f} ms {result['median_ms']:>9.2f} ms {speedup:>7.1f}x")
+
+def register_imports(suite, app, args, tokens, client):
+    import io
+    from models import db, Classroom, Timetable, PredictionSnapshot, User, Notification
+    from benchmarks import datagen
+
+    rows, users = args.sizes['import_rows'], args.sizes['import_users']
+    payloads = {
+        'classrooms': datagen.classroom_csv(rows, 'Import'),
+        'timetable': datagen.timetable_csv(rows, args.sizes['classrooms'], 'Import'),
+        'users': datagen.users_csv(users, 'import'),
+    }
+
+    def remove_imported():
+        """Undo the previous import so every run inserts the same rows."""
+        with app.app_context():
+            imported = db.session.query(Timetable.id).filter(Timetable.subject.like('Import Course%'))
+            PredictionSnapshot.query.filter(PredictionSnapshot.timetable_id.in_(imported.scalar_subquery())) \
+                .delete(synchronize_session=False)
+            Timetable.query.filter(Timetable.subject.like('Import Course%')).delete(synchronize_session=False)
+            Classroom.query.filter(Classroom.name.like('Import Room%')).delete(synchronize_session=False)
+            User.query.filter(User.email.like('%@import.bench.local')).delete(synchronize_session=False)
+            Notification.query.filter(Notification.type == 'system_update', Notification.message.like('Bulk%')) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+
+    def upload(path, payload):
+        return lambda: _check(client.post(BASE_URL + path, headers=tokens['admin'],
+                                          data={'file': (io.BytesIO(payload), 'import.csv')},
+                                          content_type='multipart/form-data'))
+
+    suite.add('api.import.classrooms', upload('/api/classrooms/bulk-import', payloads['classrooms']),
+              setup=remove_imported, rows=rows)
+    suite.add('api.import.timetable', upload('/api/timetable/bulk-import?on_conflict=flag', payloads['timetable']),
+              setup=remove_imported, rows=rows)
+    # bcrypt dominates: keep the row count and repeats low
+    suite.add('api.import.users', upload('/api/users/bulk-import', payloads['users']),
+              setup=remove_imported, repeat=max(1, args.repeat // 2), rows=users)
+
+# --- Baseline comparison ----------------------------------------------------------
+
+def compare(results, baseline, threshold, noise_floor_ms):
+    """Per-benchmark verdicts against a baseline result file. Returns (rows, regressions)."""
+    rows, regressions = [], []
+    previous = baseline.get('results', {})
+    for name, current in results.items():
+        before = previous.get(name)
+        if before is None:
+            rows.append((name, None, current['median_ms'], None, 'new'))
+            continue
+        ratio = current['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        slower_by = current['median_ms'] - before['median_ms']
+        if ratio > 1 + threshold and slower_by > noise_floor_ms:
+            verdict = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = 'ok'
+        rows.append((name, before['median_ms'], current['median_ms'], ratio, verdict))
+    return rows, regressions
+
+def print_comparison(rows):
+    print(f"\n{'benchmark':<34} {'baseline':>12} {'current':>12} {'change':>9}  verdict")
+    for name, before, after, ratio, verdict in rows:
+        before_text = f'{before:.2f} ms' if before is not None else '-'
+        change = f'{(ratio - 1) * 100:+.1f}%' if ratio is not None else '-'
+        print(f"{name:<34} {before_text:>12} {after:>9.2f} ms {change:>9}  {verdict}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    cwd = os.getcwd()
+    workdir = prepare_workdir(args)
+    try:
+        app = build_app(args, workdir)
+        tokens = seed(app, args)
+        meta = metadata(args, app)
+
+        suite = Suite(args)
+        with app.app_context():
+            client, batch_csv = register_ml(suite, app, args)
+        register_api(suite, app, args, tokens, client, batch_csv)
+        register_payloads(suite, app, args, tokens, client, batch_csv)
+        register_imports(suite, app, args, tokens, client)
+        results = suite.run()
+    finally:
+        os.chdir(cwd)
+        if args.keep_workdir:
+            print(f">>> BENCH: Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'meta': meta, 'results': results}
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{meta['database']}-{args.scale}.json")
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_payloads(results)
+    print(f"\n>>> BENCH: Results written to {out}")
+
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for key in ('database', 'scale', 'sizes'):
+        if baseline.get('meta', {}).get(key) != meta[key]:
+            print(f"⚠️  Baseline {key} differs ({baseline.get('meta', {}).get(key)} vs {meta[key]}); timings may not be comparable")
+    rows, regressions = compare(results, baseline, args.threshold, args.noise_floor_ms)
+    print_comparison(rows)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+JSON, CSV and text bodies of at least COMPRESS_MIN_SIZE bytes are sent
+with brotli (when the brotli package is installed and the client accepts
+`br`) or gzip. Streamed and file responses, and bodies that already carry a
+Content-Encoding, are left alone. Encoded bodies are cached per process
+when the response has a strong ETag, so a polled endpoint served by
+CacheService.cached_json compresses each version once rather than on
+every request.
+
+An encoded body is a different representation, so its ETag gets the
+encoding as a suffix (`"timetable.records-42-gzip"`); etag_variants() lets
+conditional requests match either form.
+"""
+import gzip
+import zlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html',
+    'text/css', 'application/javascript', 'image/svg+xml',
+}
+SKIP_STATUSES = {204, 206, 304}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def etag_variants(etag):
+    return [etag] + [f'{etag}-{encoding}' for encoding in available_encodings()]
+
+def encode(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+def _cached_encode(data, encoding, etag, cache_size, **levels):
+    if not etag or not cache_size:
+        return encode(data, encoding, **levels)
+    # Length and checksum guard against a route reusing an ETag for a different body
+    key = (etag, encoding, len(data), zlib.crc32(data))
+    with _cache_lock:
+        encoded = _cache.get(key)
+        if encoded is not None:
+            _cache.move_to_end(key)
+            return encoded
+    encoded = encode(data, encoding, **levels)
+    with _cache_lock:
+        _cache[key] = encoded
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+    return encoded
+
+def init_app(app):
+    """Compress eligible responses. Register before other after_request hooks so this one runs last."""
+    from flask import request
+
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    cache_size = app.config.get('COMPRESS_CACHE_SIZE', 64)
+    levels = {
+        'gzip_level': app.config.get('COMPRESS_GZIP_LEVEL', 6),
+        'brotli_quality': app.config.get('COMPRESS_BROTLI_QUALITY', 5),
+    }
+
+    @app.after_request
+    def _compress(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code in SKIP_STATUSES
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        encoded = _cached_encode(data, encoding, None if weak else etag, cache_size, **levels)
+        if len(encoded) >= len(data):
+            return response
+        response.set_data(encoded)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak=weak)
+        return response
@@ -1,4 +1,5 @@
 import os
+import json
 import socket
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -31,19 +32,23 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'fyp-secret-key')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', os.getenv('SECRET_KEY', 'fyp-jwt-secret-key'))
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Seconds a worker may serve a cached role/username before re-reading the user
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 60))
+    # Rendered bodies CacheService keeps per worker (least recently used are evicted)
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+    # Longest range /api/analytics/series accepts
+    ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', 400))
     
     # Smart Database Selector
     DATABASE_URL = os.getenv('DATABASE_URL')
     
-    # Explicitly check connectivity for Supabase
+    # Explicitly check connectivity for Supabase (create_app logs which one was picked)
     if DATABASE_URL and is_backend_online(DATABASE_URL):
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
-        print(">>> DATABASE: Connected to Supabase Cloud")
     else:
         # Absolute path for instance folder to avoid confusion
         basedir = os.path.abspath(os.path.dirname(__file__))
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'instance', 'smart_classroom.db')
-        print(">>> DATABASE: Using Local SQLite Cache (Offline/Lag Mode)")
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
@@ -57,6 +62,98 @@ class Config:
     # Uploads
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB limit
+    # /api/ml/upload-train streams in chunks, so it can take full semester exports
+    INGEST_MAX_CONTENT_LENGTH = int(os.getenv('INGEST_MAX_CONTENT_LENGTH', 4 * 1024 * 1024 * 1024))  # 4GB
+
+    # HVAC pre-conditioning: default room thermal response and scheduling policy
+    HVAC_RAMP_MINUTES = int(os.getenv('HVAC_RAMP_MINUTES', 20))
+    HVAC_COAST_MINUTES = int(os.getenv('HVAC_COAST_MINUTES', 10))
+    HVAC_MIN_OFF_MINUTES = int(os.getenv('HVAC_MIN_OFF_MINUTES', 15))
+    HVAC_AC_PROBABILITY = float(os.getenv('HVAC_AC_PROBABILITY', 0.4))
+    HVAC_STEP_MINUTES = 5
+
+    # Energy accounting: campus-wide tariff and grid emission factor, with per-building
+    # overrides as JSON, e.g. {"Science": {"tariff": 0.21, "co2_kg": 0.42}}
+    ENERGY_TARIFF_PER_KWH = float(os.getenv('ENERGY_TARIFF_PER_KWH', 0.15))
+    CO2_KG_PER_KWH = float(os.getenv('CO2_KG_PER_KWH', 0.5))
+    BUILDING_ENERGY_FACTORS = json.loads(os.getenv('BUILDING_ENERGY_FACTORS', '{}'))
+
+    # Sensor telemetry: shared key for devices (when set it is the only credential accepted;
+    # when unset a JWT is required) and write buffer sizing
+    SENSOR_INGEST_KEY = os.getenv('SENSOR_INGEST_KEY')
+    SENSOR_MAX_BATCH = int(os.getenv('SENSOR_MAX_BATCH', 10000))
+    SENSOR_BUFFER_MAX = int(os.getenv('SENSOR_BUFFER_MAX', 50000))
+    SENSOR_FLUSH_ROWS = int(os.getenv('SENSOR_FLUSH_ROWS', 2000))
+    SENSOR_FLUSH_INTERVAL = float(os.getenv('SENSOR_FLUSH_INTERVAL', 0.5))
+    # Readings older than SENSOR_MAX_AGE or ahead of the server clock by more than
+    # SENSOR_MAX_SKEW (seconds) are rejected; day partitions past SENSOR_RETENTION_DAYS are dropped
+    SENSOR_MAX_AGE = int(os.getenv('SENSOR_MAX_AGE', 7 * 86400))
+    SENSOR_MAX_SKEW = int(os.getenv('SENSOR_MAX_SKEW', 300))
+    SENSOR_RETENTION_DAYS = int(os.getenv('SENSOR_RETENTION_DAYS', 90))
+
+    # Energy decision retention: days kept in the hot table, months kept in monthly
+    # partitions before they are archived to compressed columnar files
+    ENERGY_HOT_DAYS = int(os.getenv('ENERGY_HOT_DAYS', 90))
+    ENERGY_ARCHIVE_AFTER_MONTHS = int(os.getenv('ENERGY_ARCHIVE_AFTER_MONTHS', 12))
+    ENERGY_ARCHIVE_DIR = os.getenv('ENERGY_ARCHIVE_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', 'archive'))
+
+    # Bulk export: rows fetched per server-side cursor batch and encoded per chunk
+    EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 5000))
+
+    # Logging: records are queued and written by a background thread. LOG_FILE may contain
+    # {pid} so each gunicorn worker rotates its own file; LOG_FORMAT is json or text
+    # (default: text when DEBUG, json otherwise). LOG_RATE_LIMIT records per call site per window
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FILE = os.getenv('LOG_FILE', 'logs/smart_energy.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 10))
+    LOG_FORMAT = os.getenv('LOG_FORMAT')
+    LOG_QUEUE_SIZE = 10000
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))
+    LOG_RATE_WINDOW = 60
+    LOG_ACCESS = os.getenv('LOG_ACCESS', 'true').lower() == 'true'
+
+    # Metrics: /metrics in Prometheus text format. METRICS_DIR shares values between
+    # gunicorn workers (gunicorn.conf.py sets it); METRICS_TOKEN, if set, is required as a Bearer token
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 1.0))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Request profiling: admins send X-Profile to profile one request; PROFILE_SAMPLE_RATE profiles
+    # a random share of all requests. Profiles land in PROFILE_DIR (newest PROFILE_KEEP kept)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+    PROFILE_HEADER = 'X-Profile'
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profiles')
+    PROFILE_KEEP = 200
+    PROFILE_N_PLUS_ONE_THRESHOLD = 5
+
+    # Response encoding: JSON_PROVIDER is orjson (falls back to the stdlib when missing) or stdlib.
+    # Bodies of COMPRESS_MIN_SIZE bytes or more are gzip/brotli compressed when the client accepts it
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson').lower()
+    JSON_SORT_KEYS = True
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+    COMPRESS_CACHE_SIZE = 64
+
+    # Device actuation: transport (inprocess | mqtt), delivery pacing and retry policy. Off unless
+    # enabled; the inprocess simulator acks every command, so outside development it must be chosen explicitly
+    ACTUATION_ENABLED = os.getenv('ACTUATION_ENABLED', 'false').lower() == 'true'
+    ACTUATION_TRANSPORT = os.getenv('ACTUATION_TRANSPORT')
+    ACTUATION_TOPIC_PREFIX = os.getenv('ACTUATION_TOPIC_PREFIX', 'smartenergy')
+    MQTT_HOST = os.getenv('MQTT_HOST', 'localhost')
+    MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
+    ACTUATION_TICK_SECONDS = float(os.getenv('ACTUATION_TICK_SECONDS', 1.0))
+    ACTUATION_MAX_BATCH = int(os.getenv('ACTUATION_MAX_BATCH', 500))
+    ACTUATION_MAX_MESSAGES_PER_SEC = float(os.getenv('ACTUATION_MAX_MESSAGES_PER_SEC', 20))
+    ACTUATION_ACK_TIMEOUT = float(os.getenv('ACTUATION_ACK_TIMEOUT', 10))
+    ACTUATION_MAX_ATTEMPTS = int(os.getenv('ACTUATION_MAX_ATTEMPTS', 5))
+    ACTUATION_RETRY_BASE = float(os.getenv('ACTUATION_RETRY_BASE', 2))
+    ACTUATION_SIM_FAILURE_RATE = float(os.getenv('ACTUATION_SIM_FAILURE_RATE', 0.0))
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -68,6 +165,7 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     DEBUG = False
+    LOG_FILE = None
 
 # Mapping for factory pattern
 config_by_name = {
@@ -0,0 +1,106 @@
+"""
+Timetable conflict detection.
+
+Checks candidate sessions (a single insert or a whole bulk import) against
+each other and against what is already scheduled: double-booked rooms,
+attendance above room capacity, unknown rooms and unparseable slots. Every
+room is swept once over its sessions sorted by start time, so the whole
+batch is validated in O(n log n + conflicts).
+"""
+import heapq
+from timeslots import format_minute
+
+REJECT = 'reject'
+FLAG = 'flag'
+CONFLICT_MODES = (REJECT, FLAG)
+
+def _describe(session):
+    if session.get('row') is not None:
+        return f"row {session['row']}"
+    if session.get('timetable_id') is not None:
+        day, start = format_minute(session['start'])
+        return f"'{session.get('subject')}' ({day} {start}, ID {session['timetable_id']})"
+    return 'the new entry'
+
+def find_conflicts(candidates, existing, capacities):
+    """Return every conflict involving at least one candidate.
+
+    candidates: dicts with ref, row, classroom_id, start, end, attendance, subject
+    existing:   dicts with timetable_id, classroom_id, start, end, subject
+    capacities: classroom_id -> capacity for every known (active) room
+    """
+    conflicts = []
+    by_room = {}
+
+    for c in candidates:
+        if c['classroom_id'] not in capacities:
+            conflicts.append({'type': 'unknown_classroom', 'ref': c['ref'], 'row': c.get('row'),
+                              'classroom_id': c['classroom_id'],
+                              'message': f"Classroom ID {c['classroom_id']} not found"})
+            continue
+        if c['start'] is None:
+            conflicts.append({'type': 'invalid_slot', 'ref': c['ref'], 'row': c.get('row'),
+                              'classroom_id': c['classroom_id'],
+                              'message': 'Unrecognised day or time slot'})
+            continue
+        capacity = capacities[c['classroom_id']]
+        if c.get('attendance') is not None and capacity is not None and c['attendance'] > capacity:
+            conflicts.append({'type': 'over_capacity', 'ref': c['ref'], 'row': c.get('row'),
+                              'classroom_id': c['classroom_id'],
+                              'message': f"Expected attendance {c['attendance']:g} exceeds room capacity {capacity}"})
+        by_room.setdefault(c['classroom_id'], []).append(dict(c, candidate=True))
+
+    for s in existing:
+        if s['classroom_id'] in by_room and s['start'] is not None:
+            by_room[s['classroom_id']].append(dict(s, candidate=False))
+
+    # Per-room sweep: a min-heap of active sessions keyed by end time
+    for room_id, sessions in by_room.items():
+        sessions.sort(key=lambda s: (s['start'], s['end']))
+        active = []
+        for order, s in enumerate(sessions):
+            while active and active[0][0] <= s['start']:
+                heapq.heappop(active)
+            for _, _, other in active:
+                if not (s['candidate'] or other['candidate']):
+                    continue  # pre-existing double booking, not introduced by this write
+                day, start = format_minute(max(s['start'], other['start']))
+                first, second = (other, s) if other['candidate'] and not s['candidate'] else (s, other)
+                conflicts.append({
+                    'type': 'overlap', 'ref': first['ref'], 'row': first.get('row'), 'classroom_id': room_id,
+                    'other_ref': second.get('ref'), 'other_row': second.get('row'),
+                    'other_timetable_id': second.get('timetable_id'),
+                    'message': f"Room double-booked on {day} from {start}: {_describe(first)} overlaps {_describe(second)}"
+                })
+            heapq.heappush(active, (s['end'], order, s))
+
+    return conflicts
+
+def rejected_refs(conflicts):
+    """Candidates to drop in reject mode.
+
+    Anything clashing with the existing schedule or failing validation is
+    dropped; for two new rows that clash, the later row loses.
+    """
+    rejected = set()
+    for c in conflicts:
+        if c['type'] != 'overlap' or c.get('other_timetable_id') is not None:
+            rejected.add(c['ref'])
+    for c in conflicts:
+        if c['type'] == 'overlap' and c.get('other_timetable_id') is None:
+            if c['ref'] not in rejected and c['other_ref'] not in rejected:
+                rejected.add(max(c['ref'], c['other_ref']))
+    return rejected
+
+def flags_by_ref(conflicts):
+    """ref -> comma-separated conflict types, for flag mode."""
+    flags = {}
+    for c in conflicts:
+        for ref in (c['ref'], c.get('other_ref')):
+            if ref is not None:
+                flags.setdefault(ref, set()).add(c['type'])
+    return {ref: ','.join(sorted(types)) for ref, types in flags.items()}
+
+def public_conflicts(conflicts):
+    """Strip internal refs before returning conflicts to API clients."""
+    return [{k: v for k, v in c.items() if k not in ('ref', 'other_ref') and v is not None} for c in conflicts]
@@ -0,0 +1,194 @@
+"""
+Room consolidation optimizer.
+
+For every weekly time slot, proposes moving sessions into rooms whose
+equipment draws less power, and packing them into fewer buildings so whole
+buildings can stay dark. A session must still fit its predicted headcount
+and the target room must be free for the whole slot. Only proposals are
+returned; nothing in the timetable is changed.
+
+The default solver is a vectorized best-fit-decreasing heuristic. Small
+slots (few buildings and rooms) can instead be solved exactly by
+enumerating building subsets and solving each as a min-cost assignment.
+"""
+import itertools
+import numpy as np
+
+from energy_engine import room_power_kw
+from timeslots import week_window, format_minute
+
+# Corridors, plant rooms and AHUs that run whenever any room in a building is in use
+BUILDING_BASE_KW = 3.0
+
+# Headcount ceiling implied by a predicted level (labels: <30, 30-60, >60)
+LEVEL_HEADCOUNT_CAP = {0: 30, 1: 60, 2: None}
+
+EXACT_MAX_BUILDINGS = 8
+EXACT_MAX_ROOMS = 200
+
+def predicted_headcount(expected_attendance, level_idx):
+    cap = LEVEL_HEADCOUNT_CAP.get(level_idx)
+    expected = float(expected_attendance or 0)
+    return expected if cap is None else min(expected, cap)
+
+class ConsolidationProblem:
+    """Arrays describing rooms and sessions; indexes are positions, not DB ids."""
+    def __init__(self, rooms, sessions):
+        self.room_ids = np.array([r['id'] for r in rooms])
+        self.room_names = [r['name'] for r in rooms]
+        self.capacity = np.array([r['capacity'] or 0 for r in rooms], dtype=float)
+        buildings = sorted({r['building'] or '' for r in rooms})
+        self.building_names = buildings
+        self.building = np.array([buildings.index(r['building'] or '') for r in rooms])
+        self.power_kw = room_power_kw([r['lights'] for r in rooms], [r['acs'] for r in rooms], [r['fans'] for r in rooms])
+
+        position = {room_id: i for i, room_id in enumerate(self.room_ids)}
+        sessions = [s for s in sessions if s['classroom_id'] in position and s['start'] is not None]
+        self.session_ids = np.array([s['timetable_id'] for s in sessions])
+        self.subjects = [s['subject'] for s in sessions]
+        self.room = np.array([position[s['classroom_id']] for s in sessions], dtype=int)
+        self.start = np.array([s['start'] for s in sessions], dtype=int)
+        self.end = np.array([s['end'] for s in sessions], dtype=int)
+        self.level = np.array([s['level'] for s in sessions], dtype=int)
+        self.headcount = np.array([s['headcount'] for s in sessions], dtype=float)
+
+    def slot_cost(self, members, rooms):
+        """kWh for running `members` in `rooms` for one slot, building base load included."""
+        if len(members) == 0:
+            return 0.0
+        hours = (self.end[members[0]] - self.start[members[0]]) / 60.0
+        device_kw = self.power_kw[rooms, self.level[members]].sum()
+        buildings = len(set(self.building[rooms].tolist()))
+        return float((device_kw + buildings * BUILDING_BASE_KW) * hours)
+
+def _solve_greedy(problem, members, busy):
+    """Best-fit decreasing: biggest predicted groups first, each into the cheapest free room."""
+    hours = (problem.end[members[0]] - problem.start[members[0]]) / 60.0
+    used = busy.copy()
+    powered = np.zeros(len(problem.building_names), dtype=bool)
+    assignment = {}
+    # Prefer the smallest adequate room when energy cost ties
+    tie_break = problem.capacity * 1e-6
+    for m in sorted(members, key=lambda i: -problem.headcount[i]):
+        feasible = ~used & (problem.capacity >= problem.headcount[m])
+        if not feasible.any():
+            return None
+        cost = problem.power_kw[:, problem.level[m]] * hours + np.where(powered[problem.building], 0.0, BUILDING_BASE_KW * hours)
+        choice = int(np.argmin(np.where(feasible, cost + tie_break, np.inf)))
+        assignment[m] = choice
+        used[choice] = True
+        powered[problem.building[choice]] = True
+    return np.array([assignment[m] for m in members])
+
+def _solve_exact(problem, members, busy):
+    """Exact optimum: for each subset of buildings kept on, solve a min-cost assignment."""
+    from scipy.optimize import linear_sum_assignment
+
+    hours = (problem.end[members[0]] - problem.start[members[0]]) / 60.0
+    free = np.flatnonzero(~busy)
+    best_cost, best = np.inf, None
+    candidate_buildings = sorted(set(problem.building[free].tolist()))
+    for size in range(1, len(candidate_buildings) + 1):
+        if size * BUILDING_BASE_KW * hours >= best_cost:
+            break  # base load alone already exceeds the best plan; larger subsets only cost more
+        for subset in itertools.combinations(candidate_buildings, size):
+            rooms = free[np.isin(problem.building[free], subset)]
+            if len(rooms) < len(members):
+                continue
+            cost = problem.power_kw[rooms][:, problem.level[members]].T * hours
+            cost = np.where(problem.capacity[rooms][None, :] >= problem.headcount[members][:, None], cost, 1e9)
+            rows, cols = linear_sum_assignment(cost)
+            if cost[rows, cols].max() >= 1e9:
+                continue
+            total = cost[rows, cols].sum() + size * BUILDING_BASE_KW * hours
+            if total < best_cost:
+                chosen = np.empty(len(members), dtype=int)
+                chosen[rows] = rooms[cols]
+                best_cost, best = total, chosen
+    return best
+
+def optimize(problem, method='auto', day=None):
+    """Propose per-slot reassignments. Returns (slots, totals)."""
+    assignment = problem.room.copy()
+    windows = sorted(set(zip(problem.start.tolist(), problem.end.tolist())))
+    slots = []
+    totals = {'baseline_kwh': 0.0, 'optimized_kwh': 0.0, 'baseline_buildings': 0, 'optimized_buildings': 0, 'moves': 0}
+
+    for start, end in windows:
+        slot_day, slot_time = format_minute(start)
+        if day and slot_day != day:
+            continue
+        members = np.flatnonzero((problem.start == start) & (problem.end == end))
+        # Rooms taken by sessions that overlap this slot but belong to another one
+        overlapping = (problem.start < end) & (problem.end > start)
+        overlapping[members] = False
+        busy = np.zeros(len(problem.room_ids), dtype=bool)
+        busy[assignment[overlapping]] = True
+
+        current = assignment[members]
+        baseline = problem.slot_cost(members, current)
+
+        # 'exact' is honoured only where enumerating building subsets stays cheap
+        use_exact = method != 'greedy' and (
+            len(set(problem.building[~busy].tolist())) <= EXACT_MAX_BUILDINGS
+            and int((~busy).sum()) <= EXACT_MAX_ROOMS
+        )
+        proposal = _solve_exact(problem, members, busy) if use_exact else _solve_greedy(problem, members, busy)
+        if proposal is None or problem.slot_cost(members, proposal) >= baseline - 1e-9:
+            proposal = current
+        optimized = problem.slot_cost(members, proposal)
+        assignment[members] = proposal
+
+        moves = [{
+            'timetable_id': int(problem.session_ids[m]),
+            'subject': problem.subjects[m],
+            'from_classroom_id': int(problem.room_ids[old]), 'from_classroom': problem.room_names[old],
+            'to_classroom_id': int(problem.room_ids[new]), 'to_classroom': problem.room_names[new],
+            'predicted_headcount': round(float(problem.headcount[m]), 1),
+            'to_capacity': int(problem.capacity[new])
+        } for m, old, new in zip(members, current, proposal) if old != new]
+
+        slot = {
+            'day': slot_day, 'start': slot_time, 'end': format_minute(end)[1],
+            'sessions': int(len(members)),
+            'baseline_kwh': round(baseline, 2), 'optimized_kwh': round(optimized, 2),
+            'baseline_buildings': len(set(problem.building[current].tolist())),
+            'optimized_buildings': len(set(problem.building[proposal].tolist())),
+            'solver': 'exact' if use_exact else 'greedy',
+            'moves': moves
+        }
+        slots.append(slot)
+        totals['baseline_kwh'] += baseline
+        totals['optimized_kwh'] += optimized
+        totals['baseline_buildings'] += slot['baseline_buildings']
+        totals['optimized_buildings'] += slot['optimized_buildings']
+        totals['moves'] += len(moves)
+
+    totals['baseline_kwh'] = round(totals['baseline_kwh'], 2)
+    totals['optimized_kwh'] = round(totals['optimized_kwh'], 2)
+    totals['saved_kwh'] = round(totals['baseline_kwh'] - totals['optimized_kwh'], 2)
+    return slots, totals
+
+def load_problem():
+    """Build a ConsolidationProblem from active classrooms, the timetable and snapshot predictions."""
+    from models import Classroom, Timetable
+    from services import PredictionService
+
+    rooms = [{
+        'id': c.id, 'name': c.name, 'building': c.building, 'capacity': c.capacity,
+        'lights': c.num_lights or 0, 'acs': c.num_acs or 0, 'fans': c.num_fans or 0
+    } for c in Classroom.query.filter_by(is_active=True).all()]
+
+    snapshots = PredictionService.get_next_snapshots()
+    sessions = []
+    for e in Timetable.query.all():
+        start, end = (e.start_minute, e.end_minute) if e.start_minute is not None else week_window(e.day_of_week, e.time_slot)
+        snap = snapshots.get(e.id)
+        expected = e.expected_attendance or 0
+        level = snap.level_idx if snap else (0 if expected < 30 else (1 if expected <= 60 else 2))
+        sessions.append({
+            'timetable_id': e.id, 'classroom_id': e.classroom_id, 'subject': e.subject,
+            'start': start, 'end': end, 'level': level,
+            'headcount': predicted_headcount(expected, level)
+        })
+    return ConsolidationProblem(rooms, sessions)
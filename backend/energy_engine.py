@@ -0,0 +1,73 @@
+"""
+Equipment-aware energy accounting.
+
+Converts a room's device counts, the predicted occupancy level and the slot
+duration into kWh. Baseline is every device running at full power for the
+whole session; optimized is the same devices at the duty cycle the
+recommendation policy sets for that level. All sessions are computed in one
+array operation, and kWh figures turn into cost and CO2 through per-building
+tariff and emission factors from config.
+"""
+import numpy as np
+
+# Rated draw per device, in watts, ordered (lights, acs, fans)
+LIGHT_WATTS = 40
+AC_WATTS = 1500
+FAN_WATTS = 75
+DEVICE_WATTS = np.array([LIGHT_WATTS, AC_WATTS, FAN_WATTS], dtype=float)
+
+# Device duty per predicted level, matching MLEngine.get_recommendation:
+# Low = eco (all off), Medium = lights 50% + fans, High = full power (the baseline,
+# so a High decision never reports a saving)
+LEVEL_DUTY = {
+    0: {'lights': 0.0, 'acs': 0.0, 'fans': 0.0},
+    1: {'lights': 0.5, 'acs': 0.0, 'fans': 1.0},
+    2: {'lights': 1.0, 'acs': 1.0, 'fans': 1.0},
+}
+BASELINE_DUTY = {'lights': 1.0, 'acs': 1.0, 'fans': 1.0}
+DUTY_MATRIX = np.array([[LEVEL_DUTY[i][d] for d in ('lights', 'acs', 'fans')] for i in (0, 1, 2)])
+BASELINE_VECTOR = np.array([BASELINE_DUTY[d] for d in ('lights', 'acs', 'fans')])
+
+def device_actions(level_idx):
+    """(lights_action, ac_action) strings stored on EnergyDecision."""
+    duty = LEVEL_DUTY[int(level_idx)]
+    lights = 'OFF' if duty['lights'] == 0 else ('ON' if duty['lights'] >= 1 else 'DIM')
+    return lights, 'ON' if duty['acs'] > 0 else 'OFF'
+
+def room_power_kw(num_lights, num_acs, num_fans):
+    """(R, 3) matrix of kW drawn by each room at each occupancy level."""
+    devices = np.column_stack([num_lights, num_acs, num_fans]).astype(float) * DEVICE_WATTS
+    return devices @ DUTY_MATRIX.T / 1000.0
+
+def session_energy(devices, levels, minutes):
+    """Baseline and optimized kWh per session.
+
+    devices: (N, 3) device counts (lights, acs, fans) of the room each session runs in
+    levels:  (N,) predicted level index
+    minutes: (N,) session duration
+    """
+    devices = np.asarray(devices, dtype=float).reshape(-1, 3)
+    hours = np.asarray(minutes, dtype=float) / 60.0
+    load = devices * DEVICE_WATTS
+    baseline = load @ BASELINE_VECTOR * hours / 1000.0
+    optimized = (load * DUTY_MATRIX[np.asarray(levels, dtype=int)]).sum(axis=1) * hours / 1000.0
+    return baseline, optimized
+
+def building_factors(building, config):
+    """(tariff per kWh, kg CO2 per kWh) for a building, falling back to the campus defaults."""
+    override = (config.get('BUILDING_ENERGY_FACTORS') or {}).get(building or '', {})
+    return (
+        float(override.get('tariff', config.get('ENERGY_TARIFF_PER_KWH', 0.15))),
+        float(override.get('co2_kg', config.get('CO2_KG_PER_KWH', 0.5)))
+    )
+
+def savings_summary(kwh_by_building, config):
+    """Total kWh, cost and CO2 (tonnes) saved from a {building: kWh} mapping."""
+    kwh = cost = co2_kg = 0.0
+    for building, saved in kwh_by_building.items():
+        tariff, co2_factor = building_factors(building, config)
+        saved = float(saved or 0)
+        kwh += saved
+        cost += saved * tariff
+        co2_kg += saved * co2_factor
+    return {'energy_saved': round(kwh, 1), 'cost_saved': round(cost, 2), 'co2_reduced': round(co2_kg / 1000.0, 2)}
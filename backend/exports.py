@@ -0,0 +1,257 @@
+"""
+Streaming bulk export of decisions, attendance history and predictions.
+
+Rows are read with server-side cursors (`yield_per`) and encoded chunk by
+chunk, so a worker holds one chunk in memory no matter how many rows it
+exports. Every dataset streams in ascending id order. A client whose
+download broke resumes with `after_id=<last id received>` and gets exactly
+the rows it is missing. Energy decisions span archived months, monthly
+partitions and the hot table, oldest tier first; decision ids grow with
+their timestamps, so the tiers never interleave. An archived month is read
+from its file one month at a time.
+"""
+import io
+import csv
+import json
+import importlib.util
+from datetime import datetime, date
+
+from sqlalchemy import select, Date, DateTime
+
+import retention
+
+# Optional: CSV and NDJSON always work. Imported on first Parquet export, not at startup
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# (column, type) per dataset; types drive the Parquet schema
+DATASETS = {
+    'decisions': [
+        ('id', 'int'), ('classroom_id', 'int'), ('building', 'str'), ('timestamp', 'datetime'),
+        ('predicted_occupancy', 'str'), ('lights_action', 'str'), ('ac_action', 'str'), ('energy_saved_kwh', 'float'),
+    ],
+    'attendance': [
+        ('id', 'int'), ('timetable_id', 'int'), ('classroom_id', 'int'), ('date', 'date'),
+        ('actual_attendance', 'float'), ('expected_attendance', 'float'), ('day_of_week', 'str'),
+        ('hour', 'int'), ('subject_type', 'str'),
+    ],
+    'predictions': [
+        ('id', 'int'), ('timetable_id', 'int'), ('classroom_id', 'int'), ('target_date', 'date'),
+        ('predicted_occupancy', 'str'), ('level_idx', 'int'), ('confidence', 'float'),
+        ('recommendation', 'str'), ('model_version', 'str'), ('computed_at', 'datetime'),
+    ],
+}
+
+class ExportRequest:
+    """Validated filters for one export."""
+    def __init__(self, dataset, fmt, start=None, end=None, classroom_id=None, after_id=0, limit=None, chunk_rows=5000):
+        self.dataset = dataset
+        self.format = fmt
+        self.start = start
+        self.end = end
+        self.classroom_id = classroom_id
+        self.after_id = after_id or 0
+        self.limit = limit
+        self.chunk_rows = chunk_rows
+
+    @property
+    def columns(self):
+        return [name for name, _ in DATASETS[self.dataset]]
+
+def parse_request(dataset, args, chunk_rows):
+    """ExportRequest from query args. Returns (request, error)."""
+    if dataset not in DATASETS:
+        return None, f"Unknown dataset '{dataset}'; expected one of {', '.join(DATASETS)}"
+    fmt = args.get('format', 'csv').lower()
+    if fmt not in FORMATS:
+        return None, f"format must be one of {', '.join(FORMATS)}"
+    try:
+        start = datetime.fromisoformat(args['start']) if args.get('start') else None
+        end = datetime.fromisoformat(args['end']) if args.get('end') else None
+        classroom_id = int(args['classroom_id']) if args.get('classroom_id') else None
+        after_id = int(args.get('after_id', 0))
+        limit = int(args['limit']) if args.get('limit') else None
+    except ValueError:
+        return None, 'start/end must be ISO dates; classroom_id, after_id and limit must be integers'
+    if limit is not None and limit <= 0:
+        return None, 'limit must be positive'
+    return ExportRequest(dataset, fmt, start, end, classroom_id, after_id, limit, chunk_rows), None
+
+# --- Row sources (each yields lists of row tuples in id order) -----------------
+
+def _stream(session, query, chunk_rows):
+    result = session.execute(query.execution_options(yield_per=chunk_rows))
+    for partition in result.partitions():
+        yield partition
+
+def _filtered(query, req, id_column, time_column, classroom_column):
+    query = query.where(id_column > req.after_id)
+    # Date columns compare against dates; SQLite would compare the text forms otherwise
+    as_date = isinstance(time_column.type, Date) and not isinstance(time_column.type, DateTime)
+    if req.start is not None:
+        query = query.where(time_column >= (req.start.date() if as_date else req.start))
+    if req.end is not None:
+        query = query.where(time_column < (req.end.date() if as_date else req.end))
+    if req.classroom_id is not None:
+        query = query.where(classroom_column == req.classroom_id)
+    return query.order_by(id_column)
+
+def _decision_chunks(session, engine, config, req):
+    from models import EnergyDecision, Classroom
+
+    rooms = Classroom.__table__
+    names = [n for n in req.columns if n != 'building']
+
+    # Archived months first: they hold the oldest (lowest) ids
+    archive = retention.get_archive(config)
+    for month_key, entry in sorted(archive.months().items()):
+        if req.end is not None and datetime.fromisoformat(entry['start']) >= req.end:
+            continue
+        if req.start is not None and datetime.fromisoformat(entry['end']) <= req.start:
+            continue
+        frame = archive.frame(month_key, req.columns)
+        mask = frame['id'] > req.after_id
+        if req.start is not None:
+            mask &= frame['timestamp'] >= req.start
+        if req.end is not None:
+            mask &= frame['timestamp'] < req.end
+        if req.classroom_id is not None:
+            mask &= frame['classroom_id'] == req.classroom_id
+        frame = frame[mask].sort_values('id')
+        for offset in range(0, len(frame), req.chunk_rows):
+            part = frame.iloc[offset:offset + req.chunk_rows]
+            yield [tuple(row) for row in part[req.columns].itertuples(index=False, name=None)]
+
+    sources = [table for _, table in retention.decision_partitions.between(engine, req.start, req.end)]
+    if retention.decision_partitions.is_native(engine) and sources:
+        sources = [retention.decision_partitions.union(engine, req.start, req.end)]
+    sources.append(EnergyDecision.__table__)
+    for source in sources:
+        query = select(*(source.c[n] for n in names[:2]), rooms.c.building, *(source.c[n] for n in names[2:])) \
+            .select_from(source.outerjoin(rooms, rooms.c.id == source.c.classroom_id))
+        query = _filtered(query, req, source.c.id, source.c.timestamp, source.c.classroom_id)
+        yield from _stream(session, query, req.chunk_rows)
+
+def _attendance_chunks(session, req):
+    from models import AttendanceHistory, Timetable
+
+    history, timetable = AttendanceHistory.__table__, Timetable.__table__
+    query = select(history.c.id, history.c.timetable_id, timetable.c.classroom_id, history.c.date,
+                   history.c.actual_attendance, history.c.expected_attendance, history.c.day_of_week,
+                   history.c.hour, history.c.subject_type) \
+        .select_from(history.outerjoin(timetable, timetable.c.id == history.c.timetable_id))
+    query = _filtered(query, req, history.c.id, history.c.date, timetable.c.classroom_id)
+    yield from _stream(session, query, req.chunk_rows)
+
+def _prediction_chunks(session, req):
+    from models import PredictionSnapshot, Timetable
+
+    snapshot, timetable = PredictionSnapshot.__table__, Timetable.__table__
+    query = select(snapshot.c.id, snapshot.c.timetable_id, timetable.c.classroom_id, snapshot.c.target_date,
+                   snapshot.c.predicted_occupancy, snapshot.c.level_idx, snapshot.c.confidence,
+                   snapshot.c.recommendation, snapshot.c.model_version, snapshot.c.computed_at) \
+        .select_from(snapshot.outerjoin(timetable, timetable.c.id == snapshot.c.timetable_id))
+    query = _filtered(query, req, snapshot.c.id, snapshot.c.target_date, timetable.c.classroom_id)
+    yield from _stream(session, query, req.chunk_rows)
+
+def row_chunks(session, engine, config, req):
+    """Lists of row tuples for `req`, honouring `limit` across chunks."""
+    if req.dataset == 'decisions':
+        chunks = _decision_chunks(session, engine, config, req)
+    elif req.dataset == 'attendance':
+        chunks = _attendance_chunks(session, req)
+    else:
+        chunks = _prediction_chunks(session, req)
+    remaining = req.limit
+    for chunk in chunks:
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if chunk:
+            yield chunk
+        if remaining is not None and remaining <= 0:
+            return
+
+# --- Encoders ---------------------------------------------------------------------
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, 'item'):  # numpy scalars from archive frames
+        return value.item()
+    return value
+
+def encode_csv(columns, chunks):
+    yield (','.join(columns) + '\n').encode()
+    for chunk in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerows([[('' if v is None else _plain(v)) for v in row] for row in chunk])
+        yield buffer.getvalue().encode()
+
+def encode_ndjson(columns, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, map(_plain, row)))) + '\n' for row in chunk).encode()
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever ParquetWriter wrote since the last drain."""
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+def parquet_schema(dataset):
+    import pyarrow
+    types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'float': pyarrow.float64(),
+             'datetime': pyarrow.timestamp('us'), 'date': pyarrow.date32()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in DATASETS[dataset]])
+
+def encode_parquet(dataset, chunks):
+    """One Parquet row group per chunk, streamed as soon as it is written."""
+    import pyarrow
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(dataset)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array([_plain(v) if not isinstance(v, (datetime, date)) else v for v in values], type=field.type)
+             for values, field in zip(columns, schema)], schema=schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def stream(session, engine, config, req):
+    """Encoded byte chunks for an export request."""
+    chunks = row_chunks(session, engine, config, req)
+    if req.format == 'csv':
+        return encode_csv(req.columns, chunks)
+    if req.format == 'ndjson':
+        return encode_ndjson(req.columns, chunks)
+    return encode_parquet(req.dataset, chunks)
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings picked up automatically from the working directory.
+
+Each worker flushes its metrics to a file in METRICS_DIR so `/metrics`
+reports the whole server, not whichever worker answered the scrape, and
+writes its own rotating log file. The web entry point does not import
+pandas, scikit-learn or joblib; the master loads them once before forking
+(PRELOAD_ML_LIBS) so workers share the pages instead of each paying for
+the import on their first prediction or upload.
+"""
+import os
+
+os.environ.setdefault('METRICS_DIR', '/tmp/smartenergy-metrics')
+# One log file per worker: a shared RotatingFileHandler would race on rollover
+os.environ.setdefault('LOG_FILE', 'logs/smart_energy.{pid}.log')
+
+def on_starting(server):
+    import metrics
+    metrics.reset_directory(os.environ['METRICS_DIR'])
+
+    # Libraries only: importing the app here would start its threads in the master
+    if os.environ.get('PRELOAD_ML_LIBS', 'true').lower() == 'true':
+        import numpy, pandas, joblib, sklearn.ensemble, sklearn.model_selection, sklearn.metrics  # noqa: F401
+
+def child_exit(server, worker):
+    # Fold the dead worker's counters into the shared total so they never go backwards
+    import metrics
+    metrics.mark_process_dead(worker.pid, os.environ['METRICS_DIR'])
@@ -0,0 +1,178 @@
+"""
+Predictive HVAC pre-conditioning scheduler.
+
+Turns one day of timetable sessions and the model's per-session occupancy
+probabilities into start/stop times for every room's AC, light and fan
+banks. ACs start `ramp` minutes before a session that is likely to be High
+occupancy and stop `coast` minutes before a run ends, relying on the room's
+thermal inertia; short off gaps are bridged to avoid cycling the compressors.
+
+Every room is a row of a (rooms x time-steps) grid, so the whole campus is
+scheduled with a handful of array operations per day.
+"""
+import numpy as np
+
+from energy_engine import LEVEL_DUTY, LIGHT_WATTS, AC_WATTS, FAN_WATTS
+from timeslots import DAY_MINUTES, DAY_NAMES, week_window
+
+def _runs(mask):
+    """(row, start, end) for every run of True along axis 1; end is exclusive."""
+    rows, width = mask.shape
+    padded = np.zeros((rows, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return start_rows, starts, ends
+
+def _count_ahead(mask, steps):
+    """Per cell, how many of the next `steps[row]` cells (excluding itself) are True."""
+    rows, width = mask.shape
+    cumulative = np.zeros((rows, width + 1), dtype=np.int32)
+    cumulative[:, 1:] = np.cumsum(mask, axis=1)
+    position = np.arange(width)[None, :]
+    ahead = np.minimum(position + 1 + steps[:, None], width)
+    return np.take_along_axis(cumulative, ahead, axis=1) - cumulative[:, 1:]
+
+def _bridge_gaps(mask, max_gap):
+    """Switch on False gaps shorter than `max_gap` cells that sit between two on-runs."""
+    if max_gap <= 0:
+        return mask
+    rows, starts, ends = _runs(~mask)
+    inner = (starts > 0) & (ends < mask.shape[1]) & (ends - starts < max_gap)
+    bridged = mask.copy()
+    for row, start, end in zip(rows[inner], starts[inner], ends[inner]):
+        bridged[row, start:end] = True
+    return bridged
+
+def schedule_day(rooms, sessions, ramp_minutes, coast_minutes, ac_probability=0.4,
+                 min_off_minutes=15, step=5):
+    """Device timeline for one day.
+
+    rooms:    dicts with id, name, building, lights, acs, fans and optional ramp/coast minutes
+    sessions: dicts with classroom_id, start/end (minutes since midnight) and probs (Low, Medium, High)
+    Returns a list of per-room dicts with an `events` timeline and device-on minutes.
+    """
+    width = DAY_MINUTES // step
+    position = {r['id']: i for i, r in enumerate(rooms)}
+    sessions = [s for s in sessions if s['classroom_id'] in position]
+
+    ramp = np.array([r.get('ramp') if r.get('ramp') is not None else ramp_minutes for r in rooms], dtype=int)
+    coast = np.array([r.get('coast') if r.get('coast') is not None else coast_minutes for r in rooms], dtype=int)
+    ramp_steps = -(-ramp // step)
+    coast_steps = coast // step
+
+    occupied = np.zeros((len(rooms), width), dtype=bool)
+    ac_need = np.zeros_like(occupied)
+    lights = np.zeros((len(rooms), width))
+    fans = np.zeros_like(lights)
+    if sessions:
+        row = np.array([position[s['classroom_id']] for s in sessions])
+        first = np.array([s['start'] for s in sessions]) // step
+        last = -(-np.array([s['end'] for s in sessions]) // step)
+        probs = np.array([s['probs'] for s in sessions], dtype=float)
+        level = np.argmax(probs, axis=1)
+
+        # Difference arrays: +value at the first step, -value after the last, then cumsum
+        def paint(values):
+            diff = np.zeros((len(rooms), width + 1))
+            np.add.at(diff, (row, first), values)
+            np.add.at(diff, (row, last), -values)
+            return np.cumsum(diff[:, :-1], axis=1)
+
+        occupied = paint(np.ones(len(sessions))) > 0
+        ac_need = paint((probs[:, 2] >= ac_probability).astype(float)) > 0
+        lights = np.clip(paint(np.array([LEVEL_DUTY[i]['lights'] for i in level])), 0, 1)
+        fans = np.clip(paint(np.array([LEVEL_DUTY[i]['fans'] for i in level])), 0, 1)
+        # The AC covers cooling when it runs; fans only fill in where it does not
+        fans[ac_need] = 0
+
+    # Pre-condition: on whenever cooling is needed within the next `ramp` minutes.
+    # Coast: drop out `coast` minutes before a run ends instead of at the bell.
+    pre_cool = ~ac_need & (_count_ahead(ac_need, ramp_steps) > 0)
+    sustained = ac_need & (_count_ahead(ac_need, coast_steps) >= coast_steps[:, None])
+    ac_on = _bridge_gaps(pre_cool | sustained, -(-min_off_minutes // step))
+
+    plans = []
+    for i, room in enumerate(rooms):
+        plans.append({
+            'classroom_id': room['id'], 'classroom': room['name'], 'building': room['building'],
+            'events': [], 'ac_minutes': 0, 'light_minutes': 0, 'fan_minutes': 0, 'kwh': 0.0
+        })
+
+    def clock(index):
+        minute = int(index) * step
+        return f"{minute // 60:02d}:{minute % 60:02d}" if minute < DAY_MINUTES else '24:00'
+
+    rows, starts, ends = _runs(ac_on)
+    for r, start, end in zip(rows, starts, ends):
+        needed = np.flatnonzero(ac_need[r, start:end])
+        lead = int(needed[0]) * step if len(needed) else 0
+        plans[r]['events'].append({
+            'device': 'ac', 'units': rooms[r]['acs'], 'level': 1.0,
+            'start': clock(start), 'end': clock(end), 'preconditioning_minutes': lead
+        })
+        plans[r]['ac_minutes'] += int(end - start) * step
+
+    for device, grid, units_key, minutes_key in (('lights', lights, 'lights', 'light_minutes'), ('fans', fans, 'fans', 'fan_minutes')):
+        for value in np.unique(grid[grid > 0]):
+            rows, starts, ends = _runs(grid == value)
+            for r, start, end in zip(rows, starts, ends):
+                plans[r]['events'].append({
+                    'device': device, 'units': rooms[r][units_key], 'level': round(float(value), 2),
+                    'start': clock(start), 'end': clock(end)
+                })
+                plans[r][minutes_key] += int(end - start) * step
+
+    hours = step / 60.0
+    kwh = (ac_on.sum(axis=1) * np.array([r['acs'] for r in rooms]) * AC_WATTS
+           + lights.sum(axis=1) * np.array([r['lights'] for r in rooms]) * LIGHT_WATTS
+           + fans.sum(axis=1) * np.array([r['fans'] for r in rooms]) * FAN_WATTS) * hours / 1000.0
+    for plan, room_kwh, busy in zip(plans, kwh, occupied.any(axis=1)):
+        plan['kwh'] = round(float(room_kwh), 2)
+        plan['events'].sort(key=lambda e: (e['start'], e['device']))
+        plan['scheduled'] = bool(busy)
+    return plans
+
+def load_day(target_date, ml, building=None, classroom_id=None):
+    """Rooms and scored sessions for one calendar date, ready for schedule_day()."""
+    from models import Classroom, Timetable
+    import pandas as pd
+
+    query = Classroom.query.filter_by(is_active=True)
+    if building:
+        query = query.filter_by(building=building)
+    if classroom_id is not None:
+        query = query.filter_by(id=classroom_id)
+    rooms = [{
+        'id': c.id, 'name': c.name, 'building': c.building,
+        'lights': c.num_lights or 0, 'acs': c.num_acs or 0, 'fans': c.num_fans or 0,
+        'ramp': c.thermal_ramp_minutes, 'coast': c.thermal_coast_minutes
+    } for c in query.all()]
+    room_ids = [r['id'] for r in rooms]
+    if not room_ids:
+        return rooms, []
+
+    day = target_date.weekday()
+    day_start = day * DAY_MINUTES
+    entries = Timetable.query.filter(Timetable.classroom_id.in_(room_ids)).filter(
+        (Timetable.start_minute.is_(None)) |
+        ((Timetable.start_minute >= day_start) & (Timetable.start_minute < day_start + DAY_MINUTES))
+    ).all()
+
+    sessions = []
+    for e in entries:
+        start, end = (e.start_minute, e.end_minute) if e.start_minute is not None else week_window(e.day_of_week, e.time_slot)
+        if start is None or not (day_start <= start < day_start + DAY_MINUTES):
+            continue
+        sessions.append({
+            'classroom_id': e.classroom_id, 'start': start - day_start, 'end': end - day_start,
+            'day': DAY_NAMES[day], 'hour': (start - day_start) // 60,
+            'type': e.subject_type, 'attendance': e.expected_attendance
+        })
+    if sessions:
+        frame = pd.DataFrame(sessions, columns=['day', 'hour', 'type', 'attendance'])
+        probabilities, _ = ml.predict_proba_frame(frame)
+        for session, probs in zip(sessions, probabilities):
+            session['probs'] = probs
+    return rooms, sessions
@@ -0,0 +1,211 @@
+"""
+Non-blocking structured logging.
+
+Request threads only format the message and put the record on an in-memory
+queue; a single listener thread per process writes it to the console and the
+rotating log file. When the queue is full, records are dropped and counted
+rather than making the caller wait. Every record carries the request ID,
+which is taken from an incoming X-Request-ID header or generated, and is
+echoed back on the response. Each call site is rate limited, so a failure
+repeating in a hot loop cannot flood the pipeline.
+
+File and production console output is one JSON object per line:
+    {"ts": "...", "level": "ERROR", "logger": "services", "message": "...",
+     "request_id": "...", "method": "GET", "path": "/api/predict", ...}
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+ACCESS_LOGGER = 'smartenergy.access'
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id', 'method', 'path'}
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request fields and any `extra=` values."""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+        }
+        if getattr(record, 'method', None):
+            entry['method'] = record.method
+            entry['path'] = record.path
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        record.request_id = getattr(record, 'request_id', None) or '-'
+        return super().format(record)
+
+class RequestContextFilter(logging.Filter):
+    """Stamp request ID, method and path while still on the request thread."""
+    def filter(self, record):
+        from flask import has_request_context, g, request
+
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        else:
+            record.request_id = None
+            record.method = None
+            record.path = None
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """At most `burst` records per call site per `window` seconds; the next one reports how many were dropped."""
+    def __init__(self, burst, window, exempt=()):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.exempt = set(exempt)
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.burst or record.name in self.exempt:
+            return True
+        site = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            if count >= self.burst:
+                self._sites[site] = (started, count, suppressed + 1)
+                return False
+            self._sites[site] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message and traceback here so the listener never touches request state
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        record.msg, record.args, record.exc_info = record.message, None, None
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _console_formatter(config, debug):
+    fmt = (config.get('LOG_FORMAT') or ('text' if debug else 'json')).lower()
+    return JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT)
+
+def configure(config, debug=False):
+    """Route the root logger through the queue (once per process). Returns the queue handler."""
+    global _listener, _handler
+    with _lock:
+        if _handler is not None:
+            return _handler
+
+        handlers = []
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(_console_formatter(config, debug))
+        handlers.append(console)
+
+        log_file = config.get('LOG_FILE')
+        if log_file and not debug:
+            log_file = log_file.format(pid=os.getpid())
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                               backupCount=config.get('LOG_BACKUP_COUNT', 10), encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        log_queue = queue.Queue(config.get('LOG_QUEUE_SIZE', 10000))
+        _handler = NonBlockingQueueHandler(log_queue)
+        _handler.addFilter(RequestContextFilter())
+        _handler.addFilter(RateLimitFilter(config.get('LOG_RATE_LIMIT', 20), config.get('LOG_RATE_WINDOW', 60),
+                                           exempt=(ACCESS_LOGGER,)))
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        return _handler
+
+def shutdown():
+    """Flush what is queued and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def init_app(app):
+    """Structured logging for this process plus request IDs and an access log for the app."""
+    from flask import g, request
+    from flask.logging import default_handler
+
+    configure(app.config, debug=app.debug)
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    access = logging.getLogger(ACCESS_LOGGER)
+
+    @app.before_request
+    def _assign_request_id():
+        supplied = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = supplied if REQUEST_ID_PATTERN.match(supplied) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        if app.config.get('LOG_ACCESS', True) and 'request_started' in g:
+            access.info(f'{request.method} {request.path} {response.status_code}', extra={
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+                'remote_addr': request.remote_addr,
+            })
+        return response
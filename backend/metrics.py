@@ -0,0 +1,325 @@
+"""
+Prometheus-style metrics without a client library.
+
+Counters and histograms live in a module-level registry so any module can
+record into them without an app context. `/metrics` renders the Prometheus
+text exposition format.
+
+Under gunicorn each worker has its own registry. When METRICS_DIR is set
+(gunicorn.conf.py sets it before forking), every worker writes a snapshot to
+`<METRICS_DIR>/metrics_<pid>.json` about once a second and at exit, and
+`/metrics` sums the snapshots of all workers, so whichever worker answers the
+scrape reports the whole server. Snapshots of exited workers are folded into
+`metrics_dead.json` by the master so their counts are not lost.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+DEAD_FILE = 'metrics_dead.json'
+# Joins label values into snapshot keys (JSON object keys must be strings)
+KEY_SEPARATOR = '\x1f'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = registry.lock
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self):
+        return {KEY_SEPARATOR.join(k): v for k, v in self._values.items()}
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        return {KEY_SEPARATOR.join(k): [list(v[0]), v[1], v[2]] for k, v in self._values.items()}
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.directory = None
+        self._flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        with self.lock:
+            return {name: m.snapshot() for name, m in self.metrics.items()}
+
+    # --- Multi-process support ---
+
+    def configure(self, directory, flush_seconds=1.0):
+        """Share values through `directory` (one snapshot file per process)."""
+        if not directory or self.directory == directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._flusher = threading.Thread(target=self._flush_loop, args=(flush_seconds,), name='metrics-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f'metrics_{pid or os.getpid()}.json')
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = self._path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Values summed across every process sharing the directory."""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        for name in os.listdir(self.directory):
+            if name.startswith('metrics_') and name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        _merge(merged, json.load(f))
+                except (OSError, ValueError):
+                    continue  # a worker is replacing its file right now
+        return merged
+
+def _merge(into, snapshot):
+    for name, series in snapshot.items():
+        target = into.setdefault(name, {})
+        for key, value in series.items():
+            if isinstance(value, list):
+                current = target.get(key)
+                if current is None:
+                    target[key] = [list(value[0]), value[1], value[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+            else:
+                target[key] = target.get(key, 0.0) + value
+    return into
+
+def mark_process_dead(pid, directory):
+    """Fold an exited worker's snapshot into the dead-process totals (gunicorn child_exit)."""
+    path = os.path.join(directory, f'metrics_{pid}.json')
+    if not os.path.exists(path):
+        return
+    dead_path = os.path.join(directory, DEAD_FILE)
+    totals = {}
+    for source in (dead_path, path):
+        if os.path.exists(source):
+            with open(source) as f:
+                _merge(totals, json.load(f))
+    tmp = dead_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(totals, f)
+    os.replace(tmp, dead_path)
+    os.remove(path)
+
+def reset_directory(directory):
+    """Start a server run from zero (gunicorn on_starting)."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith('metrics_'):
+            os.remove(os.path.join(directory, name))
+
+# --- Exposition ---------------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, key, extra=None):
+    pairs = list(zip(names, key.split(KEY_SEPARATOR))) if names else []
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def render(registry=None):
+    """Prometheus text format (version 0.0.4) for every registered metric."""
+    registry = registry or REGISTRY
+    values = registry.collect()
+    lines = []
+    for name, metric in sorted(registry.metrics.items()):
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(metric.buckets, counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{_format_labels(metric.labelnames, key, ("le", _format_value(bound)))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(metric.labelnames, key, ("le", "+Inf"))} {count}')
+            lines.append(f'{name}_sum{_format_labels(metric.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(metric.labelnames, key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+# --- Metric definitions -------------------------------------------------------------
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter(REGISTRY, 'http_requests_total', 'HTTP requests handled', ('blueprint', 'route', 'method', 'status'))
+HTTP_LATENCY = Histogram(REGISTRY, 'http_request_duration_seconds', 'Time to build the response',
+                         ('blueprint', 'route', 'method'))
+HTTP_SQL_QUERIES = Histogram(REGISTRY, 'http_request_sql_queries', 'SQL statements executed per request',
+                             ('blueprint', 'route'), buckets=COUNT_BUCKETS)
+HTTP_SQL_SECONDS = Histogram(REGISTRY, 'http_request_sql_seconds', 'Time spent in SQL per request', ('blueprint', 'route'))
+
+DB_QUERIES = Counter(REGISTRY, 'db_queries_total', 'SQL statements executed')
+DB_QUERY_SECONDS = Histogram(REGISTRY, 'db_query_duration_seconds', 'SQL statement execution time')
+
+MODEL_LOAD_SECONDS = Histogram(REGISTRY, 'ml_model_load_seconds', 'Time to load the occupancy model from disk')
+PREDICT_SECONDS = Histogram(REGISTRY, 'ml_predict_seconds', 'Occupancy model inference time', ('method',))
+PREDICT_BATCH = Histogram(REGISTRY, 'ml_predict_batch_rows', 'Rows scored per inference call', ('method',), buckets=SIZE_BUCKETS)
+TRAIN_SECONDS = Histogram(REGISTRY, 'ml_train_seconds', 'Model training time', ('result',),
+                          buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+TRAIN_RECORDS = Histogram(REGISTRY, 'ml_train_records', 'Records in the training set', ('result',), buckets=SIZE_BUCKETS)
+
+EMAIL_SECONDS = Histogram(REGISTRY, 'email_send_seconds', 'SMTP delivery time', ('kind',))
+EMAIL_FAILURES = Counter(REGISTRY, 'email_send_failures_total', 'SMTP deliveries that raised', ('kind',))
+
+JOB_RUNS = Counter(REGISTRY, 'scheduler_job_runs_total', 'Scheduled job runs', ('job', 'status'))
+JOB_SECONDS = Histogram(REGISTRY, 'scheduler_job_duration_seconds', 'Scheduled job run time', ('job',),
+                        buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+
+@contextmanager
+def track_email(kind):
+    """Time an SMTP delivery and count it as failed if it raises (the error still propagates)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EMAIL_FAILURES.inc(kind=kind)
+        raise
+    finally:
+        EMAIL_SECONDS.observe(time.perf_counter() - started, kind=kind)
+
+@contextmanager
+def track_job(job):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        JOB_RUNS.inc(job=job, status='error')
+        raise
+    else:
+        JOB_RUNS.inc(job=job, status='ok')
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - started, job=job)
+
+# --- Flask and SQLAlchemy hooks ------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    from flask import g, has_app_context
+
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(elapsed)
+    if has_app_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += elapsed
+
+def init_app(app):
+    """Request timing, per-request SQL totals and the shared directory for this process."""
+    from flask import g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    REGISTRY.configure(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_SECONDS', 1.0))
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        blueprint = request.blueprint or ''
+        HTTP_LATENCY.observe(time.perf_counter() - started, blueprint=blueprint, route=rule, method=request.method)
+        HTTP_REQUESTS.inc(blueprint=blueprint, route=rule, method=request.method, status=response.status_code)
+        queries, sql_seconds = g.pop('metrics_sql', (0, 0.0))
+        HTTP_SQL_QUERIES.observe(queries, blueprint=blueprint, route=rule)
+        HTTP_SQL_SECONDS.observe(sql_seconds, blueprint=blueprint, route=rule)
+        return response
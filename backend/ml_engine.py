@@ -1,15 +1,113 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-import joblib
 import os
 import json
+import io
+import shutil
+import tempfile
+import threading
+import hashlib
+import time
 from datetime import datetime
 
+import metrics
+from timeslots import DAY_ALIASES
+
 MODEL_PATH = 'occupancy_model.pkl'
 MASTER_HISTORY_PATH = 'data/processed_history.csv'
+# Content-addressed artifacts: <fingerprint>.pkl + <fingerprint>.json
+MODEL_CACHE_DIR = 'data/model_cache'
+DIGEST_REGISTRY_PATH = 'data/digested_uploads.json'
+# Newest digests remembered; older uploads would simply be digested again
+DIGEST_REGISTRY_LIMIT = 1000
+MODEL_CACHE_LIMIT = 10
+INGEST_PROGRESS_DIR = 'data/ingest_progress'
+HISTORY_LIMIT = 10000
+INGEST_CHUNK_ROWS = 50000
+INGEST_REQUIRED_COLUMNS = ['day', 'hour', 'type', 'attendance']
+
+FEATURES = ['day', 'hour', 'type', 'attendance', 'is_weekend', 'time_bin']
+LEVELS = {0: 'Low', 1: 'Medium', 2: 'High'}
+HYPERPARAMS = {'n_estimators': 150, 'random_state': 42, 'oob_score': True, 'test_size': 0.15}
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file on disk, read in chunks."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+_model_version_cache = {}
+
+def model_version():
+    """Digest of the current model file, re-hashed only when the file changes."""
+    if not os.path.exists(MODEL_PATH):
+        return None
+    stat = os.stat(MODEL_PATH)
+    key = (MODEL_PATH, stat.st_mtime_ns, stat.st_size)
+    if key not in _model_version_cache:
+        _model_version_cache.clear()
+        _model_version_cache[key] = file_digest(MODEL_PATH)
+    return _model_version_cache[key]
+
+class DigestingReader(io.RawIOBase):
+    """Read-through wrapper that hashes and counts bytes as pandas consumes them."""
+    def __init__(self, stream):
+        self._stream = stream
+        self._sha = hashlib.sha256()
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        if not data:
+            return 0
+        n = len(data)
+        buffer[:n] = data
+        self._sha.update(data)
+        self.bytes_read += n
+        return n
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+_registry_lock = threading.Lock()
+
+def atomic_write(path, write, mode='w'):
+    """Write `path` through a temp file in the same directory, then os.replace it.
+
+    Readers in other workers see the old file or the new one, never a partial write.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_ingest_progress(job_id, **state):
+    """Persist ingestion progress on disk so any worker can report it."""
+    os.makedirs(INGEST_PROGRESS_DIR, exist_ok=True)
+    state.update({'job_id': job_id, 'updated_at': datetime.utcnow().isoformat()})
+    tmp_path = os.path.join(INGEST_PROGRESS_DIR, f'{job_id}.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(INGEST_PROGRESS_DIR, f'{job_id}.json'))
+
+def read_ingest_progress(job_id):
+    path = os.path.join(INGEST_PROGRESS_DIR, f'{job_id}.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
 
 class MLEngine:
     def __init__(self):
@@ -20,7 +118,9 @@ class MLEngine:
         
         if os.path.exists(MODEL_PATH):
             try:
-                self.model = joblib.load(MODEL_PATH)
+                import joblib
+                with metrics.MODEL_LOAD_SECONDS.time():
+                    self.model = joblib.load(MODEL_PATH)
             except:
                 self.train_initial_model()
 
@@ -55,27 +155,21 @@ class MLEngine:
         
         # Day: Monday=0, Sunday=6
         if 'day' in df.columns:
-            day_map = {'Monday':0, 'Tuesday':1, 'Wednesday':2, 'Thursday':3, 'Friday':4, 'Saturday':5, 'Sunday':6}
-            df['day'] = df['day'].apply(lambda x: day_map.get(str(x).strip().capitalize(), 0) if not str(x).isdigit() else int(x))
+            day_text = df['day'].astype(str)
+            named = day_text.str.strip().str.capitalize().map(DAY_ALIASES).fillna(0)
+            numeric = pd.to_numeric(day_text.where(day_text.str.isdigit()), errors='coerce')
+            df['day'] = numeric.fillna(named).astype(int)
             # New feature: Is Weekend
-            df['is_weekend'] = df['day'].apply(lambda x: 1 if x >= 5 else 0)
+            df['is_weekend'] = (df['day'] >= 5).astype(int)
         
-        # Hour: 08:00 -> 8
+        # Hour: 08:00 -> 8 (vectorized; one string pass per column instead of per row)
         if 'hour' in df.columns:
-            def parse_hour(x):
-                try:
-                    s = str(x).strip()
-                    h = int(s.split(':')[0]) if ':' in s else int(float(s))
-                    return h
-                except: return 8
-            df['hour'] = df['hour'].apply(parse_hour).astype(int)
+            hour_text = df['hour'].astype(str).str.strip()
+            hour_head = hour_text.str.split(':', n=1).str[0]
+            df['hour'] = pd.to_numeric(hour_head, errors='coerce').fillna(8).astype(int)
             
-            # New feature: Time of day bin
-            def get_time_bin(h):
-                if h < 12: return 0 # Morning
-                if h < 17: return 1 # Afternoon
-                return 2 # Evening
-            df['time_bin'] = df['hour'].apply(get_time_bin)
+            # New feature: Time of day bin (0 morning, 1 afternoon, 2 evening)
+            df['time_bin'] = np.select([df['hour'] < 12, df['hour'] < 17], [0, 1], default=2)
             
         if 'type' in df.columns:
             df['type'] = df['type'].apply(lambda x: 1 if str(x).lower().strip() in ['lab', 'practical', '1'] else 0)
@@ -88,61 +182,265 @@ class MLEngine:
             
         return df
 
-    def digest_and_train(self, new_df):
-        """Absorb new data into cumulative history and retrain."""
-        processed_new = self._preprocess_dataframe(new_df)
+    def _load_digest_registry(self):
+        if not os.path.exists(DIGEST_REGISTRY_PATH):
+            return {}
+        try:
+            with open(DIGEST_REGISTRY_PATH) as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return {}
+
+    def is_digested(self, source_digest):
+        """True if an upload with this content hash was already absorbed."""
+        return source_digest in self._load_digest_registry()
+
+    def _mark_digested(self, source_digest, report):
+        with _registry_lock:
+            registry = self._load_digest_registry()
+            registry[source_digest] = {
+                'digested_at': datetime.utcnow().isoformat(),
+                'fingerprint': report.get('fingerprint') if report else None
+            }
+            # Keep the newest DIGEST_REGISTRY_LIMIT digests (ISO timestamps sort by time)
+            newest = sorted(registry.items(), key=lambda item: item[1].get('digested_at') or '', reverse=True)
+            registry = dict(newest[:DIGEST_REGISTRY_LIMIT])
+            atomic_write(DIGEST_REGISTRY_PATH, lambda f: json.dump(registry, f))
+
+    def _skipped_report(self, source_digest):
+        entry = self._load_digest_registry()[source_digest]
+        return {
+            'skipped': True,
+            'reason': 'Dataset already digested',
+            'digested_at': entry.get('digested_at'),
+            'fingerprint': entry.get('fingerprint')
+        }
+
+    def _load_history_tail(self):
+        if not os.path.exists(MASTER_HISTORY_PATH):
+            return None
+        return pd.read_csv(MASTER_HISTORY_PATH).tail(HISTORY_LIMIT)
+
+    def _append_tail(self, tail_df, processed):
+        """Append processed rows while keeping only the newest HISTORY_LIMIT records."""
+        if tail_df is None:
+            return processed.tail(HISTORY_LIMIT)
+        return pd.concat([tail_df, processed], ignore_index=True).tail(HISTORY_LIMIT)
+
+    @staticmethod
+    def _validate_rows(df):
+        """(valid rows, rejected count): rows need a known day, an hour 0-23 and a numeric attendance >= 0.
+
+        Without this, _preprocess_dataframe would quietly train on its fill-in
+        defaults (Monday, 08:00, 50 students) for every unreadable value.
+        """
+        day_text = df['day'].astype(str).str.strip()
+        day_ok = day_text.str.capitalize().isin(list(DAY_ALIASES)) | day_text.isin([str(i) for i in range(7)])
+        hour = pd.to_numeric(df['hour'].astype(str).str.strip().str.split(':', n=1).str[0], errors='coerce')
+        attendance = pd.to_numeric(df['attendance'], errors='coerce')
+        valid = df[day_ok & hour.between(0, 23) & attendance.ge(0)]
+        return valid, len(df) - len(valid)
+
+    def digest_and_train(self, new_df, source_digest=None):
+        """Absorb new data into cumulative history and retrain.
+
+        `source_digest` is the content hash of the uploaded file; a file that
+        was already digested is skipped instead of being appended twice.
+        Rows failing _validate_rows are left out and counted in the report.
+        """
+        if source_digest and self.is_digested(source_digest):
+            return self._skipped_report(source_digest), None
+
+        missing = [c for c in INGEST_REQUIRED_COLUMNS if c not in new_df.columns]
+        if missing:
+            return None, f"Missing columns: {', '.join(missing)}"
+        valid, rejected = self._validate_rows(new_df)
+        if valid.empty:
+            return None, "No valid records found in dataset"
+        processed_new = self._preprocess_dataframe(valid)
         
-        if os.path.exists(MASTER_HISTORY_PATH):
-            history_df = pd.read_csv(MASTER_HISTORY_PATH)
-            # Combine logic: if we have thousands of records, we might want to prune, 
-            # but for now, we follow 'learn from everything'
-            cumulative_df = pd.concat([history_df, processed_new], ignore_index=True)
-        else:
-            cumulative_df = processed_new
-            
         # Limit history to latest 10,000 records to maintain performance
-        if len(cumulative_df) > 10000:
-            cumulative_df = cumulative_df.tail(10000)
+        cumulative_df = self._append_tail(self._load_history_tail(), processed_new)
             
         cumulative_df.to_csv(MASTER_HISTORY_PATH, index=False)
-        return self.train_from_history()
+        report, error = self.train_from_history()
+        if error:
+            return report, error
+        if source_digest:
+            self._mark_digested(source_digest, report)
+        return dict(report, ingested_records=len(valid), rejected_records=rejected), None
+
+    def digest_stream(self, stream, job_id, total_bytes=None, source_digest=None, chunksize=INGEST_CHUNK_ROWS):
+        """Chunked variant of digest_and_train for arbitrarily large CSV streams.
+
+        Rows are parsed, validated and preprocessed one chunk at a time and
+        folded into the bounded history tail, so memory stays flat regardless
+        of the upload size. Progress is published under `job_id`.
+        """
+        progress = {'status': 'running', 'rows_processed': 0, 'rows_rejected': 0,
+                    'bytes_read': 0, 'bytes_total': total_bytes,
+                    'started_at': datetime.utcnow().isoformat()}
+        write_ingest_progress(job_id, **progress)
+
+        if source_digest and self.is_digested(source_digest):
+            report = self._skipped_report(source_digest)
+            write_ingest_progress(job_id, **dict(progress, status='skipped'))
+            return report, None
+
+        reader = DigestingReader(stream)
+        tail_df = self._load_history_tail()
+        try:
+            for i, chunk in enumerate(pd.read_csv(io.BufferedReader(reader), chunksize=chunksize)):
+                if i == 0:
+                    missing = [c for c in INGEST_REQUIRED_COLUMNS if c not in chunk.columns]
+                    if missing:
+                        error = f"Missing columns: {', '.join(missing)}"
+                        write_ingest_progress(job_id, **dict(progress, status='failed', error=error))
+                        return None, error
+
+                valid, rejected = self._validate_rows(chunk)
+                progress['rows_rejected'] += rejected
+                if len(valid):
+                    tail_df = self._append_tail(tail_df, self._preprocess_dataframe(valid))
+
+                progress['rows_processed'] += len(chunk)
+                progress['bytes_read'] = reader.bytes_read
+                write_ingest_progress(job_id, **progress)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            write_ingest_progress(job_id, **dict(progress, status='failed', error=str(e)))
+            return None, f"Could not parse CSV: {e}"
+
+        # Raw request streams can only be hashed once fully read
+        source_digest = source_digest or reader.hexdigest()
+        if self.is_digested(source_digest):
+            write_ingest_progress(job_id, **dict(progress, status='skipped'))
+            return self._skipped_report(source_digest), None
+
+        if tail_df is None or tail_df.empty:
+            error = "No valid records found in dataset"
+            write_ingest_progress(job_id, **dict(progress, status='failed', error=error))
+            return None, error
+
+        tail_df.to_csv(MASTER_HISTORY_PATH, index=False)
+        write_ingest_progress(job_id, **dict(progress, status='training'))
+        report, error = self.train_from_history()
+        if error:
+            write_ingest_progress(job_id, **dict(progress, status='failed', error=error))
+            return None, error
+
+        self._mark_digested(source_digest, report)
+        report = dict(report, ingested_records=progress['rows_processed'] - progress['rows_rejected'],
+                      rejected_records=progress['rows_rejected'])
+        write_ingest_progress(job_id, **dict(progress, status='completed', fingerprint=report.get('fingerprint')))
+        return report, None
+
+    def _training_fingerprint(self, df):
+        """Hash of the effective training set plus hyperparameters."""
+        sha = hashlib.sha256()
+        row_hashes = pd.util.hash_pandas_object(df[FEATURES + ['label']], index=False)
+        sha.update(row_hashes.values.tobytes())
+        sha.update(json.dumps(HYPERPARAMS, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _load_cached_artifact(self, fingerprint):
+        model_file = os.path.join(MODEL_CACHE_DIR, f'{fingerprint}.pkl')
+        report_file = os.path.join(MODEL_CACHE_DIR, f'{fingerprint}.json')
+        if not (os.path.exists(model_file) and os.path.exists(report_file)):
+            return None, None
+        try:
+            import joblib
+            model = joblib.load(model_file)
+            with open(report_file) as f:
+                report = json.load(f)
+        except Exception:
+            return None, None
+        def copy(dest):
+            with open(model_file, 'rb') as src:
+                shutil.copyfileobj(src, dest)
+        atomic_write(MODEL_PATH, copy, 'wb')
+        os.utime(model_file)  # keep recently reused artifacts out of pruning
+        return model, report
+
+    def _store_artifact(self, fingerprint, report):
+        import joblib
+
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        atomic_write(os.path.join(MODEL_CACHE_DIR, f'{fingerprint}.pkl'), lambda f: joblib.dump(self.model, f), 'wb')
+        atomic_write(os.path.join(MODEL_CACHE_DIR, f'{fingerprint}.json'), lambda f: json.dump(report, f))
+
+        # Keep only the most recent artifacts on disk
+        artifacts = sorted(
+            (os.path.join(MODEL_CACHE_DIR, name) for name in os.listdir(MODEL_CACHE_DIR) if name.endswith('.pkl')),
+            key=os.path.getmtime, reverse=True
+        )
+        for stale in artifacts[MODEL_CACHE_LIMIT:]:
+            for path in (stale, stale[:-4] + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
 
     def train_from_history(self):
         """Core training logic based on cumulative digested history."""
+        # sklearn and joblib are only needed to train, so serving workers skip them at import
+        import joblib
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import accuracy_score
+
         if not os.path.exists(MASTER_HISTORY_PATH):
             return None, "No history available to train"
             
         df = pd.read_csv(MASTER_HISTORY_PATH)
-        required_features = ['day', 'hour', 'type', 'attendance', 'is_weekend', 'time_bin']
         
         # Ensure all features exist (handle legacy data)
         if 'is_weekend' not in df.columns:
             df = self._preprocess_dataframe(df)
+
+        started = time.perf_counter()
+        # Same training set + same hyperparameters => same model, reuse it
+        fingerprint = self._training_fingerprint(df)
+        model, report = self._load_cached_artifact(fingerprint)
+        if model is not None:
+            self.model = model
+            report = dict(report, cached=True)
+            self.last_training_report = report
+            metrics.TRAIN_SECONDS.observe(time.perf_counter() - started, result='cached')
+            metrics.TRAIN_RECORDS.observe(len(df), result='cached')
+            return report, None
             
-        X = df[required_features]
+        X = df[FEATURES]
         y = df['label']
         
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.15, random_state=42)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=HYPERPARAMS['test_size'], random_state=HYPERPARAMS['random_state']
+        )
         
         # RandomForest with 150 estimators for high-quality interpretability
-        self.model = RandomForestClassifier(n_estimators=150, random_state=42, oob_score=True)
+        self.model = RandomForestClassifier(
+            n_estimators=HYPERPARAMS['n_estimators'],
+            random_state=HYPERPARAMS['random_state'],
+            oob_score=HYPERPARAMS['oob_score']
+        )
         self.model.fit(X_train, y_train)
         
         # Evaluation
         y_pred = self.model.predict(X_test)
         accuracy = accuracy_score(y_test, y_pred)
         
-        joblib.dump(self.model, MODEL_PATH)
+        atomic_write(MODEL_PATH, lambda f: joblib.dump(self.model, f), 'wb')
         
         report = {
             'timestamp': datetime.utcnow().isoformat(),
+            'fingerprint': fingerprint,
             'total_records': len(df),
             'training_records': len(X_train),
             'test_records': len(X_test),
             'accuracy': round(float(accuracy) * 100, 2),
-            'feature_importance': dict(zip(required_features, [round(float(x), 4) for x in self.model.feature_importances_]))
+            'feature_importance': dict(zip(FEATURES, [round(float(x), 4) for x in self.model.feature_importances_]))
         }
+        self._store_artifact(fingerprint, report)
         self.last_training_report = report
+        metrics.TRAIN_SECONDS.observe(time.perf_counter() - started, result='trained')
+        metrics.TRAIN_RECORDS.observe(len(df), result='trained')
         return report, None
 
     def predict(self, day, hour, sub_type, attendance):
@@ -153,24 +451,74 @@ class MLEngine:
         temp_df = pd.DataFrame([{'day': day, 'hour': hour, 'type': sub_type, 'attendance': attendance}])
         processed = self._preprocess_dataframe(temp_df)
         
-        features = ['day', 'hour', 'type', 'attendance', 'is_weekend', 'time_bin']
-        prediction = self.model.predict(processed[features])[0]
-        probabilities = self.model.predict_proba(processed[features])[0]
+        with metrics.PREDICT_SECONDS.time(method='single'):
+            prediction = self.model.predict(processed[FEATURES])[0]
+            probabilities = self.model.predict_proba(processed[FEATURES])[0]
+        metrics.PREDICT_BATCH.observe(1, method='single')
         
         confidence = round(float(np.max(probabilities)) * 100, 1)
-        levels = {0: 'Low', 1: 'Medium', 2: 'High'}
-        result_label = levels[prediction]
+        result_label = LEVELS[prediction]
         
         # Reasoning Engine
         reasoning = self._generate_reasoning(processed, result_label, confidence)
         
         return result_label, int(prediction), reasoning, confidence
 
+    def predict_proba_frame(self, df):
+        """Class probabilities for every row, as an (n, 3) array ordered Low, Medium, High.
+
+        Also returns the preprocessed frame so callers can reuse the parsed features.
+        """
+        if not self.model:
+            self.train_initial_model()
+
+        raw = df.copy()
+        for col in ('day', 'hour', 'type', 'attendance'):
+            if col not in raw.columns:
+                raw[col] = None
+        processed = self._preprocess_dataframe(raw[['day', 'hour', 'type', 'attendance']])
+
+        probabilities = np.zeros((len(processed), len(LEVELS)))
+        with metrics.PREDICT_SECONDS.time(method='frame'):
+            probabilities[:, self.model.classes_.astype(int)] = self.model.predict_proba(processed[FEATURES])
+        metrics.PREDICT_BATCH.observe(len(processed), method='frame')
+        return probabilities, processed
+
+    def predict_frame(self, df):
+        """Vectorized predict() over a whole DataFrame of day/hour/type/attendance rows.
+
+        Returns a DataFrame aligned with `df` holding the occupancy label, level
+        index, confidence, reasoning and recommendation for every row.
+        """
+        probabilities, processed = self.predict_proba_frame(df)
+        level_idx = np.argmax(probabilities, axis=1).astype(int)
+        confidence = np.round(np.max(probabilities, axis=1) * 100, 1)
+        labels = [LEVELS[i] for i in level_idx]
+
+        reasoning = [
+            self._reasoning_text(d, h, w, a, label, conf)
+            for d, h, w, a, label, conf in zip(
+                processed['day'].values, processed['hour'].values, processed['is_weekend'].values,
+                processed['attendance'].values, labels, confidence
+            )
+        ]
+        return pd.DataFrame({
+            'predicted_occupancy': labels,
+            'level_idx': level_idx,
+            'confidence': confidence,
+            'reasoning': reasoning,
+            'recommendation': [self.get_recommendation(i)[0] for i in level_idx]
+        }, index=df.index)
+
     def _generate_reasoning(self, row, label, confidence):
+        return self._reasoning_text(
+            row['day'].iloc[0], row['hour'].iloc[0], row['is_weekend'].iloc[0],
+            row['attendance'].iloc[0], label, confidence
+        )
+
+    def _reasoning_text(self, day_idx, hour, is_weekend, attendance, label, confidence):
         day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        day = day_names[row['day'].iloc[0]]
-        hour = row['hour'].iloc[0]
-        is_weekend = row['is_weekend'].iloc[0]
+        day = day_names[day_idx]
         
         reasons = []
         if is_weekend:
@@ -179,7 +527,7 @@ class MLEngine:
             reasons.append("Current time is outside standard heavy-traffic academic hours.")
         if label == 'High' and confidence > 80:
             reasons.append(f"High-confidence match with past {day} peak performance datasets.")
-        if label == 'Low' and row['attendance'].iloc[0] < 20:
+        if label == 'Low' and attendance < 20:
             reasons.append("Projected attendance is very low, aligning with historical efficiency profiles.")
             
         if not reasons:
@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
 from datetime import datetime
+from timeslots import week_window
 
 db = SQLAlchemy()
 
@@ -24,6 +26,9 @@ class Classroom(db.Model):
     num_lights = db.Column(db.Integer, default=8)
     num_acs = db.Column(db.Integer, default=2)
     num_fans = db.Column(db.Integer, default=4)
+    # HVAC thermal response; NULL falls back to HVAC_RAMP_MINUTES / HVAC_COAST_MINUTES
+    thermal_ramp_minutes = db.Column(db.Integer)
+    thermal_coast_minutes = db.Column(db.Integer)
     is_active = db.Column(db.Boolean, default=True)
 
 class Timetable(db.Model):
@@ -36,9 +41,18 @@ class Timetable(db.Model):
     teacher_name = db.Column(db.String(100))
     teacher_email = db.Column(db.String(120))
     expected_attendance = db.Column(db.Float)
+    # Normalized [start, end) window in minutes since Monday 00:00, kept in sync on write
+    start_minute = db.Column(db.Integer, index=True)
+    end_minute = db.Column(db.Integer, index=True)
+    conflict_flag = db.Column(db.String(100))  # e.g. 'overlap,over_capacity' when imported with on_conflict=flag
     
     classroom = db.relationship('Classroom', backref=db.backref('schedules', lazy=True))
 
+@event.listens_for(Timetable, 'before_insert')
+@event.listens_for(Timetable, 'before_update')
+def _sync_timetable_window(mapper, connection, target):
+    target.start_minute, target.end_minute = week_window(target.day_of_week, target.time_slot)
+
 class AttendanceHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timetable_id = db.Column(db.Integer, db.ForeignKey('timetable.id'), nullable=False)
@@ -57,7 +71,7 @@ class AttendanceHistory(db.Model):
 class EnergyDecision(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     predicted_occupancy = db.Column(db.String(20)) # Low, Medium, High
     lights_action = db.Column(db.String(10)) # ON, OFF, DIM
     ac_action = db.Column(db.String(10)) # ON, OFF
@@ -65,6 +79,17 @@ class EnergyDecision(db.Model):
     
     classroom = db.relationship('Classroom', backref=db.backref('decisions', lazy=True))
 
+# Hourly decision aggregates per room and day for the analytics API. `hourly` is a
+# float32 (5, 24) array: kWh saved, decisions, Low, Medium, High counts per hour.
+class DecisionRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    classroom_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    hourly = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('classroom_id', 'day', name='uq_rollup_room_day'),)
+
 # NEW: Energy Analytics for reporting
 class DailyEnergyLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -84,3 +109,91 @@ class Notification(db.Model):
     created_by = db.Column(db.String(80), nullable=True)     # admin username who approved
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Precomputed occupancy predictions for upcoming timetable sessions
+class PredictionSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    timetable_id = db.Column(db.Integer, db.ForeignKey('timetable.id', ondelete='CASCADE'), nullable=False, index=True)
+    target_date = db.Column(db.Date, nullable=False, index=True)
+    predicted_occupancy = db.Column(db.String(20))  # Low, Medium, High
+    level_idx = db.Column(db.Integer)
+    confidence = db.Column(db.Float)
+    reasoning = db.Column(db.String(500))
+    recommendation = db.Column(db.String(100))
+    input_hash = db.Column(db.String(40))      # day/time/type/attendance the row was scored from
+    model_version = db.Column(db.String(64))   # digest of the model file that scored it
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('timetable_id', 'target_date', name='uq_snapshot_entry_date'),)
+
+# Per-table change counters backing the versioned response cache
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Last state each room's device bank was confirmed in, used to skip no-op commands
+class DeviceState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id', ondelete='CASCADE'), nullable=False)
+    device = db.Column(db.String(10), nullable=False)   # lights, ac, fans
+    state = db.Column(db.String(10), nullable=False)    # ON, OFF, DIM
+    level = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('classroom_id', 'device', name='uq_device_state_room_device'),)
+
+# Outbound actuation commands and their delivery lifecycle
+class DeviceCommand(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id', ondelete='CASCADE'), nullable=False, index=True)
+    building = db.Column(db.String(50))
+    device = db.Column(db.String(10), nullable=False)
+    state = db.Column(db.String(10), nullable=False)
+    level = db.Column(db.Float, default=0)
+    decision_id = db.Column(db.Integer, db.ForeignKey('energy_decision.id', ondelete='SET NULL'), nullable=True)
+    status = db.Column(db.String(10), default='pending', index=True)  # pending, sending, sent, acked, failed, superseded
+    attempts = db.Column(db.Integer, default=0)
+    claim_token = db.Column(db.String(32))
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    acked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+
+def upgrade_schema(engine):
+    """Bring a database created by an older release up to these models. Safe to run repeatedly.
+
+    create_all() only creates missing tables, so columns and indexes added to
+    existing tables are added here (all such columns are nullable, which
+    ADD COLUMN supports everywhere). Timetable rows written before start_minute /
+    end_minute existed get their windows backfilled from day_of_week / time_slot.
+    Returns the names of the columns added.
+    """
+    from sqlalchemy import inspect, text, bindparam
+
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                                      f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"))
+                    added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+        timetable = Timetable.__table__
+        stale = conn.execute(db.select(timetable.c.id, timetable.c.day_of_week, timetable.c.time_slot)
+                             .where(timetable.c.start_minute.is_(None))).all()
+        windows = [{'row_id': row.id, 'start': start, 'end': end}
+                   for row in stale for start, end in [week_window(row.day_of_week, row.time_slot)] if start is not None]
+        if windows:
+            conn.execute(timetable.update().where(timetable.c.id == bindparam('row_id'))
+                         .values(start_minute=bindparam('start'), end_minute=bindparam('end')), windows)
+    return added
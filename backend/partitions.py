@@ -0,0 +1,152 @@
+"""
+Time-partitioned tables.
+
+High-volume, append-only data is spread across one physical table per day
+(or month), named `<prefix>_YYYYMMDD` / `<prefix>_YYYYMM`. Writers pick the
+partition for a row's timestamp, readers only touch partitions inside the
+requested range, and retention drops whole tables instead of deleting rows.
+Partition tables live outside `db.Model`, so `db.create_all()` never creates
+them; they are created on first write.
+
+With `native_parent` set, PostgreSQL gets a declaratively partitioned parent
+table (PARTITION BY RANGE on `time_column`) and each partition is attached to
+it, so the planner prunes partitions itself. Other databases fall back to
+plain per-period tables combined with UNION ALL.
+"""
+import time
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import MetaData, Table, inspect, union_all, select, text
+from sqlalchemy.exc import DatabaseError
+
+class TimePartitions:
+    """Registry of the physical tables behind one partitioned dataset."""
+    # Partitions created by other workers become visible after at most this long
+    REFRESH_SECONDS = 30
+    def __init__(self, prefix, columns, indexes=(), granularity='day', native_parent=None, time_column=None):
+        # columns / indexes: callables returning fresh Column / Index objects per table
+        self.prefix = prefix
+        self.columns = columns
+        self.indexes = indexes
+        self.granularity = granularity
+        self.native_parent = native_parent
+        self.time_column = time_column
+        self.metadata = MetaData()
+        self._known = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def key(self, moment):
+        """Partition start date for a datetime or date."""
+        day = moment.date() if isinstance(moment, datetime) else moment
+        return day if self.granularity == 'day' else day.replace(day=1)
+
+    def next_key(self, key):
+        if self.granularity == 'day':
+            return key + timedelta(days=1)
+        return (key.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def table_name(self, key):
+        return f"{self.prefix}_{key:%Y%m%d}" if self.granularity == 'day' else f"{self.prefix}_{key:%Y%m}"
+
+    def parse_name(self, name):
+        suffix = name[len(self.prefix) + 1:]
+        try:
+            if self.granularity == 'day' and len(suffix) == 8:
+                return datetime.strptime(suffix, '%Y%m%d').date()
+            if self.granularity == 'month' and len(suffix) == 6:
+                return datetime.strptime(suffix, '%Y%m').date()
+        except ValueError:
+            pass
+        return None
+
+    def _table(self, key):
+        name = self.table_name(key)
+        if name not in self.metadata.tables:
+            Table(name, self.metadata, *self.columns(), *[index(name) for index in self.indexes])
+        return self.metadata.tables[name]
+
+    def is_native(self, engine):
+        return bool(self.native_parent) and engine.dialect.name == 'postgresql'
+
+    def _parent(self):
+        if self.native_parent not in self.metadata.tables:
+            Table(self.native_parent, self.metadata, *self.columns(),
+                  *[index(self.native_parent) for index in self.indexes],
+                  postgresql_partition_by=f'RANGE ({self.time_column})')
+        return self.metadata.tables[self.native_parent]
+
+    def _create(self, engine, key):
+        table = self._table(key)
+        if not self.is_native(engine):
+            table.create(engine, checkfirst=True)
+            return table
+        # Indexes declared on the parent are created on every attached partition
+        self._parent().create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table.name} PARTITION OF {self.native_parent} "
+                f"FOR VALUES FROM ('{key.isoformat()}') TO ('{self.next_key(key).isoformat()}')"
+            ))
+        return table
+
+    def existing(self, engine, refresh=False):
+        """{partition key: Table} for every partition table present in the database."""
+        with self._lock:
+            stale = time.monotonic() - self._loaded_at > self.REFRESH_SECONDS
+            if self._known is None or refresh or stale:
+                found = {}
+                for name in inspect(engine).get_table_names():
+                    if name.startswith(self.prefix + '_'):
+                        key = self.parse_name(name)
+                        if key is not None:
+                            found[key] = self._table(key)
+                self._known = found
+                self._loaded_at = time.monotonic()
+            return dict(self._known)
+
+    def ensure(self, engine, key):
+        """Table for a partition key, created if it does not exist yet."""
+        known = self.existing(engine)
+        if key in known:
+            return known[key]
+        table = self._table(key)
+        try:
+            self._create(engine, key)
+        except DatabaseError:
+            # Another worker created it between our check and CREATE TABLE
+            if not inspect(engine).has_table(table.name):
+                raise
+        with self._lock:
+            self._known[key] = table
+        return table
+
+    def between(self, engine, start=None, end=None):
+        """Partitions overlapping [start, end], oldest first."""
+        start_key = self.key(start) if start else None
+        end_key = self.key(end) if end else None
+        return [(key, table) for key, table in sorted(self.existing(engine).items())
+                if (start_key is None or key >= start_key) and (end_key is None or key <= end_key)]
+
+    def drop(self, engine, key):
+        table = self.existing(engine).get(key)
+        if table is None:
+            return False
+        table.drop(engine, checkfirst=True)
+        with self._lock:
+            self._known.pop(key, None)
+        self.metadata.remove(table)
+        return True
+
+    def union(self, engine, start=None, end=None, columns=None):
+        """A selectable spanning every partition in range (None when there are none)."""
+        parts = self.between(engine, start, end)
+        if not parts:
+            return None
+        if self.is_native(engine):
+            # The parent already spans every partition; callers' time filters drive pruning
+            parent = self._parent()
+            return select(*(parent.c[name] for name in columns) if columns else parent.c).subquery()
+        selects = [select(*(table.c[name] for name in columns) if columns else table.c) for _, table in parts]
+        return (selects[0] if len(selects) == 1 else union_all(*selects)).subquery()
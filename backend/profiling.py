@@ -0,0 +1,291 @@
+"""
+On-demand request profiling: a statistical stack sampler plus an SQL tracer.
+
+A request is profiled when an admin sends the `X-Profile` header or when it
+falls inside PROFILE_SAMPLE_RATE. While it runs, a background thread samples
+the request thread's stack every few milliseconds and every SQL statement is
+recorded with its duration and the application line that issued it. Each
+profile is written to PROFILE_DIR as:
+
+  <id>.folded  collapsed stacks ("a;b;c <samples>"), the input format of
+               flamegraph.pl and speedscope
+  <id>.json    request summary, SQL statements, repeated statements and
+               suspected N+1 patterns
+
+Requests that are not profiled pay for one header lookup; the SQL listeners
+are only attached the first time a profile starts.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+MAX_STATEMENTS = 500
+MAX_STACK_DEPTH = 128
+
+_active = threading.local()
+_listening = False
+_listen_lock = threading.Lock()
+
+class StackSampler:
+    """Samples one thread's Python stack on a fixed interval from a helper thread."""
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+class SqlTrace:
+    """Statements executed by one request, with timings and the app code that issued them."""
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.statements = []
+        self.count = 0
+        self.seconds = 0.0
+
+    def call_site(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(self.root_path) and 'site-packages' not in filename \
+                    and not filename.endswith('profiling.py'):
+                return f'{os.path.relpath(filename, self.root_path)}:{frame.f_lineno}'
+            frame = frame.f_back
+        return None
+
+    def record(self, statement, seconds, site):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append({'sql': statement, 'ms': round(seconds * 1000, 3), 'site': site})
+
+def normalize_sql(statement):
+    """Statement shape with literals and IN-list lengths removed, so repeats group together."""
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(\.\d+)?\b', '?', shape)
+    shape = re.sub(r'%\(\w+\)s|:\w+|\$\d+|%s', '?', shape)
+    shape = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', shape)
+    return ' '.join(shape.split())
+
+def repeated_statements(statements, threshold):
+    """Statements issued at least `threshold` times; SELECTs from one call site are flagged as N+1."""
+    groups = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'sites': Counter()})
+    for entry in statements:
+        group = groups[normalize_sql(entry['sql'])]
+        group['count'] += 1
+        group['ms'] += entry['ms']
+        group['sites'][entry['site']] += 1
+    repeated = []
+    for shape, group in groups.items():
+        if group['count'] < threshold:
+            continue
+        site, site_count = group['sites'].most_common(1)[0]
+        repeated.append({
+            'sql': shape,
+            'count': group['count'],
+            'total_ms': round(group['ms'], 3),
+            'site': site,
+            'n_plus_one': shape.upper().startswith('SELECT') and site_count >= threshold,
+        })
+    return sorted(repeated, key=lambda r: r['total_ms'], reverse=True)
+
+# --- SQLAlchemy hooks ---------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = getattr(_active, 'trace', None)
+    if trace is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = getattr(_active, 'trace', None)
+    started = conn.info.get('profile_started')
+    if trace is None or not started:
+        return
+    trace.record(statement, time.perf_counter() - started.pop(), trace.call_site())
+
+def _listen():
+    global _listening
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _listening = True
+
+# --- Stored profiles ----------------------------------------------------------------
+
+def _profile_path(directory, profile_id, suffix):
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    return os.path.join(directory, f'{profile_id}{suffix}')
+
+def save_profile(directory, profile_id, summary, folded, keep):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{profile_id}.folded'), 'w') as f:
+        f.write(folded)
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    # Keep only the newest profiles on disk
+    summaries = sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+    for stale in summaries[keep:]:
+        for suffix in ('.json', '.folded'):
+            path = os.path.join(directory, stale[:-5] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+def list_profiles(directory, limit=50):
+    """Newest-first summaries without the statement lists."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(directory, name)) as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary.pop('statements', None)
+        profiles.append(summary)
+    return profiles
+
+def load_profile(directory, profile_id):
+    path = _profile_path(directory, profile_id, '.json')
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def load_folded(directory, profile_id):
+    path = _profile_path(directory, profile_id, '.folded')
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+# --- Flask hooks --------------------------------------------------------------------
+
+def _requested_by_admin(header):
+    """True when the profiling header comes with a valid admin token."""
+    from flask import request
+    from flask_jwt_extended import verify_jwt_in_request, get_jwt
+    from security import current_identity
+
+    if not request.headers.get(header):
+        return False
+    try:
+        if not verify_jwt_in_request(optional=True) or get_jwt().get('role') != 'admin':
+            return False
+        identity = current_identity()
+    except Exception:
+        return False  # the route reports bad tokens itself
+    return bool(identity and identity['role'] == 'admin')
+
+def init_app(app):
+    """Start a profile for admin-flagged or sampled requests and save it once the response is built."""
+    from flask import g, request
+
+    if not app.config.get('PROFILING_ENABLED', True):
+        return
+    header = app.config.get('PROFILE_HEADER', 'X-Profile')
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    interval = app.config.get('PROFILE_INTERVAL_MS', 5) / 1000.0
+    directory = app.config.get('PROFILE_DIR', 'logs/profiles')
+    keep = app.config.get('PROFILE_KEEP', 200)
+    threshold = app.config.get('PROFILE_N_PLUS_ONE_THRESHOLD', 5)
+
+    @app.before_request
+    def _start_profile():
+        if header in request.headers:
+            trigger = 'header' if _requested_by_admin(header) else None
+        else:
+            trigger = 'sample' if rate and random.random() < rate else None
+        if trigger is None:
+            return
+        _listen()
+        _active.trace = SqlTrace(app.root_path)
+        g.profile = {
+            'trigger': trigger,
+            'started': time.perf_counter(),
+            'started_at': datetime.utcnow().isoformat(),
+            'sampler': StackSampler(threading.get_ident(), interval).start(),
+        }
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        duration = time.perf_counter() - profile['started']
+        profile['sampler'].stop()
+        trace, _active.trace = _active.trace, None
+
+        profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        repeated = repeated_statements(trace.statements, threshold)
+        summary = {
+            'id': profile_id,
+            'request_id': g.get('request_id'),
+            'trigger': profile['trigger'],
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'started_at': profile['started_at'],
+            'duration_ms': round(duration * 1000, 3),
+            'samples': profile['sampler'].samples,
+            'interval_ms': round(interval * 1000, 3),
+            'sql_count': trace.count,
+            'sql_ms': round(trace.seconds * 1000, 3),
+            'n_plus_one': [r for r in repeated if r['n_plus_one']],
+            'repeated': repeated,
+            'statements': trace.statements,
+        }
+        try:
+            save_profile(directory, profile_id, summary, profile['sampler'].folded(), keep)
+            response.headers['X-Profile-Id'] = profile_id
+        except OSError as e:
+            app.logger.error(f">>> PROFILER: Could not save profile: {e}")
+        return response
+
+    @app.teardown_request
+    def _clear_trace(exc):
+        # An exception skips after_request; never leave the tracer attached to the thread
+        _active.trace = None
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile['sampler'].stop()
@@ -0,0 +1,311 @@
+"""
+Energy decision retention: hot table, monthly partitions and cold archive.
+
+Decisions live in three tiers:
+
+* hot     - the `energy_decision` table, the last ENERGY_HOT_DAYS days. Every
+            writer, the actuation dispatcher and the device command foreign
+            key keep using it unchanged.
+* warm    - one table per month (`energy_decision_YYYYMM`). On PostgreSQL they
+            are native range partitions of `energy_decision_history`.
+* archive - months older than ENERGY_ARCHIVE_AFTER_MONTHS are written to a
+            compressed columnar file (Parquet when pyarrow is installed,
+            otherwise a compressed NumPy .npz with one array per column) and
+            their table is dropped. A manifest keeps per-building totals so
+            all-time figures never have to open the files.
+
+`savings_by_building()` answers "kWh saved and decisions per building over a
+date range" across all three tiers, opening an archive file only for a
+month the range cuts through.
+"""
+import os
+import json
+import threading
+import importlib.util
+from datetime import datetime, date, timedelta
+
+import numpy as np
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, select, func, delete
+
+from partitions import TimePartitions
+
+# Optional: archives fall back to .npz. Imported when an archive is written or read
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+ARCHIVE_COLUMNS = ['id', 'classroom_id', 'building', 'timestamp', 'predicted_occupancy',
+                   'lights_action', 'ac_action', 'energy_saved_kwh']
+MANIFEST_NAME = 'manifest.json'
+
+def _decision_columns():
+    # PostgreSQL requires the partition key in the primary key of a partitioned table
+    return [
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('timestamp', DateTime, primary_key=True),
+        Column('classroom_id', Integer, nullable=False),
+        Column('predicted_occupancy', String(20)),
+        Column('lights_action', String(10)),
+        Column('ac_action', String(10)),
+        Column('energy_saved_kwh', Float),
+    ]
+
+decision_partitions = TimePartitions(
+    'energy_decision', _decision_columns,
+    indexes=[lambda name: Index(f'ix_{name}_room_time', 'classroom_id', 'timestamp')],
+    granularity='month', native_parent='energy_decision_history', time_column='timestamp'
+)
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+# --- Columnar archive files ---------------------------------------------------
+
+def write_columns(path_base, frame):
+    """Write a frame to `<path_base>.parquet` (or `.npz`). Returns the file name."""
+    import pandas as pd
+    if HAS_PYARROW:
+        import pyarrow
+        import pyarrow.parquet as pq
+        path = path_base + '.parquet'
+        tmp = path + '.tmp'
+        pq.write_table(pyarrow.Table.from_pandas(frame, preserve_index=False), tmp, compression='zstd')
+    else:
+        path = path_base + '.npz'
+        tmp = path + '.tmp.npz'
+        arrays = {}
+        for name in frame.columns:
+            column = frame[name]
+            if name == 'timestamp':
+                arrays[name] = column.to_numpy(dtype='datetime64[us]').astype('int64')
+            elif pd.api.types.is_numeric_dtype(column):
+                arrays[name] = column.to_numpy()
+            else:
+                arrays[name] = column.fillna('').to_numpy().astype(str)
+        np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+    return os.path.basename(path)
+
+def read_columns(path, columns=None):
+    """DataFrame from an archive file written by write_columns()."""
+    import pandas as pd
+    if path.endswith('.parquet'):
+        if not HAS_PYARROW:
+            raise RuntimeError(f"pyarrow is required to read {os.path.basename(path)}")
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns).to_pandas()
+    with np.load(path, allow_pickle=False) as data:
+        names = columns or list(data.files)
+        frame = pd.DataFrame({name: data[name] for name in names})
+    if 'timestamp' in frame:
+        frame['timestamp'] = frame['timestamp'].astype('datetime64[us]')
+    return frame
+
+class DecisionArchive:
+    """Archive directory plus its manifest of archived months."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._cached = (None, {})
+
+    def months(self):
+        """{'YYYYMM': entry}, re-read only when the manifest file changes."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return {}
+        with self._lock:
+            if self._cached[0] != mtime:
+                with open(self.path) as f:
+                    self._cached = (mtime, json.load(f))
+            return self._cached[1]
+
+    def record(self, month_key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            months = {}
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    months = json.load(f)
+            months[month_key] = entry
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(months, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._cached = (None, {})
+
+    def frame(self, month_key, columns=None):
+        entry = self.months()[month_key]
+        return read_columns(os.path.join(self.directory, entry['file']), columns)
+
+_archives = {}
+
+def get_archive(config):
+    directory = config['ENERGY_ARCHIVE_DIR']
+    if directory not in _archives:
+        _archives[directory] = DecisionArchive(directory)
+    return _archives[directory]
+
+# --- Tier movement --------------------------------------------------------------
+
+def roll_hot(engine, cutoff):
+    """Move hot rows older than `cutoff` into their monthly partitions. Returns rows moved."""
+    from models import EnergyDecision
+
+    hot = EnergyDecision.__table__
+    with engine.connect() as conn:
+        oldest, newest_id = conn.execute(select(func.min(hot.c.timestamp), func.max(hot.c.id))).one()
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    moved = 0
+    month = decision_partitions.key(oldest)
+    while _as_datetime(month) < cutoff:
+        upper = min(_as_datetime(decision_partitions.next_key(month)), cutoff)
+        window = [hot.c.timestamp >= _as_datetime(month), hot.c.timestamp < upper,
+                  # SQLite reuses the highest rowid once it is deleted, which would rewind
+                  # the actuation watermark; the newest decision always stays hot.
+                  hot.c.id < newest_id]
+        table = decision_partitions.ensure(engine, month)
+        names = [c.name for c in table.columns]
+        with engine.begin() as conn:
+            result = conn.execute(table.insert().from_select(names, select(*(hot.c[n] for n in names)).where(*window)))
+            conn.execute(delete(hot).where(*window))
+            moved += max(result.rowcount or 0, 0)
+        month = decision_partitions.next_key(month)
+    return moved
+
+def archive_month(engine, archive, month):
+    """Write one monthly partition to the archive and drop its table."""
+    import pandas as pd
+    from models import Classroom
+
+    table = decision_partitions.existing(engine)[month]
+    rooms = Classroom.__table__
+    query = select(*(table.c[n] for n in ARCHIVE_COLUMNS if n != 'building'), rooms.c.building) \
+        .select_from(table.outerjoin(rooms, rooms.c.id == table.c.classroom_id)).order_by(table.c.timestamp)
+    with engine.connect() as conn:
+        frame = pd.DataFrame(conn.execute(query).fetchall(), columns=[n for n in ARCHIVE_COLUMNS if n != 'building'] + ['building'])
+    frame = frame[ARCHIVE_COLUMNS]
+    frame['building'] = frame['building'].fillna('')
+    frame['energy_saved_kwh'] = frame['energy_saved_kwh'].fillna(0.0).astype(float)
+
+    month_key = f"{month:%Y%m}"
+    os.makedirs(archive.directory, exist_ok=True)
+    file_name = write_columns(os.path.join(archive.directory, f"energy_decision_{month_key}"), frame)
+    totals = frame.groupby('building')['energy_saved_kwh'].agg(['sum', 'count'])
+    archive.record(month_key, {
+        'file': file_name,
+        'start': month.isoformat(),
+        'end': decision_partitions.next_key(month).isoformat(),
+        'rows': int(len(frame)),
+        'buildings': {b: {'kwh': float(r['sum']), 'decisions': int(r['count'])} for b, r in totals.iterrows()},
+        'archived_at': datetime.utcnow().isoformat(timespec='seconds')
+    })
+    # Only drop once the file and its manifest entry are on disk
+    decision_partitions.drop(engine, month)
+    return int(len(frame))
+
+def apply_retention(engine, config, now=None, dry_run=False):
+    """Run the retention policy once. Returns a summary of what moved (or would move)."""
+    now = now or datetime.utcnow()
+    hot_cutoff = now - timedelta(days=config['ENERGY_HOT_DAYS'])
+    archive_before = decision_partitions.key(now)
+    for _ in range(config['ENERGY_ARCHIVE_AFTER_MONTHS']):
+        archive_before = (archive_before - timedelta(days=1)).replace(day=1)
+    archive = get_archive(config)
+
+    summary = {'hot_cutoff': hot_cutoff.isoformat(timespec='seconds'), 'archive_before': archive_before.isoformat(),
+               'moved_rows': 0, 'archived_months': [], 'archived_rows': 0, 'dry_run': dry_run}
+    if dry_run:
+        from models import EnergyDecision
+        with engine.connect() as conn:
+            summary['moved_rows'] = conn.execute(select(func.count()).select_from(EnergyDecision.__table__)
+                                                 .where(EnergyDecision.timestamp < hot_cutoff)).scalar() or 0
+        summary['archived_months'] = [f"{k:%Y%m}" for k, _ in decision_partitions.between(engine)
+                                      if decision_partitions.next_key(k) <= archive_before]
+        return summary
+
+    # Analytics rollups only read the hot table incrementally; fold in what is about to leave it
+    from analytics_engine import refresh_rollups
+    refresh_rollups(engine, config)
+    summary['moved_rows'] = roll_hot(engine, hot_cutoff)
+    for month, _ in decision_partitions.between(engine):
+        if decision_partitions.next_key(month) <= archive_before:
+            summary['archived_rows'] += archive_month(engine, archive, month)
+            summary['archived_months'].append(f"{month:%Y%m}")
+    return summary
+
+def retention_status(engine, config):
+    """Row counts per tier, for the admin endpoint."""
+    from models import EnergyDecision
+
+    with engine.connect() as conn:
+        hot_rows, oldest = conn.execute(select(func.count(), func.min(EnergyDecision.timestamp))
+                                        .select_from(EnergyDecision.__table__)).one()
+        partitions = []
+        for month, table in decision_partitions.between(engine):
+            partitions.append({'month': f"{month:%Y%m}", 'table': table.name,
+                               'rows': conn.execute(select(func.count()).select_from(table)).scalar()})
+    archived = get_archive(config).months()
+    return {
+        'hot': {'rows': hot_rows, 'oldest': oldest.isoformat() if oldest else None},
+        'partitions': partitions,
+        'native_partitioning': decision_partitions.is_native(engine),
+        'archive': [{'month': k, 'rows': v['rows'], 'file': v['file']} for k, v in sorted(archived.items())],
+        'archive_format': 'parquet' if HAS_PYARROW else 'npz'
+    }
+
+# --- Queries spanning every tier ----------------------------------------------------
+
+def _add(totals, building, kwh, count):
+    entry = totals.setdefault(building or '', {'kwh': 0.0, 'decisions': 0})
+    entry['kwh'] += float(kwh or 0)
+    entry['decisions'] += int(count or 0)
+
+def savings_by_building(engine, config, start=None, end=None):
+    """{building: {'kwh', 'decisions'}} for decisions in [start, end) across hot, warm and archive."""
+    from models import EnergyDecision, Classroom
+
+    start, end = _as_datetime(start), _as_datetime(end)
+    rooms = Classroom.__table__
+    totals = {}
+
+    def grouped(source):
+        query = select(rooms.c.building, func.sum(source.c.energy_saved_kwh), func.count()) \
+            .select_from(source.outerjoin(rooms, rooms.c.id == source.c.classroom_id)).group_by(rooms.c.building)
+        if start is not None:
+            query = query.where(source.c.timestamp >= start)
+        if end is not None:
+            query = query.where(source.c.timestamp < end)
+        return query
+
+    with engine.connect() as conn:
+        for building, kwh, count in conn.execute(grouped(EnergyDecision.__table__)):
+            _add(totals, building, kwh, count)
+        warm = decision_partitions.union(engine, start, end)
+        if warm is not None:
+            for building, kwh, count in conn.execute(grouped(warm)):
+                _add(totals, building, kwh, count)
+
+    archive = get_archive(config)
+    for month_key, entry in archive.months().items():
+        month_start = _as_datetime(date.fromisoformat(entry['start']))
+        month_end = _as_datetime(date.fromisoformat(entry['end']))
+        if (end is not None and month_start >= end) or (start is not None and month_end <= start):
+            continue
+        if (start is None or start <= month_start) and (end is None or month_end <= end):
+            for building, values in entry['buildings'].items():
+                _add(totals, building, values['kwh'], values['decisions'])
+            continue
+        # The range cuts through this month: read just the columns we need
+        frame = archive.frame(month_key, ['building', 'timestamp', 'energy_saved_kwh'])
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= (frame['timestamp'] >= start).to_numpy()
+        if end is not None:
+            mask &= (frame['timestamp'] < end).to_numpy()
+        for building, group in frame[mask].groupby('building'):
+            _add(totals, building, group['energy_saved_kwh'].sum(), len(group))
+    return totals
@@ -0,0 +1,56 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from models import db, DeviceCommand, DeviceState
+from security import admin_required, authorize_device
+from actuation import get_dispatcher
+
+actuation_bp = Blueprint('actuation', __name__)
+
+@actuation_bp.route('/api/actuation/status', methods=['GET'])
+@jwt_required()
+def actuation_status():
+    """Command counts by status, recent failures and confirmed device states."""
+    dispatcher = get_dispatcher(current_app)
+    counts = dict(db.session.query(DeviceCommand.status, db.func.count(DeviceCommand.id))
+                  .group_by(DeviceCommand.status).all())
+    states = dict(db.session.query(DeviceState.state, db.func.count(DeviceState.id))
+                  .group_by(DeviceState.state).all())
+    failures = DeviceCommand.query.filter_by(status='failed').order_by(DeviceCommand.id.desc()).limit(10).all()
+    return jsonify({
+        'success': True,
+        'enabled': dispatcher is not None,
+        'transport': dispatcher.transport.name if dispatcher else None,
+        'commands': counts,
+        'device_states': states,
+        'recent_failures': [{
+            'id': c.id, 'classroom_id': c.classroom_id, 'device': c.device, 'state': c.state,
+            'attempts': c.attempts, 'error': c.last_error
+        } for c in failures]
+    })
+
+@actuation_bp.route('/api/actuation/dispatch', methods=['POST'])
+@admin_required
+def dispatch_now():
+    """Run one planning + delivery pass immediately instead of waiting for the next tick."""
+    dispatcher = get_dispatcher(current_app)
+    if dispatcher is None:
+        return jsonify({'success': False, 'message': 'Actuation is disabled (ACTUATION_ENABLED)'}), 409
+    return jsonify({'success': True, 'summary': dispatcher.tick()})
+
+@actuation_bp.route('/api/actuation/acks', methods=['POST'])
+def acknowledge_commands():
+    """Gateways without a broker connection confirm delivery here: {"ids": [...]}.
+
+    Acks record confirmed device states, so they need the device key, or an
+    admin token when no SENSOR_INGEST_KEY is configured.
+    """
+    if not authorize_device(admin_only=True):
+        return jsonify({'success': False, 'message': 'Device key or admin access required'}), 401
+    dispatcher = get_dispatcher(current_app)
+    if dispatcher is None:
+        return jsonify({'success': False, 'message': 'Actuation is disabled (ACTUATION_ENABLED)'}), 409
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list):
+        return jsonify({'success': False, 'message': 'Expected {"ids": [...]}'}), 400
+    dispatcher.handle_acks([int(i) for i in ids if str(i).isdigit()])
+    return jsonify({'success': True})
@@ -1,31 +1,38 @@
-from flask import Blueprint, jsonify
-from models import db, Classroom, EnergyDecision
-from services import EnergyService, ReportingService
+from flask import Blueprint, jsonify, current_app
+from models import db, Classroom
+from services import EnergyService, ReportingService, CacheService
+import energy_engine
+import retention
+import analytics_engine
 
 analytics_bp = Blueprint('analytics', __name__)
 
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User
+from flask_jwt_extended import jwt_required
+from security import current_identity
 
 @analytics_bp.route('/api/dashboard/stats', methods=['GET'])
 @jwt_required()
 def get_stats():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_identity()
     
-    decisions = EnergyDecision.query.count()
-    savings = db.session.query(db.func.sum(EnergyDecision.energy_saved_kwh)).scalar() or 0
+    # Savings per building so each building's tariff and emission factor apply,
+    # spanning the hot table, monthly partitions and archived months
+    history = retention.savings_by_building(db.engine, current_app.config)
+    decisions = sum(entry['decisions'] for entry in history.values())
+    by_building = {building: entry['kwh'] for building, entry in history.items()}
+    totals = energy_engine.savings_summary(by_building, current_app.config)
     
     stats = {
-        'energy_saved': round(savings, 1),
+        'energy_saved': totals['energy_saved'],
+        'cost_saved': totals['cost_saved'],
         'active_classrooms': Classroom.query.filter_by(is_active=True).count(),
-        'avg_occupancy': 68,
-        'co2_reduced': round(savings * 0.0005, 2),
+        'avg_occupancy': analytics_engine.average_occupancy(db.engine, current_app.config),
+        'co2_reduced': totals['co2_reduced'],
         'total_decisions': decisions
     }
 
     # 🔒 Strict Admin-Only Metrics (as requested)
-    if user and user.role == 'admin':
+    if user and user['role'] == 'admin':
         weekly_stats = ReportingService.generate_weekly_stats()
         stats.update({
             'saved_today': ReportingService.get_today_savings(),
@@ -36,6 +43,46 @@ def get_stats():
     
     return jsonify(stats)
 
+@analytics_bp.route('/api/analytics/series', methods=['GET'])
+@jwt_required()
+def get_analytics_series():
+    """Savings, decisions and occupancy per time bucket.
+
+    Query: start, end (ISO dates, end exclusive; default last 30 days), grain=hour|day|week,
+    group_by=building|classroom|none, optional building / classroom_id filters and
+    metrics=energy_saved,decisions,occupancy_pct,low,medium,high.
+    """
+    from flask import request
+
+    grain = request.args.get('grain', 'day')
+    group_by = request.args.get('group_by', 'building')
+    if grain not in analytics_engine.GRAINS:
+        return jsonify({'success': False, 'message': f"grain must be one of {', '.join(analytics_engine.GRAINS)}"}), 400
+    if group_by not in analytics_engine.GROUPS:
+        return jsonify({'success': False, 'message': f"group_by must be one of {', '.join(analytics_engine.GROUPS)}"}), 400
+    window, error = analytics_engine.parse_range(request.args.get('start'), request.args.get('end'),
+                                                 max_days=current_app.config.get('ANALYTICS_MAX_DAYS'))
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    metrics = tuple(m for m in request.args.get('metrics', ','.join(analytics_engine.DEFAULT_METRICS)).split(',') if m)
+    unknown = [m for m in metrics if m not in analytics_engine.METRICS]
+    if unknown:
+        return jsonify({'success': False, 'message': f"Unknown metrics: {', '.join(unknown)}"}), 400
+    # Canonical order and no repeats, so the cache key space stays small
+    metrics = tuple(m for m in analytics_engine.METRICS if m in metrics)
+    building = request.args.get('building') or None
+    if building and not Classroom.query.filter_by(building=building).first():
+        return jsonify({'success': False, 'message': 'Unknown building'}), 400
+    classroom_id = request.args.get('classroom_id', type=int)
+    if classroom_id is not None and not Classroom.query.get(classroom_id):
+        return jsonify({'success': False, 'message': 'Unknown classroom'}), 400
+
+    start, end = window
+    key = f"analytics:{start.isoformat()}:{end.isoformat()}:{grain}:{group_by}:{building}:{classroom_id}:{','.join(metrics)}"
+    # Keyed off the rollup watermark: the cache only turns over when new decisions are folded in
+    return CacheService.cached_json(key, [analytics_engine.WATERMARK, 'classroom'], lambda: analytics_engine.series(
+        db.engine, current_app.config, start, end, grain, group_by, building, classroom_id, metrics))
+
 @analytics_bp.route('/api/decisions/recent', methods=['GET'])
 def get_recent_decisions():
     return jsonify(EnergyService.get_recent_decisions(10))
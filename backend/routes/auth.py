@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify, redirect, current_app
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-import pandas as pd
+from flask_jwt_extended import create_access_token, jwt_required
 import os
 from models import db, User, Notification
 from services import AuthService, PasswordService, EmailService
+from security import admin_required, current_identity, identity_claims, IdentityCache
+from serialization import requested_shape, shaped
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -39,8 +40,8 @@ def login():
     if error:
         return jsonify({'success': False, 'message': error}), 401
     
-    # Create JWT Access Token
-    access_token = create_access_token(identity=str(user.id))
+    # Create JWT Access Token (role/username ride along as signed claims)
+    access_token = create_access_token(identity=str(user.id), additional_claims=identity_claims(user))
         
     return jsonify({
         'success': True,
@@ -64,9 +65,12 @@ def verify_admin():
 @auth_bp.route('/api/users', methods=['GET'])
 @jwt_required()
 def get_users():
-    """Get list of all users."""
+    """Get list of all users. `?shape=columns` returns one array per field."""
+    shape, error = requested_shape(request.args)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
     users = User.query.all()
-    return jsonify([{
+    return jsonify(shaped([{
         'id': u.id,
         'username': u.username,
         'email': u.email,
@@ -74,7 +78,7 @@ def get_users():
         'is_active': u.is_active_account,
         'is_pending_admin': u.is_pending_admin,
         'is_permanent': u.is_permanent
-    } for u in users])
+    } for u in users], shape))
 
 @auth_bp.route('/api/users/pending-admins', methods=['GET'])
 @jwt_required()
@@ -90,16 +94,16 @@ def get_pending_admins():
     } for u in users])
 
 @auth_bp.route('/api/users/approve-admin/<int:id>', methods=['POST'])
-@jwt_required()
+@admin_required
 def approve_admin(id):
     """Approve a pending admin registration."""
-    current_user_id = get_jwt_identity()
-    approver = User.query.get(int(current_user_id))
-    approved_by = approver.username if approver else None
+    approver = current_identity()
+    approved_by = approver['username'] if approver else None
     
     success, error = AuthService.approve_admin(id, approved_by=approved_by)
     if not success:
         return jsonify({'success': False, 'message': error}), 400
+    IdentityCache.invalidate(id)
     return jsonify({'success': True, 'message': 'Admin approved and activation email sent.'})
 
 @auth_bp.route('/api/users/activate-manual/<int:id>', methods=['POST'])
@@ -113,20 +117,23 @@ def activate_user_manual(id):
     user.is_active_account = True
     user.activation_token = None
     db.session.commit()
+    IdentityCache.invalidate(user.id)
     return jsonify({'success': True, 'message': f'User {user.username} activated manually.'})
 
 @auth_bp.route('/api/notifications', methods=['GET'])
 @jwt_required()
 def get_notifications():
-    """Retrieve notifications relevant to the user's role."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
+    """Retrieve notifications relevant to the user's role. `?shape=columns` returns one array per field."""
+    user = current_identity()
     
     if not user:
         return jsonify([]), 401
+    shape, error = requested_shape(request.args)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
     
     # Logic: admins see admin, faculty, and 'all' notifications. Faculty see faculty and 'all'.
-    if user.role == 'admin':
+    if user['role'] == 'admin':
         notifs = Notification.query.filter(
             (Notification.target_role == 'admin') | 
             (Notification.target_role == 'faculty') |
@@ -134,18 +141,18 @@ def get_notifications():
         ).order_by(Notification.created_at.desc()).all()
     else:
         notifs = Notification.query.filter(
-            (Notification.target_role == user.role) | 
+            (Notification.target_role == user['role']) | 
             (Notification.target_role == 'all')
         ).order_by(Notification.created_at.desc()).all()
 
-    return jsonify([{
+    return jsonify(shaped([{
         'id': n.id,
         'type': n.type,
         'message': n.message,
         'target_role': n.target_role,
         'is_read': n.is_read,
         'created_at': n.created_at.isoformat() + 'Z'
-    } for n in notifs])
+    } for n in notifs], shape))
 
 @auth_bp.route('/api/notifications/<int:id>/read', methods=['POST'])
 @jwt_required()
@@ -183,6 +190,7 @@ def create_single_user():
 @jwt_required()
 def bulk_import_users():
     """Upload CSV to add multiple faculty/users at once."""
+    import pandas as pd
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file provided'}), 400
     
@@ -237,13 +245,9 @@ def bulk_import_users():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @auth_bp.route('/api/users/<int:id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def delete_user(id):
-    current_user_id = get_jwt_identity()
-    current_user = User.query.get(int(current_user_id))
-    
-    if not current_user or current_user.role != 'admin':
-        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    current_user = current_identity()
         
     target_user = User.query.get(id)
     if not target_user:
@@ -251,7 +255,7 @@ def delete_user(id):
 
     # identify superior admin
     SUPERIOR_EMAIL = 'admin@smart.com'
-    is_current_superior = (current_user.email == SUPERIOR_EMAIL)
+    is_current_superior = (current_user['email'] == SUPERIOR_EMAIL)
     is_target_superior = (target_user.email == SUPERIOR_EMAIL)
 
     # Rule 1: Cannot delete permanent admins
@@ -273,16 +277,16 @@ def delete_user(id):
         try:
             notification = Notification(
                 type='user_deletion_alert',
-                message=f"Admin '{current_user.username}' deleted faculty member: {target_user.username} ({target_user.email})",
+                message=f"Admin '{current_user['username']}' deleted faculty member: {target_user.username} ({target_user.email})",
                 target_role='admin',
-                created_by=current_user.username
+                created_by=current_user['username']
             )
             db.session.add(notification)
             
             # Send Email Notification to Superior Admin
             EmailService.notify_superior_of_deletion(
                 superior_email=SUPERIOR_EMAIL,
-                admin_name=current_user.username,
+                admin_name=current_user['username'],
                 target_user_name=target_user.username,
                 target_role=target_user.role
             )
@@ -298,29 +302,26 @@ def delete_user(id):
         )
         db.session.delete(target_user)
         db.session.commit()
+        IdentityCache.invalidate(id)
         return jsonify({'success': True, 'message': f'User {target_user.username} deleted successfully.'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @auth_bp.route('/api/users/<int:id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_user(id):
     """Admin edits a user's profile, role, status, or password."""
-    current_user_id = get_jwt_identity()
-    editor = User.query.get(int(current_user_id))
-    
-    if not editor or editor.role != 'admin':
-        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    editor = current_identity()
     
     user = User.query.get(id)
     if not user:
         return jsonify({'success': False, 'message': 'User not found'}), 404
     
     data = request.json
-    is_self_edit = (str(editor.id) == str(user.id))
+    is_self_edit = (str(editor['id']) == str(user.id))
     SUPERIOR_EMAIL = 'admin@smart.com'
-    is_current_superior = (editor.email == SUPERIOR_EMAIL)
+    is_current_superior = (editor['email'] == SUPERIOR_EMAIL)
     changes = []
     
     # Logic same as original app.py
@@ -398,6 +399,7 @@ def update_user(id):
     
     try:
         db.session.commit()
+        IdentityCache.invalidate(user.id)
         return jsonify({
             'success': True,
             'message': f'User updated successfully. Changes: {", ".join(changes)}'
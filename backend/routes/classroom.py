@@ -1,18 +1,22 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Classroom, Notification, User
-import pandas as pd
+from flask_jwt_extended import jwt_required
+from models import db, Classroom, Notification
+from security import current_identity
+from services import CacheService
 
 classroom_bp = Blueprint('classroom', __name__)
 
 @classroom_bp.route('/api/classrooms', methods=['GET'])
 def get_classrooms():
-    classes = Classroom.query.filter_by(is_active=True).all()
-    return jsonify([{
-        'id': c.id, 'name': c.name, 'building': c.building, 
-        'capacity': c.capacity, 'lights': c.num_lights, 
-        'acs': c.num_acs, 'fans': c.num_fans
-    } for c in classes])
+    def build():
+        classes = Classroom.query.filter_by(is_active=True).all()
+        return [{
+            'id': c.id, 'name': c.name, 'building': c.building, 
+            'capacity': c.capacity, 'lights': c.num_lights, 
+            'acs': c.num_acs, 'fans': c.num_fans,
+            'ramp_minutes': c.thermal_ramp_minutes, 'coast_minutes': c.thermal_coast_minutes
+        } for c in classes]
+    return CacheService.cached_json('classrooms', ['classroom'], build)
 
 @classroom_bp.route('/api/classrooms', methods=['POST'])
 @jwt_required()
@@ -21,19 +25,20 @@ def add_classroom():
     new_room = Classroom(
         name=data['name'], building=data['building'], 
         capacity=data['capacity'], num_lights=data.get('lights', 8),
-        num_acs=data.get('acs', 2), num_fans=data.get('fans', 4)
+        num_acs=data.get('acs', 2), num_fans=data.get('fans', 4),
+        thermal_ramp_minutes=data.get('ramp_minutes'), thermal_coast_minutes=data.get('coast_minutes')
     )
     db.session.add(new_room)
     
     # System Tracking Notification
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
+    user = current_identity()
     notif = Notification(
         type='system_update',
-        message=f"New classroom '{new_room.name}' added to {new_room.building} building by {user.username if user else 'Admin'}",
+        message=f"New classroom '{new_room.name}' added to {new_room.building} building by {user['username'] if user else 'Admin'}",
         target_role='admin'
     )
     db.session.add(notif)
+    CacheService.bump('classroom', 'timetable')
     
     db.session.commit()
     return jsonify({'success': True, 'id': new_room.id})
@@ -46,14 +51,14 @@ def delete_classroom(id):
         room.is_active = False
         
         # System Tracking Notification
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = current_identity()
         notif = Notification(
             type='system_update',
-            message=f"Classroom '{room.name}' (ID: {room.id}) was deactivated by {user.username if user else 'Admin'}",
+            message=f"Classroom '{room.name}' (ID: {room.id}) was deactivated by {user['username'] if user else 'Admin'}",
             target_role='admin'
         )
         db.session.add(notif)
+        CacheService.bump('classroom', 'timetable')
         
         db.session.commit()
         return jsonify({'success': True})
@@ -73,16 +78,18 @@ def update_classroom(id):
     room.num_lights = data.get('lights', room.num_lights)
     room.num_acs = data.get('acs', room.num_acs)
     room.num_fans = data.get('fans', room.num_fans)
+    room.thermal_ramp_minutes = data.get('ramp_minutes', room.thermal_ramp_minutes)
+    room.thermal_coast_minutes = data.get('coast_minutes', room.thermal_coast_minutes)
     
     # System Tracking Notification
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
+    user = current_identity()
     notif = Notification(
         type='system_update',
-        message=f"Configuration for '{room.name}' was updated by {user.username if user else 'Admin'}",
+        message=f"Configuration for '{room.name}' was updated by {user['username'] if user else 'Admin'}",
         target_role='admin'
     )
     db.session.add(notif)
+    CacheService.bump('classroom', 'timetable')
     
     db.session.commit()
     return jsonify({'success': True})
@@ -91,6 +98,7 @@ def update_classroom(id):
 @jwt_required()
 def bulk_import_classrooms():
     """Upload CSV to add multiple classrooms at once."""
+    import pandas as pd
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file provided'}), 400
     
@@ -128,14 +136,14 @@ def bulk_import_classrooms():
         
         
         # System Tracking Notification
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = current_identity()
         notif = Notification(
             type='system_update',
             message=f"Bulk onboarded {added} classrooms to the system database.",
             target_role='admin'
         )
         db.session.add(notif)
+        CacheService.bump('classroom', 'timetable')
         
         db.session.commit()
         
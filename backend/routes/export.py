@@ -0,0 +1,29 @@
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from datetime import datetime
+from models import db
+from security import admin_required
+import exports
+
+export_bp = Blueprint('export', __name__)
+
+@export_bp.route('/api/export/<dataset>', methods=['GET'])
+@admin_required
+def export_dataset(dataset):
+    """Stream decisions, attendance or predictions as CSV, NDJSON or Parquet.
+
+    Query: format=csv|ndjson|parquet, start/end (ISO, end exclusive), classroom_id,
+    limit, and after_id to resume an interrupted download after the last id received.
+    """
+    req, error = exports.parse_request(dataset, request.args, current_app.config['EXPORT_CHUNK_ROWS'])
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    if req.format == 'parquet' and not exports.HAS_PYARROW:
+        return jsonify({'success': False, 'message': 'Parquet export needs pyarrow on the server; use csv or ndjson'}), 406
+
+    current_app.logger.info(f">>> EXPORT: {dataset} as {req.format} after id {req.after_id}")
+    body = exports.stream(db.session, db.engine, current_app.config, req)
+    response = Response(stream_with_context(body), mimetype=exports.FORMATS[req.format])
+    filename = f"{dataset}_{datetime.utcnow():%Y%m%d%H%M%S}.{req.format}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Resume-Param'] = 'after_id'
+    return response
@@ -1,94 +1,202 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required
-from werkzeug.utils import secure_filename
 import os
-import pandas as pd
-from models import Timetable, Classroom
-from services import EnergyService
+import uuid
+import hashlib
+import json
+from models import db, Timetable, Classroom, EnergyDecision
+from services import EnergyService, PredictionService, CacheService
+from timeslots import week_window, DEFAULT_SESSION_MINUTES
+import energy_engine
+from serialization import requested_shape, frame_records, frame_columns
 
 ml_bp = Blueprint('ml', __name__)
 
 @ml_bp.route('/api/predict', methods=['GET'])
 def get_recommendations():
-    from ml_engine import MLEngine
-    ml = MLEngine()
-    
-    timetable = Timetable.query.all()
-    results = []
-    for entry in timetable:
+    """Serve occupancy recommendations from the precomputed snapshot table."""
+    timetable = Timetable.query.options(db.joinedload(Timetable.classroom)).all()
+    snapshots = PredictionService.get_next_snapshots()
+    # Entries whose day or time cannot be read never get a snapshot; report them instead of rescoring
+    unschedulable = {entry.id for entry in timetable if week_window(entry.day_of_week, entry.time_slot)[0] is None}
+    missing = [entry.id for entry in timetable if entry.id not in snapshots and entry.id not in unschedulable]
+    if missing:
+        # New entries or a missed refresh: score just those, then read again
+        summary, error = PredictionService.refresh_snapshots(entry_ids=missing)
+        if error:
+            current_app.logger.error(f">>> PREDICT: Snapshot refresh failed: {error}")
+        snapshots = PredictionService.get_next_snapshots()
+    if unschedulable:
+        current_app.logger.warning(f">>> PREDICT: {len(unschedulable)} timetable entries have an unreadable day or time")
+
+    entries = [entry for entry in timetable if entry.id in snapshots]
+    # Baseline vs policy kWh for every entry in one pass, from its room's devices and slot length
+    devices = [(e.classroom.num_lights or 0, e.classroom.num_acs or 0, e.classroom.num_fans or 0) for e in entries]
+    windows = [(e.start_minute, e.end_minute) if e.start_minute is not None else week_window(e.day_of_week, e.time_slot) for e in entries]
+    minutes = [(end - start) if start is not None else DEFAULT_SESSION_MINUTES for start, end in windows]
+    baseline, optimized = energy_engine.session_energy(devices, [snapshots[e.id].level_idx for e in entries], minutes)
+
+    results, decisions = [], []
+    for entry, base_kwh, policy_kwh in zip(entries, baseline, optimized):
+        snap = snapshots[entry.id]
         classroom = entry.classroom
-        level_name, level_idx, reasoning, confidence = ml.predict(
-            entry.day_of_week, entry.time_slot, 
-            entry.subject_type, entry.expected_attendance
-        )
-        rec, _ = ml.get_recommendation(level_idx)
+        level_name, level_idx = snap.predicted_occupancy, snap.level_idx
         
         # Calculate and log energy decision
-        lights_action = 'OFF' if level_idx == 0 else 'ON'
-        ac_action = 'ON' if level_idx == 2 else 'OFF'
-        energy_saved = round(2.5 if level_idx < 2 else 0, 2)
+        lights_action, ac_action = energy_engine.device_actions(level_idx)
+        energy_saved = round(float(base_kwh - policy_kwh), 2)
         
-        EnergyService.log_decision(classroom.id, level_name, lights_action, ac_action, energy_saved)
+        decisions.append(EnergyDecision(
+            classroom_id=classroom.id, predicted_occupancy=level_name,
+            lights_action=lights_action, ac_action=ac_action, energy_saved_kwh=energy_saved
+        ))
         
         results.append({
             'classroom': classroom.name,
             'subject': entry.subject,
             'time': entry.time_slot,
+            'date': snap.target_date.isoformat(),
             'occupancy': level_name,
-            'confidence': confidence,
-            'reasoning': reasoning,
-            'recommendation': rec,
-            'attendance': entry.expected_attendance
+            'confidence': snap.confidence,
+            'reasoning': snap.reasoning,
+            'recommendation': snap.recommendation,
+            'attendance': entry.expected_attendance,
+            'energy_saved': energy_saved
         })
-    return jsonify(results)
+    # One commit for the whole poll; committing per entry expired the session every pass
+    EnergyService.log_decisions(decisions)
+    response = jsonify(results)
+    if unschedulable:
+        response.headers['X-Unschedulable-Entries'] = ','.join(str(i) for i in sorted(unschedulable))
+    return response
+
+@ml_bp.route('/api/predictions/refresh', methods=['POST'])
+@jwt_required()
+def refresh_predictions():
+    """Recompute dirty prediction snapshots (use ?force=true to rescore everything)."""
+    force = request.args.get('force', 'false').lower() == 'true'
+    summary, error = PredictionService.refresh_snapshots(force=force)
+    if error:
+        return jsonify({'success': False, 'message': error}), 500
+    return jsonify({'success': True, 'summary': summary})
 
 @ml_bp.route('/api/ml/upload-train', methods=['POST'])
 @jwt_required()
 def upload_and_train():
-    """Upload a CSV dataset, digest it into history, and delete original."""
+    """Stream a CSV dataset into history chunk by chunk and retrain.
+
+    Accepts either a multipart `file` field or a raw `text/csv` request body.
+    Pass `?job_id=` (or an `X-Upload-Id` header) to poll progress while the
+    upload is being digested; without one a job_id is generated and returned.
+    Rows with an unknown day, an hour outside 0-23 or a non-numeric attendance
+    are skipped and counted as rows_rejected.
+    """
     from ml_engine import MLEngine
-    ml = MLEngine()
-    
-    if 'file' not in request.files:
-        return jsonify({'success': False, 'message': 'No file provided'}), 400
-    
-    file = request.files['file']
-    if file.filename == '' or not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() == 'csv'):
-        return jsonify({'success': False, 'message': 'Invalid file. Only CSV allowed.'}), 400
-    
-    filename = secure_filename(file.filename)
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
+
+    # Large semester exports are allowed here only; other routes keep MAX_CONTENT_LENGTH
+    request.max_content_length = current_app.config['INGEST_MAX_CONTENT_LENGTH']
+
+    job_id = request.args.get('job_id') or request.headers.get('X-Upload-Id') or uuid.uuid4().hex
+    if not job_id.replace('-', '').isalnum() or len(job_id) > 64:
+        return jsonify({'success': False, 'message': 'Invalid job_id'}), 400
+
+    source_digest = None
+    if request.mimetype in ('text/csv', 'application/octet-stream'):
+        stream = request.stream
+        total_bytes = request.content_length
+    else:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'message': 'No file provided', 'job_id': job_id}), 400
         
-    filepath = os.path.join(upload_folder, filename)
-    file.save(filepath)
-    
+        file = request.files['file']
+        if file.filename == '' or not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() == 'csv'):
+            return jsonify({'success': False, 'message': 'Invalid file. Only CSV allowed.', 'job_id': job_id}), 400
+
+        # Werkzeug spools multipart uploads to a temp file, so we can hash it
+        # up front and skip identical uploads before parsing anything
+        stream = file.stream
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+        total_bytes = stream.tell()
+        stream.seek(0)
+        source_digest = digest.hexdigest()
+
+    ml = MLEngine()
     try:
-        df = pd.read_csv(filepath)
         # Digest and Train (The self-learning feedback loop)
-        report, error = ml.digest_and_train(df)
-        
-        # System Cleanup (Digest & Delete requirement)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            print(f">>> ML CLEANUP: Digested and deleted {filename}")
+        report, error = ml.digest_stream(stream, job_id, total_bytes=total_bytes, source_digest=source_digest)
         
         if error:
-            return jsonify({'success': False, 'message': error}), 400
+            return jsonify({'success': False, 'message': error, 'job_id': job_id}), 400
+
+        if report.get('skipped'):
+            return jsonify({
+                'success': True,
+                'message': 'This dataset was already digested. Existing model kept.',
+                'job_id': job_id,
+                'report': report
+            })
+        
+        # New model => every snapshot is stale
+        PredictionService.refresh_snapshots()
         
         return jsonify({
             'success': True,
             'message': 'Intelligence Digested. Model has been updated with new behavioral patterns.',
+            'job_id': job_id,
             'report': report
         })
     except Exception as e:
-        if os.path.exists(filepath): os.remove(filepath)
-        return jsonify({'success': False, 'message': str(e)}), 500
+        return jsonify({'success': False, 'message': str(e), 'job_id': job_id}), 500
+
+@ml_bp.route('/api/ml/upload-train/progress/<job_id>', methods=['GET'])
+@jwt_required()
+def upload_progress(job_id):
+    """Report how far a streaming upload has been digested."""
+    from ml_engine import read_ingest_progress
+    if not job_id.replace('-', '').isalnum():
+        return jsonify({'success': False, 'message': 'Invalid job_id'}), 400
+    progress = read_ingest_progress(job_id)
+    if not progress:
+        return jsonify({'success': False, 'message': 'Unknown upload job'}), 404
+    return jsonify(dict(progress, success=True))
+
+PREDICT_CHUNK_ROWS = 5000
+PREDICT_COLUMNS = ['day', 'hour', 'predicted_occupancy', 'confidence', 'reasoning', 'recommendation']
+
+def _iter_prediction_chunks(ml, file):
+    """Yield scored DataFrames one CSV chunk at a time."""
+    import pandas as pd
+    for chunk in pd.read_csv(file, chunksize=PREDICT_CHUNK_ROWS):
+        scored = ml.predict_frame(chunk)
+        scored['day'] = chunk['day'] if 'day' in chunk.columns else None
+        scored['hour'] = chunk['hour'] if 'hour' in chunk.columns else None
+        yield scored[PREDICT_COLUMNS]
+
+def _update_summary(summary, scored):
+    counts = scored['predicted_occupancy'].value_counts()
+    low, med, high = int(counts.get('Low', 0)), int(counts.get('Medium', 0)), int(counts.get('High', 0))
+    summary['total_records'] += len(scored)
+    summary['low_occupancy'] += low
+    summary['medium_occupancy'] += med
+    summary['high_occupancy'] += high
+    summary['optimized_count'] += low + med # Assume low/med are optimized
+
+def _empty_summary():
+    return {'total_records': 0, 'low_occupancy': 0, 'medium_occupancy': 0,
+            'high_occupancy': 0, 'optimized_count': 0}
 
 @ml_bp.route('/api/ml/predict-batch', methods=['POST'])
 @jwt_required()
 def predict_batch():
-    """Upload a CSV dataset and get smart predictions."""
+    """Upload a CSV dataset and get smart predictions.
+
+    `Accept: application/x-ndjson` or `Accept: text/csv` streams predictions
+    chunk by chunk with the summary as the final record; anything else gets
+    the classic single JSON document, where `?shape=columns` returns the
+    predictions as one array per field.
+    """
     from ml_engine import MLEngine
     ml = MLEngine()
     
@@ -96,38 +204,54 @@ def predict_batch():
         return jsonify({'success': False, 'message': 'No file provided'}), 400
     
     file = request.files['file']
+    shape, error = requested_shape(request.args)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    output = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson', 'text/csv'])
+
+    if output in ('application/x-ndjson', 'text/csv'):
+        # Request files are closed once the view returns, so the upload is
+        # parked in UPLOAD_FOLDER and deleted when the stream finishes
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        filepath = os.path.join(upload_folder, f'predict-{uuid.uuid4().hex}.csv')
+        file.save(filepath)
+
+        def generate():
+            summary = _empty_summary()
+            try:
+                for i, scored in enumerate(_iter_prediction_chunks(ml, filepath)):
+                    _update_summary(summary, scored)
+                    if output == 'text/csv':
+                        yield scored.to_csv(index=False, header=(i == 0))
+                    else:
+                        yield scored.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+            except Exception as e:
+                yield f"# error: {e}\n" if output == 'text/csv' else json.dumps({'success': False, 'message': str(e)}) + '\n'
+                return
+            finally:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+            if output == 'text/csv':
+                # CSV has no native trailer, so the summary is a comment line
+                yield '# summary: ' + ','.join(f'{k}={v}' for k, v in summary.items()) + '\n'
+            else:
+                yield json.dumps({'summary': summary}) + '\n'
+        return Response(stream_with_context(generate()), mimetype=output)
+
     try:
-        df = pd.read_csv(file)
-        results = []
-        for _, row in df.iterrows():
-            level_name, idx, reasoning, conf = ml.predict(
-                row.get('day'), row.get('hour'), row.get('type'), row.get('attendance')
-            )
-            rec, _ = ml.get_recommendation(idx)
-            results.append({
-                'day': row.get('day'),
-                'hour': row.get('hour'),
-                'predicted_occupancy': level_name,
-                'confidence': conf,
-                'reasoning': reasoning,
-                'recommendation': rec
-            })
-        
-        # Calculate summary for frontend
-        low = sum(1 for p in results if p['predicted_occupancy'] == 'Low')
-        med = sum(1 for p in results if p['predicted_occupancy'] == 'Medium')
-        high = sum(1 for p in results if p['predicted_occupancy'] == 'High')
+        import pandas as pd
+        summary = _empty_summary()
+        frames = []
+        for scored in _iter_prediction_chunks(ml, file):
+            _update_summary(summary, scored)
+            frames.append(scored)
+        scored = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PREDICT_COLUMNS)
         
         return jsonify({
             'success': True,
-            'predictions': results,
-            'summary': {
-                'total_records': len(results),
-                'low_occupancy': low,
-                'medium_occupancy': med,
-                'high_occupancy': high,
-                'optimized_count': low + med # Assume low/med are optimized
-            }
+            'predictions': frame_columns(scored) if shape == 'columns' else frame_records(scored),
+            'summary': summary
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -137,3 +261,86 @@ def get_ml_status():
     from ml_engine import MLEngine
     ml = MLEngine()
     return jsonify(ml.get_model_stats())
+
+@ml_bp.route('/api/hvac/schedule', methods=['GET'])
+@jwt_required()
+def get_hvac_schedule():
+    """Per-room AC/light/fan timeline for ?date=YYYY-MM-DD (default: today), optionally ?building= or ?classroom_id=."""
+    from datetime import date
+    from ml_engine import MLEngine
+    import hvac_engine
+
+    try:
+        target = date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date, expected YYYY-MM-DD'}), 400
+
+    cfg = current_app.config
+    rooms, sessions = hvac_engine.load_day(
+        target, MLEngine(), building=request.args.get('building'),
+        classroom_id=request.args.get('classroom_id', type=int)
+    )
+    plans = hvac_engine.schedule_day(
+        rooms, sessions,
+        ramp_minutes=cfg['HVAC_RAMP_MINUTES'], coast_minutes=cfg['HVAC_COAST_MINUTES'],
+        ac_probability=cfg['HVAC_AC_PROBABILITY'], min_off_minutes=cfg['HVAC_MIN_OFF_MINUTES'],
+        step=cfg['HVAC_STEP_MINUTES']
+    )
+    if request.args.get('scheduled_only', 'true').lower() == 'true':
+        plans = [p for p in plans if p['scheduled']]
+    return jsonify({
+        'success': True, 'date': target.isoformat(),
+        'total_kwh': round(sum(p['kwh'] for p in plans), 2),
+        'rooms': plans
+    })
+
+@ml_bp.route('/api/simulate', methods=['POST'])
+@jwt_required()
+def simulate_scenarios():
+    """What-if replay of the timetable over a date range.
+
+    Body: {"start": "2026-01-12", "end": "2026-05-01", "holidays": [...],
+           "scenarios": [{"name": "...", "shifts": [{"type": "Lab", "after": "17:00", "to": "09:00"}],
+                          "ac_level": "Medium", "medium_lights": 0.5, "attendance_factor": 1.0}]}
+    The current policy is always evaluated first as the reference scenario.
+    """
+    from datetime import date, timedelta
+    from ml_engine import MLEngine, model_version
+    import simulation_engine
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not isinstance(data.get('scenarios', []), list):
+        return jsonify({'success': False, 'message': 'Body must be an object with a list of scenarios'}), 400
+    try:
+        start = date.fromisoformat(data['start']) if data.get('start') else date.today()
+        end = date.fromisoformat(data['end']) if data.get('end') else start + timedelta(weeks=16)
+        holidays = sorted(date.fromisoformat(d) for d in data.get('holidays', []))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    if end < start or (end - start).days > 366:
+        return jsonify({'success': False, 'message': 'Date range must be between 0 and 366 days'}), 400
+
+    scenarios = []
+    for raw in [{'name': 'current'}] + data.get('scenarios', []):
+        scenario, error = simulation_engine.normalize_scenario(raw)
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        scenarios.append(scenario)
+
+    cfg = current_app.config
+    context_key = hashlib.sha256(json.dumps([
+        start.isoformat(), end.isoformat(), [d.isoformat() for d in holidays],
+        CacheService.get_versions(['timetable', 'classroom']), model_version(),
+        cfg['ENERGY_TARIFF_PER_KWH'], cfg['CO2_KG_PER_KWH'], cfg['BUILDING_ENERGY_FACTORS']
+    ], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    results, stats = simulation_engine.run(
+        MLEngine(), simulation_engine.load_model(), scenarios,
+        simulation_engine.weekday_weights(start, end, holidays), cfg, context_key
+    )
+    reference = results[0]
+    for result in results:
+        result['kwh_delta'] = round(result['kwh'] - reference['kwh'], 1)
+        result['cost_delta'] = round(result['cost'] - reference['cost'], 2)
+        result['comfort_delta_hours'] = round(result['comfort_violation_hours'] - reference['comfort_violation_hours'], 1)
+    return jsonify({'success': True, 'start': start.isoformat(), 'end': end.isoformat(), 'stats': stats, 'scenarios': results})
@@ -0,0 +1,77 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from datetime import datetime
+from models import db, Classroom
+from security import authorize_device
+from telemetry import get_buffer, parse_readings, query_readings
+
+try:
+    import msgpack
+except ImportError:  # msgpack bodies are optional; JSON always works
+    msgpack = None
+
+sensors_bp = Blueprint('sensors', __name__)
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+@sensors_bp.route('/api/sensors/readings', methods=['POST'])
+def ingest_readings():
+    """Batched people-counter / PIR readings: a JSON or msgpack array, or {"readings": [...]}."""
+    if not authorize_device():
+        return jsonify({'success': False, 'message': 'Invalid sensor key'}), 401
+
+    if request.mimetype in MSGPACK_TYPES:
+        if msgpack is None:
+            return jsonify({'success': False, 'message': 'msgpack is not installed on this server; send JSON'}), 415
+        try:
+            payload = msgpack.unpackb(request.get_data(), raw=False)
+        except Exception:
+            return jsonify({'success': False, 'message': 'Malformed msgpack body'}), 400
+    else:
+        payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('readings')
+    if not isinstance(payload, list):
+        return jsonify({'success': False, 'message': 'Expected an array of readings'}), 400
+    if len(payload) > current_app.config['SENSOR_MAX_BATCH']:
+        return jsonify({'success': False, 'message': f"At most {current_app.config['SENSOR_MAX_BATCH']} readings per request"}), 413
+
+    known_rooms = {room_id for (room_id,) in db.session.query(Classroom.id).filter_by(is_active=True).all()}
+    rows, errors = parse_readings(payload, known_rooms, current_app.config['SENSOR_MAX_AGE'],
+                                  current_app.config['SENSOR_MAX_SKEW'])
+
+    buffer = get_buffer()
+    if rows and not buffer.offer(rows):
+        # Backpressure: nothing from this batch was queued, the sensor should resend later
+        response = jsonify({'success': False, 'message': 'Telemetry buffer full, retry later', 'queued': 0})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(buffer.retry_after())
+        return response
+
+    return jsonify({
+        'success': True, 'queued': len(rows), 'rejected': len(errors),
+        'errors': errors[:10], 'buffer_depth': buffer.depth()
+    }), 202
+
+@sensors_bp.route('/api/sensors/readings', methods=['GET'])
+@jwt_required()
+def list_readings():
+    """Stored readings, newest first. ?classroom_id=, ?start= / ?end= (ISO), ?limit= (max 10000)."""
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid start or end timestamp'}), 400
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    readings = query_readings(db.engine, request.args.get('classroom_id', type=int), start, end, limit)
+    for r in readings:
+        r['recorded_at'] = r['recorded_at'].isoformat()
+        r['received_at'] = r['received_at'].isoformat() if r['received_at'] else None
+    return jsonify(readings)
+
+@sensors_bp.route('/api/sensors/stats', methods=['GET'])
+@jwt_required()
+def ingest_stats():
+    """Write-buffer counters for this worker process."""
+    buffer = get_buffer()
+    return jsonify(dict(buffer.stats, buffer_depth=buffer.depth(), capacity=buffer.capacity))
@@ -51,21 +51,81 @@ def get_db_status():
         'timestamp': time.time()
     })
 
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User
+from security import admin_required
 from services import ReportingService
 
 @system_bp.route('/api/system/trigger-report', methods=['POST'])
-@jwt_required()
+@admin_required
 def trigger_briefing():
     """Manually trigger the weekend briefing for all admins."""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'admin':
-        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
-        
     count = ReportingService.trigger_weekend_briefing()
     return jsonify({
         'success': True,
         'message': f'Weekend report dispatched to {count} administrators.'
     })
+
+@system_bp.route('/api/system/retention', methods=['GET'])
+@admin_required
+def get_retention_status():
+    """Energy decision rows per tier: hot table, monthly partitions and archive."""
+    from retention import retention_status
+    return jsonify(retention_status(db.engine, current_app.config))
+
+@system_bp.route('/api/system/retention', methods=['POST'])
+@admin_required
+def run_retention():
+    """Apply the retention policy now (`?dry_run=true` only reports what would move)."""
+    from flask import request
+    from retention import apply_retention
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    try:
+        summary = apply_retention(db.engine, current_app.config, dry_run=dry_run)
+    except Exception as e:
+        current_app.logger.error(f">>> RETENTION: Failed: {e}")
+        return jsonify({'success': False, 'message': f'Retention failed: {e}'}), 500
+    return jsonify({'success': True, 'summary': summary})
+
+@system_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint; all gunicorn workers' values when METRICS_DIR is shared."""
+    import hmac
+    from flask import request, Response
+    import metrics
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'success': False, 'message': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@system_bp.route('/api/system/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """Most recent request profiles, newest first (`?limit=` defaults to 50)."""
+    from flask import request
+    import profiling
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'success': True,
+        'profiles': profiling.list_profiles(current_app.config['PROFILE_DIR'], limit)
+    })
+
+@system_bp.route('/api/system/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    """Full profile: SQL statements, repeated statements and N+1 suspects."""
+    import profiling
+    profile = profiling.load_profile(current_app.config['PROFILE_DIR'], profile_id)
+    if profile is None:
+        return jsonify({'success': False, 'message': 'Profile not found'}), 404
+    return jsonify(profile)
+
+@system_bp.route('/api/system/profiles/<profile_id>/folded', methods=['GET'])
+@admin_required
+def get_profile_stacks(profile_id):
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    from flask import Response
+    import profiling
+    folded = profiling.load_folded(current_app.config['PROFILE_DIR'], profile_id)
+    if folded is None:
+        return jsonify({'success': False, 'message': 'Profile not found'}), 404
+    return Response(folded, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.folded'})
@@ -1,24 +1,78 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Timetable, Classroom, Notification, User
-import pandas as pd
+from flask_jwt_extended import jwt_required
+from models import db, Timetable, Classroom, Notification
+from security import current_identity
+from timeslots import get_timetable_index, minute_of_week, format_minute, week_window, DAY_MINUTES, DAY_NAMES
+from conflict_engine import find_conflicts, rejected_refs, flags_by_ref, public_conflicts, REJECT, CONFLICT_MODES
+import consolidation_engine
+from datetime import datetime
+from services import PredictionService, CacheService
+from serialization import requested_shape, shaped
 
 timetable_bp = Blueprint('timetable', __name__)
 
 @timetable_bp.route('/api/timetable', methods=['GET'])
 def get_timetable():
-    entries = Timetable.query.all()
-    return jsonify([{
-        'id': e.id, 'classroom': e.classroom.name, 'classroom_id': e.classroom_id,
-        'day': e.day_of_week, 'time': e.time_slot, 'subject': e.subject,
-        'type': e.subject_type, 'teacher': e.teacher_name, 
-        'email': e.teacher_email, 'attendance': e.expected_attendance
-    } for e in entries])
+    shape, error = requested_shape(request.args)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+
+    def build():
+        # Eager-load classrooms in the same query instead of one lookup per entry
+        entries = Timetable.query.options(db.joinedload(Timetable.classroom)).all()
+        return shaped([{
+            'id': e.id, 'classroom': e.classroom.name, 'classroom_id': e.classroom_id,
+            'day': e.day_of_week, 'time': e.time_slot, 'subject': e.subject,
+            'type': e.subject_type, 'teacher': e.teacher_name, 
+            'email': e.teacher_email, 'attendance': e.expected_attendance,
+            'conflict': e.conflict_flag
+        } for e in entries], shape)
+    return CacheService.cached_json(f'timetable.{shape}', ['timetable', 'classroom'], build)
+
+def _conflict_mode():
+    mode = request.args.get('on_conflict', REJECT)
+    return mode if mode in CONFLICT_MODES else None
+
+def _existing_sessions(room_ids):
+    """Scheduled sessions in the given rooms, as conflict-engine dicts."""
+    rows = db.session.query(
+        Timetable.id, Timetable.classroom_id, Timetable.start_minute, Timetable.end_minute,
+        Timetable.day_of_week, Timetable.time_slot, Timetable.subject
+    ).filter(Timetable.classroom_id.in_(room_ids)).all()
+    sessions = []
+    for entry_id, classroom_id, start, end, day, slot, subject in rows:
+        if start is None:
+            start, end = week_window(day, slot)
+        sessions.append({'timetable_id': entry_id, 'classroom_id': classroom_id,
+                         'start': start, 'end': end, 'subject': subject})
+    return sessions
 
 @timetable_bp.route('/api/timetable', methods=['POST'])
 @jwt_required()
 def add_timetable():
+    """Add one session. Overlaps and over-capacity entries are rejected with 409,
+    or saved with a conflict flag when called with ?on_conflict=flag."""
+    mode = _conflict_mode()
+    if not mode:
+        return jsonify({'success': False, 'message': f'on_conflict must be one of {", ".join(CONFLICT_MODES)}'}), 400
+
     data = request.json
+    start_minute, end_minute = week_window(data['day'], data['time'])
+    classroom = Classroom.query.get(data['classroom_id'])
+    capacities = {classroom.id: classroom.capacity} if classroom else {}
+    conflicts = find_conflicts(
+        [{'ref': 0, 'classroom_id': data['classroom_id'], 'start': start_minute, 'end': end_minute,
+          'attendance': float(data['attendance']) if data.get('attendance') is not None else None,
+          'subject': data['subject']}],
+        _existing_sessions([data['classroom_id']]), capacities
+    )
+    if conflicts and (mode == REJECT or not classroom or start_minute is None):
+        return jsonify({
+            'success': False,
+            'message': conflicts[0]['message'],
+            'conflicts': public_conflicts(conflicts)
+        }), 409
+
     new_entry = Timetable(
         classroom_id=data['classroom_id'],
         day_of_week=data['day'],
@@ -27,22 +81,24 @@ def add_timetable():
         subject_type=data['type'],
         teacher_name=data['teacher'],
         teacher_email=data['email'],
-        expected_attendance=data['attendance']
+        expected_attendance=data['attendance'],
+        conflict_flag=flags_by_ref(conflicts).get(0)
     )
     db.session.add(new_entry)
     
     # System Tracking Notification
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
+    user = current_identity()
     notif = Notification(
         type='schedule_update',
-        message=f"Schedule updated: {new_entry.subject} in {new_entry.classroom.name} on {new_entry.day_of_week} by {user.username if user else 'Admin'}",
+        message=f"Schedule updated: {new_entry.subject} in {classroom.name} on {new_entry.day_of_week} by {user['username'] if user else 'Admin'}",
         target_role='admin'
     )
     db.session.add(notif)
+    CacheService.bump('timetable')
     
     db.session.commit()
-    return jsonify({'success': True, 'id': new_entry.id})
+    PredictionService.refresh_snapshots(entry_ids=[new_entry.id])
+    return jsonify({'success': True, 'id': new_entry.id, 'conflicts': public_conflicts(conflicts)})
 
 @timetable_bp.route('/api/timetable/<int:id>', methods=['DELETE'])
 @jwt_required()
@@ -54,29 +110,44 @@ def delete_timetable(id):
         db.session.delete(entry)
         
         # System Tracking Notification
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
+        user = current_identity()
         notif = Notification(
             type='schedule_update',
-            message=f"Cancelled/Removed {subj} from {room} timetable by {user.username if user else 'Admin'}",
+            message=f"Cancelled/Removed {subj} from {room} timetable by {user['username'] if user else 'Admin'}",
             target_role='admin'
         )
         db.session.add(notif)
+        CacheService.bump('timetable')
         
         db.session.commit()
+        # Drops this entry's snapshots; nothing is rescored
+        PredictionService.refresh_snapshots(entry_ids=[id])
         return jsonify({'success': True})
     return jsonify({'success': False}), 404
 
 @timetable_bp.route('/api/timetable/bulk-import', methods=['POST'])
 @jwt_required()
 def bulk_import_timetable():
-    """Upload CSV to add multiple timetable entries at once."""
+    """Upload CSV to add multiple timetable entries at once.
+
+    The whole file is checked for double bookings (against itself and the
+    existing schedule) and over-capacity rows in one pass. ?on_conflict=reject
+    (default) skips conflicting rows, ?on_conflict=flag imports them with a
+    conflict flag, and ?dry_run=true only reports.
+    """
+    import pandas as pd
+
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file provided'}), 400
     
     file = request.files['file']
     if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() == 'csv'):
         return jsonify({'success': False, 'message': 'Only CSV files allowed'}), 400
+
+    mode = _conflict_mode()
+    if not mode:
+        return jsonify({'success': False, 'message': f'on_conflict must be one of {", ".join(CONFLICT_MODES)}'}), 400
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
     
     try:
         df = pd.read_csv(file)
@@ -86,51 +157,83 @@ def bulk_import_timetable():
         if missing:
             return jsonify({'success': False, 'message': f'Missing columns: {", ".join(missing)}'}), 400
         
-        added = 0
         errors = []
-        
-        for idx, row in df.iterrows():
+        candidates = []
+        rows = []
+        for idx, row in enumerate(df.to_dict('records')):
             try:
-                classroom = Classroom.query.get(int(row['classroom_id']))
-                if not classroom:
-                    errors.append(f"Row {idx+1}: Classroom ID {row['classroom_id']} not found")
-                    continue
-                
-                entry = Timetable(
-                    classroom_id=int(row['classroom_id']),
-                    day_of_week=str(row['day']),
-                    time_slot=str(row['time']),
-                    subject=str(row['subject']),
-                    subject_type=str(row['type']),
-                    teacher_name=str(row['teacher']),
-                    teacher_email=str(row['email']),
-                    expected_attendance=float(row['attendance'])
-                )
-                db.session.add(entry)
-                added += 1
+                start_minute, end_minute = week_window(row['day'], row['time'])
+                rows.append({
+                    'classroom_id': int(row['classroom_id']),
+                    'day_of_week': str(row['day']),
+                    'time_slot': str(row['time']),
+                    'subject': str(row['subject']),
+                    'subject_type': str(row['type']),
+                    'teacher_name': str(row['teacher']),
+                    'teacher_email': str(row['email']),
+                    'expected_attendance': float(row['attendance']),
+                    'start_minute': start_minute,
+                    'end_minute': end_minute,
+                    'conflict_flag': None
+                })
+                candidates.append({'ref': len(rows) - 1, 'row': idx + 1, 'classroom_id': rows[-1]['classroom_id'],
+                                   'start': start_minute, 'end': end_minute,
+                                   'attendance': rows[-1]['expected_attendance'], 'subject': rows[-1]['subject']})
             except Exception as e:
                 errors.append(f"Row {idx+1}: {str(e)}")
+
+        room_ids = {r['classroom_id'] for r in rows}
+        capacities = dict(db.session.query(Classroom.id, Classroom.capacity).filter(Classroom.id.in_(room_ids)).all())
+        conflicts = find_conflicts(candidates, _existing_sessions(list(capacities)), capacities)
+
+        # Unknown rooms and unparseable slots can never be imported
+        blocked = {c['ref'] for c in conflicts if c['type'] in ('unknown_classroom', 'invalid_slot')}
+        if mode == REJECT:
+            blocked |= rejected_refs(conflicts)
+        else:
+            for ref, flag in flags_by_ref(conflicts).items():
+                rows[ref]['conflict_flag'] = flag
+        accepted = [r for i, r in enumerate(rows) if i not in blocked]
+
+        if dry_run:
+            return jsonify({
+                'success': True,
+                'message': f'Dry run: {len(accepted)} of {len(df)} rows would be imported',
+                'added': 0,
+                'would_add': len(accepted),
+                'conflicts': public_conflicts(conflicts),
+                'errors': errors[:10]
+            })
+
+        if accepted:
+            # Core insert: one statement for the whole file instead of one per row
+            db.session.execute(Timetable.__table__.insert(), accepted)
+        added = len(accepted)
         
         # System Tracking Notification
-        user_id = get_jwt_identity()
-        user = User.query.get(int(user_id))
         notif = Notification(
             type='schedule_update',
             message=f"Bulk imported {added} timetable entries to the system schedule.",
             target_role='admin'
         )
         db.session.add(notif)
+        CacheService.bump('timetable')
         
         db.session.commit()
+        # New rows are scored by the hourly snapshot pass, or by the first /api/predict that sees them
         
         return jsonify({
             'success': True,
             'message': f'Successfully imported {added} timetable entries',
             'added': added,
+            'rejected': len(blocked),
+            'conflicts': public_conflicts(conflicts),
             'errors': errors[:10]
         })
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
+
 @timetable_bp.route('/api/timetable/attendance', methods=['POST'])
 @jwt_required()
 def record_attendance():
@@ -143,6 +246,7 @@ def record_attendance():
     if not entry:
         return jsonify({'success': False, 'message': 'Schedule entry not found'}), 404
         
+    import pandas as pd
     from models import AttendanceHistory
     from ml_engine import MLEngine
     
@@ -151,7 +255,7 @@ def record_attendance():
         timetable_id=timetable_id,
         actual_attendance=actual_attendance,
         day_of_week=entry.day_of_week,
-        hour=int(entry.time_slot.split(':')[0]) if ':' in entry.time_slot else 8,
+        hour=(entry.start_minute % DAY_MINUTES) // 60 if entry.start_minute is not None else 8,
         subject_type=entry.subject_type,
         expected_attendance=entry.expected_attendance
     )
@@ -166,8 +270,87 @@ def record_attendance():
         'type': history.subject_type,
         'attendance': history.actual_attendance
     }]))
+    # The retrained model makes every snapshot stale; the hourly snapshot pass rescores them
     
     return jsonify({
         'success': True, 
         'message': 'Attendance recorded and integrated into system intelligence.'
     })
+
+def _resolve_minute():
+    """Minute-of-week for ?at=<ISO datetime>, defaulting to now."""
+    at = request.args.get('at')
+    return minute_of_week(datetime.fromisoformat(at) if at else None)
+
+def _session_payload(session, classrooms, entries):
+    entry = entries[session['entry_id']]
+    start_day, start_time = format_minute(session['start'])
+    _, end_time = format_minute(session['end'])
+    return {
+        'timetable_id': entry.id, 'classroom_id': session['classroom_id'],
+        'classroom': classrooms[session['classroom_id']].name, 'building': session['building'],
+        'subject': entry.subject, 'day': start_day, 'start': start_time, 'end': end_time
+    }
+
+def _sessions_response(sessions):
+    entries = {e.id: e for e in Timetable.query.filter(Timetable.id.in_([s['entry_id'] for s in sessions])).all()}
+    classrooms = {c.id: c for c in Classroom.query.filter(Classroom.id.in_([s['classroom_id'] for s in sessions])).all()}
+    return jsonify([_session_payload(s, classrooms, entries) for s in sessions])
+
+@timetable_bp.route('/api/schedule/occupied', methods=['GET'])
+def get_occupied_rooms():
+    """Sessions in progress at ?at= (default: now)."""
+    try:
+        minute = _resolve_minute()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid at timestamp'}), 400
+    return _sessions_response(get_timetable_index().active_at(minute))
+
+@timetable_bp.route('/api/schedule/next', methods=['GET'])
+def get_next_sessions():
+    """Next session per room after ?at= (default: now); ?classroom_id= narrows to one room."""
+    try:
+        minute = _resolve_minute()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid at timestamp'}), 400
+    index = get_timetable_index()
+    classroom_id = request.args.get('classroom_id', type=int)
+    if classroom_id is not None:
+        upcoming = [index.next_session(classroom_id, minute)]
+    else:
+        upcoming = list(index.next_sessions(minute).values())
+    return _sessions_response([s for s in upcoming if s])
+
+@timetable_bp.route('/api/schedule/free', methods=['GET'])
+def get_free_rooms():
+    """Active rooms with no session at ?at= (default: now), optionally in ?building=."""
+    try:
+        minute = _resolve_minute()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid at timestamp'}), 400
+    building = request.args.get('building')
+    query = Classroom.query.filter_by(is_active=True)
+    if building:
+        query = query.filter_by(building=building)
+    rooms = query.all()
+    free = get_timetable_index().free_rooms(minute, building, {c.id: c.building for c in rooms})
+    return jsonify([{
+        'id': c.id, 'name': c.name, 'building': c.building, 'capacity': c.capacity
+    } for c in rooms if c.id in free])
+
+@timetable_bp.route('/api/schedule/consolidation', methods=['GET'])
+@jwt_required()
+def get_consolidation_plan():
+    """Proposed room moves per weekly slot; ?day= narrows to one day, ?method=greedy|exact|auto."""
+    method = request.args.get('method', 'auto')
+    if method not in ('auto', 'greedy', 'exact'):
+        return jsonify({'success': False, 'message': 'method must be auto, greedy or exact'}), 400
+    day = request.args.get('day')
+    if day and day.capitalize() not in DAY_NAMES:
+        return jsonify({'success': False, 'message': 'Invalid day'}), 400
+
+    problem = consolidation_engine.load_problem()
+    slots, totals = consolidation_engine.optimize(problem, method=method, day=day.capitalize() if day else None)
+    if request.args.get('changed_only', 'false').lower() == 'true':
+        slots = [s for s in slots if s['moves']]
+    return jsonify({'success': True, 'totals': totals, 'slots': slots})
@@ -0,0 +1,89 @@
+import hmac
+import time
+import threading
+from functools import wraps
+from flask import g, jsonify, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, verify_jwt_in_request
+from models import User
+
+class IdentityCache:
+    """Short-TTL, per-process cache of the user fields routes authorize on.
+
+    Entries are dropped immediately on the worker that changes a user's role,
+    status or existence; other workers pick the change up once the TTL lapses.
+    """
+    _entries = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(user_id):
+        ttl = current_app.config.get('IDENTITY_CACHE_TTL', 60)
+        now = time.monotonic()
+        with IdentityCache._lock:
+            entry = IdentityCache._entries.get(user_id)
+        if entry and now - entry[0] < ttl:
+            return entry[1]
+
+        user = User.query.get(user_id)
+        identity = None
+        if user:
+            identity = {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'role': user.role,
+                'is_active': user.is_active_account
+            }
+        with IdentityCache._lock:
+            IdentityCache._entries[user_id] = (now, identity)
+        return identity
+
+    @staticmethod
+    def invalidate(user_id):
+        with IdentityCache._lock:
+            IdentityCache._entries.pop(int(user_id), None)
+
+def identity_claims(user):
+    """Claims embedded in the access token so non-admin role checks need no DB lookup."""
+    return {'role': user.role}
+
+def current_identity():
+    """The authenticated user's identity dict (or None if the account is gone).
+
+    Resolved once per request, then served from IdentityCache.
+    """
+    if 'identity' not in g:
+        g.identity = IdentityCache.get(int(get_jwt_identity()))
+    return g.identity
+
+def admin_required(fn):
+    """jwt_required() plus an admin role check driven by token claims."""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        # Tokens whose role claim is not admin are rejected without touching the DB.
+        # Admin claims are confirmed against the cached identity so a demotion or
+        # deletion takes effect before the 24h token expires.
+        claimed_role = get_jwt().get('role')
+        if claimed_role is not None and claimed_role != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        identity = current_identity()
+        if not identity or identity['role'] != 'admin':
+            return jsonify({'success': False, 'message': 'Admin access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+def authorize_device(admin_only=False):
+    """Devices send X-Sensor-Key when SENSOR_INGEST_KEY is set, and then nothing else is accepted.
+
+    Without a configured key a JWT is required instead (an admin's, with `admin_only`).
+    """
+    expected = current_app.config.get('SENSOR_INGEST_KEY')
+    if expected:
+        supplied = request.headers.get('X-Sensor-Key', '')
+        return hmac.compare_digest(expected.encode(), supplied.encode())
+    verify_jwt_in_request()
+    if admin_only:
+        identity = current_identity()
+        return bool(identity and identity['role'] == 'admin')
+    return True
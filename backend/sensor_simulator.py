@@ -0,0 +1,145 @@
+"""
+Local people-counter / PIR simulator for load testing /api/sensors/readings.
+
+Generates plausible readings for a set of rooms and posts them in batches
+at a target rate from several threads, then reports accepted readings/sec,
+429 backpressure responses and request latency.
+
+Usage:
+    python sensor_simulator.py --rate 5000 --duration 30 --key $SENSOR_INGEST_KEY
+    python sensor_simulator.py --local --rate 5000 --duration 10   # in-process, no server needed
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from datetime import datetime, timezone
+
+def make_batch(room_ids, size, rng):
+    now = datetime.now(timezone.utc).timestamp()
+    batch = []
+    for _ in range(size):
+        room = rng.choice(room_ids)
+        count = max(0, int(rng.gauss(35, 20)))
+        batch.append({
+            'classroom_id': room, 'sensor_id': f'pc-{room}',
+            'ts': round(now - rng.random(), 3), 'count': count, 'motion': count > 0
+        })
+    return batch
+
+def encode(batch, fmt):
+    if fmt == 'msgpack':
+        import msgpack
+        return msgpack.packb(batch), 'application/msgpack'
+    return json.dumps(batch).encode(), 'application/json'
+
+class HttpSender:
+    def __init__(self, url, headers):
+        self.url = url.rstrip('/') + '/api/sensors/readings'
+        self.headers = headers
+
+    def send(self, body, content_type):
+        req = urllib.request.Request(self.url, data=body, method='POST',
+                                     headers=dict(self.headers, **{'Content-Type': content_type}))
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                return resp.status, resp.headers.get('Retry-After')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Retry-After')
+
+class LocalSender:
+    """Drives the Flask app in-process through its test client."""
+    def __init__(self, headers):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from app import create_app
+        self.app = create_app()
+        self.headers = headers
+
+    def send(self, body, content_type):
+        with self.app.test_client() as client:
+            resp = client.post('/api/sensors/readings', data=body, content_type=content_type,
+                               headers=self.headers, base_url='https://localhost')
+            return resp.status_code, resp.headers.get('Retry-After')
+
+def run(args):
+    headers = {}
+    if args.key:
+        headers['X-Sensor-Key'] = args.key
+    if args.token:
+        headers['Authorization'] = f'Bearer {args.token}'
+    sender = LocalSender(headers) if args.local else HttpSender(args.url, headers)
+    room_ids = list(range(args.first_room, args.first_room + args.rooms))
+
+    totals = {'sent': 0, 'accepted': 0, 'throttled': 0, 'errors': 0, 'latency': []}
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+    per_thread_rate = args.rate / args.threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        interval = args.batch / per_thread_rate
+        next_send = time.time()
+        while time.time() < deadline:
+            batch = make_batch(room_ids, args.batch, rng)
+            body, content_type = encode(batch, args.format)
+            started = time.perf_counter()
+            status, retry_after = sender.send(body, content_type)
+            elapsed = time.perf_counter() - started
+            with lock:
+                totals['sent'] += len(batch)
+                totals['latency'].append(elapsed)
+                if status == 202:
+                    totals['accepted'] += len(batch)
+                elif status == 429:
+                    totals['throttled'] += 1
+                else:
+                    totals['errors'] += 1
+            if status == 429:
+                time.sleep(float(retry_after or 1))
+                next_send = time.time()
+                continue
+            next_send += interval
+            time.sleep(max(0.0, next_send - time.time()))
+
+    print(f"\n📡 --- SmartEnergy Sensor Simulator ---\n")
+    print(f"   Target:  {'in-process app' if args.local else args.url}")
+    print(f"   Rooms:   {args.rooms}, rate {args.rate}/s in batches of {args.batch} over {args.threads} threads")
+
+    started = time.time()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    latency = sorted(totals['latency']) or [0.0]
+    print(f"\n   Accepted {totals['accepted']:,} of {totals['sent']:,} readings in {elapsed:.1f}s "
+          f"({totals['accepted'] / elapsed:,.0f} readings/sec)")
+    print(f"   429 responses: {totals['throttled']}, other errors: {totals['errors']}")
+    print(f"   Request latency p50 {latency[len(latency) // 2] * 1000:.1f} ms, "
+          f"p99 {latency[int(len(latency) * 0.99)] * 1000:.1f} ms")
+    print("\n--- Simulation Complete ---\n")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate occupancy sensors posting to the telemetry endpoint.')
+    parser.add_argument('--url', default='http://localhost:5000', help='Backend base URL')
+    parser.add_argument('--local', action='store_true', help='Run against an in-process app instead of a server')
+    parser.add_argument('--key', default=os.getenv('SENSOR_INGEST_KEY'), help='X-Sensor-Key value')
+    parser.add_argument('--token', default=None, help='JWT to send when no sensor key is configured')
+    parser.add_argument('--rooms', type=int, default=100, help='Number of rooms to simulate')
+    parser.add_argument('--first-room', type=int, default=1, help='First classroom id')
+    parser.add_argument('--rate', type=float, default=5000, help='Target readings per second')
+    parser.add_argument('--batch', type=int, default=500, help='Readings per request')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent senders')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+    parser.add_argument('--format', choices=['json', 'msgpack'], default='json', help='Request body encoding')
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,93 @@
+"""
+Fast JSON for API responses and the optional columnar response shape.
+
+OrjsonProvider replaces Flask's stdlib JSON provider when orjson is installed
+(JSON_PROVIDER=orjson, the default). Output matches the stdlib provider:
+keys are sorted when `sort_keys` is set, dates go through Flask's default()
+and become HTTP dates, and debug mode indents. The differences are that the
+bytes are compact UTF-8, NaN and infinity become null instead of invalid
+JSON, and numpy scalars and arrays serialize directly. Calls passing stdlib
+json keyword arguments (cls=, indent=, ...) are handed to the stdlib provider.
+
+Tabular endpoints accept `?shape=columns`, which returns
+    {"columns": ["id", "name", ...], "data": [[1, 2, ...], ["A", "B", ...]], "count": 2}
+with one array per column, so key names are not repeated on every row.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib provider is used
+    orjson = None
+
+SHAPES = ('records', 'columns')
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson."""
+    def _option(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps_bytes(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._option(indent))
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; the stdlib raises its own error if it cannot either
+            return super().dumps(obj, indent=2 if indent else None).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+def init_app(app):
+    """Install the configured JSON provider."""
+    choice = app.config.get('JSON_PROVIDER', 'orjson')
+    if choice == 'orjson':
+        if orjson is None:
+            app.logger.warning(">>> JSON: orjson is not installed; using the stdlib provider")
+        else:
+            app.json = OrjsonProvider(app)
+    app.json.sort_keys = app.config.get('JSON_SORT_KEYS', True)
+
+# --- Response shapes ----------------------------------------------------------------
+
+def requested_shape(args):
+    """(shape, error) from the `shape` query argument; records when absent."""
+    shape = args.get('shape', 'records')
+    if shape not in SHAPES:
+        return None, f"shape must be one of {', '.join(SHAPES)}"
+    return shape, None
+
+def to_columns(rows, columns=None):
+    """Column-major form of a list of dicts. `columns` defaults to the keys of the first row."""
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    return {'columns': columns, 'data': [[row[c] for row in rows] for c in columns], 'count': len(rows)}
+
+def shaped(rows, shape, columns=None):
+    return to_columns(rows, columns) if shape == 'columns' else rows
+
+def frame_records(frame):
+    """List of dicts from a DataFrame, with missing values as None."""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+def frame_columns(frame):
+    """Column-major form of a DataFrame, matching to_columns()."""
+    clean = frame.astype(object).where(frame.notna(), None)
+    return {'columns': list(frame.columns), 'data': [clean[c].tolist() for c in frame.columns],
+            'count': len(frame)}
@@ -1,11 +1,20 @@
 import os
 import uuid
+import hashlib
 import smtplib
 import bcrypt
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime
-from models import db, User, EnergyDecision, DailyEnergyLog, Notification
+from datetime import datetime, timedelta
+import time
+import threading
+import logging
+from collections import OrderedDict
+import metrics
+import compression
+from models import db, User, EnergyDecision, DailyEnergyLog, Notification, Timetable, PredictionSnapshot, CacheVersion
+
+logger = logging.getLogger(__name__)
 
 class EmailService:
     @staticmethod
@@ -139,19 +148,20 @@ class EmailService:
             msg['Subject'] = "🔑 Finalize Your SmartEnergy Identity Activation"
             msg.attach(MIMEText(html_body, 'html'))
 
-            if port == 465:
-                smtp = smtplib.SMTP_SSL(server, port, timeout=10)
-            else:
-                smtp = smtplib.SMTP(server, port, timeout=10)
-                smtp.starttls()
+            with metrics.track_email('activation'):
+                if port == 465:
+                    smtp = smtplib.SMTP_SSL(server, port, timeout=10)
+                else:
+                    smtp = smtplib.SMTP(server, port, timeout=10)
+                    smtp.starttls()
 
-            smtp.login(username_smtp, password)
-            smtp.send_message(msg)
-            smtp.quit()
-            print(f"✅ EMAIL SUCCESS: Sent to {to_email}")
+                smtp.login(username_smtp, password)
+                smtp.send_message(msg)
+                smtp.quit()
+            logger.info(f"✅ EMAIL SUCCESS: Sent to {to_email}")
             return True
         except Exception as e:
-            print(f"❌ EMAIL ERROR: {e}")
+            logger.error(f"❌ EMAIL ERROR: {e}")
             return False
 
     @staticmethod
@@ -195,13 +205,13 @@ class EmailService:
             msg['Subject'] = "⚠️ ACTION REQUIRED: New Elevated Access Request"
             msg.attach(MIMEText(html_body, 'html'))
 
-            with smtplib.SMTP(server, port) as smtp:
+            with metrics.track_email('admin_alert'), smtplib.SMTP(server, port) as smtp:
                 smtp.starttls()
                 smtp.login(username_smtp, password)
                 smtp.send_message(msg)
-            print(f"🔒 Security Alert: Admins notified of {new_admin_username} request")
+            logger.info(f"🔒 Security Alert: Admins notified of {new_admin_username} request")
         except Exception as e:
-            print(f"❌ Failed to notify admins: {e}")
+            logger.error(f"❌ Failed to notify admins: {e}")
 
     @staticmethod
     def notify_superior_of_deletion(superior_email, admin_name, target_user_name, target_role):
@@ -239,13 +249,13 @@ class EmailService:
             msg['Subject'] = f"⚠️ SECURE LOG: Faculty User Removed by {admin_name}"
             msg.attach(MIMEText(html_body, 'html'))
 
-            with smtplib.SMTP(server, port) as smtp:
+            with metrics.track_email('deletion_alert'), smtplib.SMTP(server, port) as smtp:
                 smtp.starttls()
                 smtp.login(username_smtp, password)
                 smtp.send_message(msg)
-            print(f"🚨 Superior Admin Alert: Sent to {superior_email}")
+            logger.info(f"🚨 Superior Admin Alert: Sent to {superior_email}")
         except Exception as e:
-            print(f"❌ Failed to notify superior admin: {e}")
+            logger.error(f"❌ Failed to notify superior admin: {e}")
 
 class PasswordService:
     @staticmethod
@@ -456,13 +466,13 @@ class EnergyService:
             msg['Subject'] = f"📊 Weekend Report: {stats['total_savings']} kWh Saved This Week"
             msg.attach(MIMEText(html_body, 'html'))
 
-            with smtplib.SMTP(server, port) as smtp:
+            with metrics.track_email('weekend_report'), smtplib.SMTP(server, port) as smtp:
                 smtp.starttls()
                 smtp.login(username_smtp, password)
                 smtp.send_message(msg)
             return True
         except Exception as e:
-            print(f"❌ Failed to send weekend report: {e}")
+            logger.error(f"❌ Failed to send weekend report: {e}")
             return False
 
 class PasswordService:
@@ -610,10 +620,22 @@ class EnergyService:
             ac_action=ac_action,
             energy_saved_kwh=energy_saved
         )
-        db.session.add(decision)
-        db.session.commit()
+        EnergyService.log_decisions([decision])
         return decision
 
+    @staticmethod
+    def log_decisions(decisions):
+        """Insert EnergyDecision rows in one commit, then fold them into the analytics rollups."""
+        from flask import current_app
+        from analytics_engine import refresh_rollups
+
+        if not decisions:
+            return
+        db.session.add_all(decisions)
+        db.session.commit()
+        # The rollup watermark moving is what invalidates cached analytics responses
+        refresh_rollups(db.engine, current_app.config, backfill=False)
+
     @staticmethod
     def get_daily_summary():
         today = datetime.utcnow().date()
@@ -640,25 +662,32 @@ class EnergyService:
         } for d in decisions]
 
 class ReportingService:
+    @staticmethod
+    def _savings_between(start, end, with_count=False):
+        """kWh saved in [start, end), including decisions already moved out of the hot table."""
+        from flask import current_app
+        from retention import savings_by_building
+        totals = savings_by_building(db.engine, current_app.config, start, end)
+        kwh = sum(entry['kwh'] for entry in totals.values())
+        if with_count:
+            return kwh, sum(entry['decisions'] for entry in totals.values())
+        return kwh
+
     @staticmethod
     def get_today_savings():
-        from sqlalchemy import func
-        from datetime import datetime
+        from datetime import datetime, timedelta
         today = datetime.utcnow().date()
-        savings = db.session.query(func.sum(EnergyDecision.energy_saved_kwh)).filter(func.date(EnergyDecision.timestamp) == today).scalar() or 0
+        savings = ReportingService._savings_between(today, today + timedelta(days=1))
         return round(float(savings), 2)
 
     @staticmethod
     def generate_weekly_stats():
-        from sqlalchemy import func
         from datetime import datetime, timedelta
         seven_days_ago = datetime.utcnow() - timedelta(days=7)
         prev_seven_days = datetime.utcnow() - timedelta(days=14)
         
-        current_week_savings = db.session.query(func.sum(EnergyDecision.energy_saved_kwh)).filter(EnergyDecision.timestamp >= seven_days_ago).scalar() or 0
-        current_week_decisions = EnergyDecision.query.filter(EnergyDecision.timestamp >= seven_days_ago).count()
-        
-        prev_week_savings = db.session.query(func.sum(EnergyDecision.energy_saved_kwh)).filter(EnergyDecision.timestamp >= prev_seven_days, EnergyDecision.timestamp < seven_days_ago).scalar() or 0
+        current_week_savings, current_week_decisions = ReportingService._savings_between(seven_days_ago, None, with_count=True)
+        prev_week_savings = ReportingService._savings_between(prev_seven_days, seven_days_ago)
         
         growth = 0
         if prev_week_savings > 0:
@@ -693,3 +722,231 @@ class ReportingService:
         
         db.session.commit()
         return success_count
+
+class PredictionService:
+    """Keeps PredictionSnapshot in sync with the timetable and the current model."""
+    HORIZON_DAYS = 14
+
+    @staticmethod
+    def _input_hash(entry):
+        raw = f"{entry.day_of_week}|{entry.time_slot}|{entry.subject_type}|{entry.expected_attendance}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _upcoming_dates(day_of_week, start, horizon_days):
+        """Dates in [start, start + horizon_days) that fall on the entry's weekday."""
+        from timeslots import parse_day
+        idx = parse_day(day_of_week)
+        if idx is None:
+            return []
+        current = start + timedelta(days=(idx - start.weekday()) % 7)
+        dates = []
+        while current < start + timedelta(days=horizon_days):
+            dates.append(current)
+            current += timedelta(weeks=1)
+        return dates
+
+    @staticmethod
+    def refresh_snapshots(horizon_days=None, force=False, entry_ids=None):
+        """Score every dirty (timetable entry, upcoming date) pair in one vectorized pass.
+
+        An entry is dirty when it has no snapshot yet, its day/time/type/attendance
+        changed, or the model file changed since it was scored. Clean entries only
+        get new dates copied forward as the window rolls. `entry_ids` limits the pass
+        to those entries (a timetable write), dropping the snapshots of any that were deleted.
+        """
+        import pandas as pd
+        from ml_engine import MLEngine, model_version
+
+        horizon_days = horizon_days or PredictionService.HORIZON_DAYS
+        today = datetime.utcnow().date()
+        try:
+            # Roll the window: past sessions no longer need a prediction
+            PredictionSnapshot.query.filter(PredictionSnapshot.target_date < today).delete(synchronize_session=False)
+
+            entry_query, snap_query = Timetable.query, PredictionSnapshot.query
+            if entry_ids is not None:
+                entry_query = entry_query.filter(Timetable.id.in_(entry_ids))
+                snap_query = snap_query.filter(PredictionSnapshot.timetable_id.in_(entry_ids))
+            entries = entry_query.all()
+            live_ids = {e.id for e in entries}
+            current = {}
+            for snap in snap_query.all():
+                if snap.timetable_id not in live_ids:
+                    db.session.delete(snap)
+                    continue
+                current.setdefault(snap.timetable_id, {})[snap.target_date] = snap
+
+            version = model_version()
+            dirty, copy_forward = [], []
+            for entry in entries:
+                snaps = current.get(entry.id)
+                sample = next(iter(snaps.values())) if snaps else None
+                if (force or sample is None or sample.model_version != version
+                        or sample.input_hash != PredictionService._input_hash(entry)):
+                    dirty.append(entry)
+                else:
+                    copy_forward.append((entry, sample))
+
+            rows = []
+            if dirty:
+                frame = pd.DataFrame({
+                    'day': [e.day_of_week for e in dirty],
+                    'hour': [e.time_slot for e in dirty],
+                    'type': [e.subject_type for e in dirty],
+                    'attendance': [e.expected_attendance for e in dirty]
+                })
+                scored = MLEngine().predict_frame(frame)
+                # predict_frame may have trained an initial model
+                version = model_version()
+                PredictionSnapshot.query.filter(
+                    PredictionSnapshot.timetable_id.in_([e.id for e in dirty])
+                ).delete(synchronize_session=False)
+                for entry, pred in zip(dirty, scored.itertuples(index=False)):
+                    for target_date in PredictionService._upcoming_dates(entry.day_of_week, today, horizon_days):
+                        rows.append({
+                            'timetable_id': entry.id, 'target_date': target_date,
+                            'predicted_occupancy': pred.predicted_occupancy, 'level_idx': int(pred.level_idx),
+                            'confidence': float(pred.confidence), 'reasoning': pred.reasoning,
+                            'recommendation': pred.recommendation,
+                            'input_hash': PredictionService._input_hash(entry), 'model_version': version,
+                            'computed_at': datetime.utcnow()
+                        })
+
+            for entry, sample in copy_forward:
+                for target_date in PredictionService._upcoming_dates(entry.day_of_week, today, horizon_days):
+                    if target_date not in current[entry.id]:
+                        rows.append({
+                            'timetable_id': entry.id, 'target_date': target_date,
+                            'predicted_occupancy': sample.predicted_occupancy, 'level_idx': sample.level_idx,
+                            'confidence': sample.confidence, 'reasoning': sample.reasoning,
+                            'recommendation': sample.recommendation,
+                            'input_hash': sample.input_hash, 'model_version': sample.model_version,
+                            'computed_at': datetime.utcnow()
+                        })
+
+            if rows:
+                db.session.execute(PredictionSnapshot.__table__.insert(), rows)
+            db.session.commit()
+            return {'entries': len(entries), 'recomputed': len(dirty), 'rows_written': len(rows)}, None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+
+    @staticmethod
+    def get_next_snapshots():
+        """Map timetable_id -> snapshot for the entry's next upcoming session."""
+        today = datetime.utcnow().date()
+        snapshots = {}
+        for snap in PredictionSnapshot.query.filter(PredictionSnapshot.target_date >= today).order_by(PredictionSnapshot.target_date).all():
+            snapshots.setdefault(snap.timetable_id, snap)
+        return snapshots
+
+class CacheService:
+    """Versioned response cache for read-mostly endpoints.
+
+    Each cached table has a counter in CacheVersion that write paths bump in
+    the same transaction as their change. Every worker keeps its own rendered
+    bodies and revalidates with a single version query, so invalidation is
+    shared through the database without any extra broker. The body store is
+    an LRU capped at RESPONSE_CACHE_SIZE, since some keys embed query arguments.
+    """
+    _responses = OrderedDict()
+    _lock = threading.Lock()
+
+    TABLES = ('classroom', 'timetable')
+
+    @staticmethod
+    def _increment(name):
+        return CacheVersion.query.filter_by(name=name).update(
+            {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+        )
+
+    @staticmethod
+    def seed(names=TABLES):
+        """Create missing counters up front (from seed_database) so bumps are plain UPDATEs."""
+        for name in names:
+            if not CacheVersion.query.get(name):
+                CacheService._insert_or_bump(name)
+        db.session.commit()
+
+    @staticmethod
+    def _insert_or_bump(name):
+        from sqlalchemy.exc import IntegrityError
+        try:
+            # Savepoint: two first writers can both miss the row, and the loser
+            # must not fail its whole transaction over the duplicate key
+            with db.session.begin_nested():
+                # Seed from the clock so ETags never repeat after a database reset
+                db.session.add(CacheVersion(name=name, version=int(time.time() * 1000)))
+        except IntegrityError:
+            CacheService._increment(name)
+
+    @staticmethod
+    def claim(name, value):
+        """Advance counter `name` to `value` if it is behind. True only for the caller that moved it.
+
+        Scheduled jobs pass the run's date ordinal so that, of all the workers
+        waking at the same hour, exactly one does the work.
+        """
+        from sqlalchemy.exc import IntegrityError
+        claimed = CacheVersion.query.filter(CacheVersion.name == name, CacheVersion.version < value) \
+            .update({CacheVersion.version: value}, synchronize_session=False)
+        if not claimed and not CacheVersion.query.filter_by(name=name).count():
+            try:
+                with db.session.begin_nested():
+                    db.session.add(CacheVersion(name=name, version=value))
+                claimed = 1
+            except IntegrityError:
+                claimed = CacheVersion.query.filter(CacheVersion.name == name, CacheVersion.version < value) \
+                    .update({CacheVersion.version: value}, synchronize_session=False)
+        db.session.commit()
+        return bool(claimed)
+
+    @staticmethod
+    def bump(*names):
+        """Mark tables as changed. Call before the write's commit."""
+        for name in names:
+            if not CacheService._increment(name):
+                CacheService._insert_or_bump(name)
+
+    @staticmethod
+    def get_versions(names):
+        rows = CacheVersion.query.filter(CacheVersion.name.in_(names)).all()
+        found = {row.name: row.version for row in rows}
+        return tuple(found.get(name, 0) for name in names)
+
+    @staticmethod
+    def cached_json(key, depends_on, builder):
+        """Return a JSON response for `builder()`, rebuilt only when a dependency changed.
+
+        Honours If-None-Match with a 304 so polling clients skip the body entirely.
+        """
+        from flask import request, current_app, Response
+
+        versions = CacheService.get_versions(depends_on)
+        etag = f'{key}-' + '-'.join(str(v) for v in versions)
+        # Clients holding a compressed copy send back the encoding-suffixed ETag
+        matched = next((tag for tag in compression.etag_variants(etag) if tag in request.if_none_match), None)
+        if matched:
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            with CacheService._lock:
+                cached = CacheService._responses.get(key)
+                if cached:
+                    CacheService._responses.move_to_end(key)
+            if cached and cached[0] == versions:
+                body = cached[1]
+            else:
+                body = current_app.json.dumps(builder()).encode()
+                limit = current_app.config.get('RESPONSE_CACHE_SIZE', 256)
+                with CacheService._lock:
+                    CacheService._responses[key] = (versions, body)
+                    CacheService._responses.move_to_end(key)
+                    while len(CacheService._responses) > limit:
+                        CacheService._responses.popitem(last=False)
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,224 @@
+"""
+Semester what-if simulator.
+
+Replays every timetable session over each matching calendar day of a date
+range through the occupancy model and the device policy, once per
+scenario. Scenarios can move sessions (e.g. evening labs to mornings),
+scale attendance, change the level at which ACs run or how far Medium
+rooms dim their lights.
+
+The model depends only on weekday, hour, type and attendance, so each
+distinct feature row is scored once across all weeks and scenarios. Calendar
+days become per-weekday weights, and the policy is applied to a
+(scenarios x sessions) grid in one pass. Results are cached per scenario
+hash together with the timetable, model and calendar they were computed
+against.
+"""
+import json
+import hashlib
+import threading
+from datetime import timedelta
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from energy_engine import DEVICE_WATTS, BASELINE_VECTOR, building_factors
+from timeslots import DAY_NAMES, DAY_MINUTES, parse_clock, week_window
+
+LEVEL_NAMES = {'low': 0, 'medium': 1, 'high': 2}
+DEFAULT_SCENARIO = {'name': 'current', 'ac_level': 'High', 'medium_lights': 0.5, 'attendance_factor': 1.0, 'shifts': []}
+RESULT_CACHE_LIMIT = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def normalize_scenario(scenario):
+    """Fill defaults and validate. Returns (scenario, error)."""
+    if scenario is not None and not isinstance(scenario, dict):
+        return None, f"Each scenario must be an object: {scenario!r}"
+    merged = dict(DEFAULT_SCENARIO, **(scenario or {}))
+    if str(merged['ac_level']).lower() not in LEVEL_NAMES:
+        return None, 'ac_level must be one of Low, Medium, High'
+    merged['ac_level'] = str(merged['ac_level']).capitalize()
+    try:
+        merged['medium_lights'] = min(max(float(merged['medium_lights']), 0.0), 1.0)
+        merged['attendance_factor'] = max(float(merged['attendance_factor']), 0.0)
+    except (TypeError, ValueError):
+        return None, 'medium_lights and attendance_factor must be numbers'
+
+    if not isinstance(merged.get('shifts') or [], list):
+        return None, 'shifts must be a list of rules'
+    shifts = []
+    for rule in merged.get('shifts') or []:
+        if not isinstance(rule, dict):
+            return None, f"Each shift rule must be an object: {rule!r}"
+        to_minute = parse_clock(rule.get('to'))
+        if to_minute is None:
+            return None, f"Shift rule needs a valid 'to' time: {rule}"
+        bounds = {}
+        for key in ('after', 'before'):
+            bounds[key] = parse_clock(rule[key]) if rule.get(key) else None
+            if rule.get(key) and bounds[key] is None:
+                return None, f"Shift rule has an invalid '{key}' time: {rule}"
+        if not all(isinstance(rule.get(key), (str, type(None))) for key in ('type', 'building')):
+            return None, f"Shift rule 'type' and 'building' must be strings: {rule}"
+        shifts.append({'type': rule.get('type'), 'building': rule.get('building'), **bounds, 'to': to_minute})
+    merged['shifts'] = shifts
+    return merged, None
+
+def scenario_hash(scenario):
+    body = {k: v for k, v in scenario.items() if k != 'name'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+
+def weekday_weights(start, end, holidays=()):
+    """How many times each weekday occurs in [start, end], skipping holidays."""
+    weights = np.zeros(7)
+    skip = set(holidays)
+    day = start
+    while day <= end:
+        if day not in skip:
+            weights[day.weekday()] += 1
+        day += timedelta(days=1)
+    return weights
+
+class SemesterModel:
+    """Session arrays for one timetable; positions index sessions, not DB ids."""
+    def __init__(self, sessions):
+        self.n = len(sessions)
+        self.room = np.array([s['classroom_id'] for s in sessions], dtype=int)
+        self.building = np.array([s['building'] or '' for s in sessions], dtype=object)
+        self.day = np.array([s['start'] // DAY_MINUTES for s in sessions], dtype=int)
+        self.start = np.array([s['start'] % DAY_MINUTES for s in sessions], dtype=int)
+        self.minutes = np.array([s['end'] - s['start'] for s in sessions], dtype=float)
+        self.type = np.array([str(s['type'] or 'Lecture') for s in sessions], dtype=object)
+        self.attendance = np.array([s['attendance'] if s['attendance'] is not None else 50 for s in sessions], dtype=float)
+        self.devices = np.array([s['devices'] for s in sessions], dtype=float).reshape(-1, 3)
+
+    def shifted_starts(self, scenario):
+        start = self.start.copy()
+        for rule in scenario['shifts']:
+            match = np.ones(self.n, dtype=bool)
+            if rule['type']:
+                match &= np.char.lower(self.type.astype(str)) == rule['type'].lower()
+            if rule['building']:
+                match &= self.building == rule['building']
+            if rule['after'] is not None:
+                match &= self.start >= rule['after']
+            if rule['before'] is not None:
+                match &= self.start < rule['before']
+            start[match] = rule['to']
+        return start
+
+def _score(ml, model, scenarios):
+    """(S, N, 3) class probabilities, scoring each distinct feature row once."""
+    hours = np.stack([model.shifted_starts(s) // 60 for s in scenarios])
+    attendance = np.stack([model.attendance * s['attendance_factor'] for s in scenarios])
+    frame = pd.DataFrame({
+        'day': np.tile(model.day, len(scenarios)),
+        'hour': hours.ravel(),
+        'type': np.tile(model.type, len(scenarios)),
+        'attendance': np.round(attendance.ravel(), 1)
+    })
+    # Group ids follow first appearance, matching drop_duplicates() row order
+    inverse = frame.groupby(list(frame.columns), sort=False).ngroup().to_numpy()
+    unique_frame = frame.drop_duplicates().reset_index(drop=True)
+    unique_frame['day'] = unique_frame['day'].map(lambda d: DAY_NAMES[d])
+    probabilities, _ = ml.predict_proba_frame(unique_frame)
+    return probabilities[inverse].reshape(len(scenarios), model.n, 3), len(unique_frame)
+
+def _duty_tensor(scenarios):
+    """(S, 3 levels, 3 devices) duty cycles implied by each scenario's policy."""
+    duty = np.zeros((len(scenarios), 3, 3))
+    for i, s in enumerate(scenarios):
+        ac_from = LEVEL_NAMES[s['ac_level'].lower()]
+        for level in range(3):
+            ac = 1.0 if level >= ac_from and level > 0 else 0.0
+            lights = (0.0, s['medium_lights'], 1.0)[level]
+            # High is full power, as in energy_engine.LEVEL_DUTY; below it fans stand in for the AC
+            fans = 1.0 if level == 2 or (level >= 1 and not ac) else 0.0
+            duty[i, level] = (lights, ac, fans)
+    return duty
+
+def simulate(ml, model, scenarios, weights, config):
+    """Metrics per scenario, all scenarios evaluated together."""
+    if model.n == 0:
+        empty = {'kwh': 0.0, 'baseline_kwh': 0.0, 'cost': 0.0, 'co2_kg': 0.0, 'comfort_violation_hours': 0.0, 'room_days': 0}
+        return [dict(empty) for _ in scenarios], 0
+
+    probs, scored_rows = _score(ml, model, scenarios)
+    level = np.argmax(probs, axis=2)                                   # (S, N)
+    duty = _duty_tensor(scenarios)                                     # (S, 3, 3)
+    session_duty = np.take_along_axis(duty, level[:, :, None], axis=1)  # (S, N, 3)
+
+    load_kw = model.devices * DEVICE_WATTS / 1000.0                    # (N, 3)
+    weight_hours = weights[model.day] * model.minutes / 60.0           # (N,) hours over the whole range
+    kwh = (session_duty * load_kw[None]).sum(axis=2) * weight_hours    # (S, N)
+    baseline = (load_kw @ BASELINE_VECTOR) * weight_hours              # (N,)
+
+    # Expected hours where the room is likely full but the policy leaves the AC off
+    ac_off = session_duty[:, :, 1] == 0
+    violations = (probs[:, :, 2] * ac_off * weight_hours).sum(axis=1)
+
+    factors = {b: building_factors(b, config) for b in set(model.building)}
+    tariff = np.array([factors[b][0] for b in model.building])
+    co2 = np.array([factors[b][1] for b in model.building])
+
+    room_day_pairs = {(r, d) for r, d in zip(model.room, model.day)}
+    room_days = int(sum(weights[d] for _, d in room_day_pairs))
+
+    results = []
+    for i in range(len(scenarios)):
+        results.append({
+            'kwh': round(float(kwh[i].sum()), 1),
+            'baseline_kwh': round(float(baseline.sum()), 1),
+            'cost': round(float((kwh[i] * tariff).sum()), 2),
+            'co2_kg': round(float((kwh[i] * co2).sum()), 1),
+            'comfort_violation_hours': round(float(violations[i]), 1),
+            'room_days': room_days
+        })
+    return results, scored_rows
+
+def run(ml, model, scenarios, weights, config, context_key):
+    """simulate() with a per-scenario result cache keyed by scenario hash and `context_key`."""
+    keys = [(scenario_hash(s), context_key) for s in scenarios]
+    results = [None] * len(scenarios)
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            if key in _cache:
+                _cache.move_to_end(key)
+                results[i] = _cache[key]
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    scored_rows = 0
+    if missing:
+        fresh, scored_rows = simulate(ml, model, [scenarios[i] for i in missing], weights, config)
+        with _cache_lock:
+            for i, metrics in zip(missing, fresh):
+                results[i] = metrics
+                _cache[keys[i]] = metrics
+            while len(_cache) > RESULT_CACHE_LIMIT:
+                _cache.popitem(last=False)
+
+    report = []
+    for scenario, key, metrics in zip(scenarios, keys, results):
+        report.append(dict(metrics, name=scenario['name'], scenario_hash=key[0]))
+    return report, {'computed': len(missing), 'cached': len(scenarios) - len(missing), 'scored_rows': scored_rows}
+
+def load_model():
+    """SemesterModel over every active room's timetable."""
+    from models import Classroom, Timetable, db
+
+    rows = db.session.query(Timetable, Classroom).join(Classroom, Classroom.id == Timetable.classroom_id).filter(
+        Classroom.is_active == True).all()
+    sessions = []
+    for entry, room in rows:
+        start, end = (entry.start_minute, entry.end_minute) if entry.start_minute is not None else week_window(entry.day_of_week, entry.time_slot)
+        if start is None:
+            continue
+        sessions.append({
+            'classroom_id': room.id, 'building': room.building, 'start': start, 'end': end,
+            'type': entry.subject_type, 'attendance': entry.expected_attendance,
+            'devices': (room.num_lights or 0, room.num_acs or 0, room.num_fans or 0)
+        })
+    return SemesterModel(sessions)
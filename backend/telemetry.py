@@ -0,0 +1,222 @@
+"""
+Occupancy sensor telemetry: day-partitioned storage and a group-commit buffer.
+
+Request handlers only validate readings and append them to a bounded
+in-memory buffer; one writer thread per process drains it and inserts each
+batch with a single multi-row INSERT per day partition inside one
+transaction. When the buffer is full the whole batch is refused so the
+caller can back off (HTTP 429) instead of the process growing without bound.
+Readings must fall inside a window around the server clock, so a device
+with a wrong clock cannot create partitions for arbitrary days, and the
+nightly job drops day partitions older than the retention period.
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
+
+from partitions import TimePartitions
+
+def _reading_columns():
+    return [
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('classroom_id', Integer, nullable=False),
+        Column('sensor_id', String(50)),
+        Column('recorded_at', DateTime, nullable=False),
+        Column('people_count', Integer),
+        Column('motion', Boolean),
+        Column('received_at', DateTime),
+    ]
+
+sensor_partitions = TimePartitions(
+    'sensor_reading', _reading_columns,
+    indexes=[lambda name: Index(f'ix_{name}_room_time', 'classroom_id', 'recorded_at')],
+    granularity='day'
+)
+
+def _parse_timestamp(value):
+    """Epoch seconds or ISO-8601 -> naive UTC datetime (the repo stores utcnow())."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def parse_readings(items, known_rooms, max_age=None, max_skew=None):
+    """Validate raw reading dicts. Returns (rows, errors).
+
+    Readings recorded more than `max_age` seconds ago or more than `max_skew`
+    seconds in the future are rejected.
+    """
+    rows, errors = [], []
+    received = datetime.utcnow()
+    earliest = received - timedelta(seconds=max_age) if max_age is not None else None
+    latest = received + timedelta(seconds=max_skew) if max_skew is not None else None
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f"Reading {i}: expected an object")
+            continue
+        try:
+            room_id = int(item.get('classroom_id', item.get('room')))
+            recorded_at = _parse_timestamp(item.get('ts', item.get('timestamp')))
+            count = item.get('count', item.get('people_count'))
+            count = None if count is None else int(count)
+            motion = item.get('motion')
+        except (TypeError, ValueError, OverflowError, OSError):
+            errors.append(f"Reading {i}: classroom_id and ts are required")
+            continue
+        if (earliest and recorded_at < earliest) or (latest and recorded_at > latest):
+            errors.append(f"Reading {i}: ts {recorded_at.isoformat()} is outside the accepted window")
+            continue
+        if room_id not in known_rooms:
+            errors.append(f"Reading {i}: unknown classroom {room_id}")
+            continue
+        if count is not None and count < 0:
+            errors.append(f"Reading {i}: count must be >= 0")
+            continue
+        rows.append({
+            'classroom_id': room_id, 'sensor_id': str(item['sensor_id'])[:50] if item.get('sensor_id') else None,
+            'recorded_at': recorded_at, 'people_count': count,
+            'motion': None if motion is None else bool(motion), 'received_at': received
+        })
+    return rows, errors
+
+class TelemetryBuffer:
+    """Bounded queue of readings plus the writer thread that group-commits them."""
+    def __init__(self, app, capacity, flush_rows, flush_interval):
+        self.app = app
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self.stats = {'accepted': 0, 'rejected': 0, 'written': 0, 'failed': 0, 'flushes': 0,
+                      'last_flush_rows': 0, 'last_flush_ms': 0.0, 'last_error': None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def offer(self, rows):
+        """Queue all rows or none. Returns False when the buffer cannot take them."""
+        with self._cond:
+            if len(self._queue) + len(rows) > self.capacity:
+                self.stats['rejected'] += len(rows)
+                return False
+            self._queue.extend(rows)
+            self.stats['accepted'] += len(rows)
+            if len(self._queue) >= self.flush_rows:
+                self._cond.notify()
+        return True
+
+    def depth(self):
+        return len(self._queue)
+
+    def retry_after(self):
+        """Seconds a refused client should wait: time to drain the current backlog."""
+        if not self.stats['last_flush_rows']:
+            return 1
+        rate = self.stats['last_flush_rows'] / max(self.stats['last_flush_ms'] / 1000.0, 1e-3)
+        return min(30, max(1, int(self.depth() / rate) + 1))
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=10)
+
+    def _drain(self):
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.flush_rows * 4))]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._queue) < self.flush_rows:
+                    self._cond.wait(timeout=self.flush_interval)
+                stopping = self._stopped
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+            if stopping and not self._queue:
+                return
+
+    def _write(self, batch):
+        from models import db
+
+        started = time.perf_counter()
+        by_day = {}
+        for row in batch:
+            by_day.setdefault(sensor_partitions.key(row['recorded_at']), []).append(row)
+        try:
+            with self.app.app_context():
+                engine = db.engine
+                tables = {day: sensor_partitions.ensure(engine, day) for day in by_day}
+                # One transaction (one fsync) for the whole batch
+                with engine.begin() as conn:
+                    for day, rows in by_day.items():
+                        conn.execute(tables[day].insert(), rows)
+            self.stats['written'] += len(batch)
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            self.stats['last_error'] = str(e)
+            self.app.logger.error(f">>> TELEMETRY: Dropped {len(batch)} readings: {e}")
+        self.stats['flushes'] += 1
+        self.stats['last_flush_rows'] = len(batch)
+        self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+_buffer_lock = threading.Lock()
+
+def get_buffer():
+    """The current app's buffer, started on first use (one per worker process)."""
+    from flask import current_app
+
+    app = current_app._get_current_object()
+    buffer = app.extensions.get('telemetry')
+    if buffer is None:
+        with _buffer_lock:
+            buffer = app.extensions.get('telemetry')
+            if buffer is None:
+                buffer = TelemetryBuffer(
+                    app, app.config['SENSOR_BUFFER_MAX'], app.config['SENSOR_FLUSH_ROWS'],
+                    app.config['SENSOR_FLUSH_INTERVAL']
+                )
+                buffer.start()
+                app.extensions['telemetry'] = buffer
+    return buffer
+
+def drop_expired_partitions(engine, retention_days):
+    """Drop day partitions older than `retention_days`. Returns the dropped dates."""
+    cutoff = sensor_partitions.key(datetime.utcnow() - timedelta(days=retention_days))
+    dropped = []
+    for key, _ in sensor_partitions.between(engine):
+        if key < cutoff and sensor_partitions.drop(engine, key):
+            dropped.append(key.isoformat())
+    return dropped
+
+def query_readings(engine, classroom_id=None, start=None, end=None, limit=1000):
+    """Readings in [start, end] across every day partition in range, newest first."""
+    from sqlalchemy import select
+
+    readings = sensor_partitions.union(engine, start, end)
+    if readings is None:
+        return []
+    query = select(readings)
+    if classroom_id is not None:
+        query = query.where(readings.c.classroom_id == classroom_id)
+    if start is not None:
+        query = query.where(readings.c.recorded_at >= start)
+    if end is not None:
+        query = query.where(readings.c.recorded_at <= end)
+    query = query.order_by(readings.c.recorded_at.desc()).limit(limit)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(query)]
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+# app.py builds a module-level app from FLASK_ENV; keep it on the testing config
+os.environ['FLASK_ENV'] = 'testing'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from models import db, User, Classroom, Timetable
+from services import CacheService
+from security import IdentityCache
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    # Keep archive reads and writes away from the real data/archive
+    app.config['ENERGY_ARCHIVE_DIR'] = str(tmp_path / 'archive')
+    with app.app_context():
+        db.create_all()
+        # Per-process caches outlive the in-memory database between tests
+        CacheService._responses.clear()
+        IdentityCache._entries.clear()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def auth_headers(app):
+    """Authorization header for a fresh admin account."""
+    from flask_jwt_extended import create_access_token
+    from security import identity_claims
+
+    user = User(username='admin', email='admin@test.local', password_hash='x', role='admin', is_active_account=True)
+    db.session.add(user)
+    db.session.commit()
+    token = create_access_token(identity=str(user.id), additional_claims=identity_claims(user))
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def make_room(app):
+    """Create a classroom with one Monday 09:00 session; returns (classroom, timetable entry)."""
+    def make(name='R101', building='A', capacity=50, attendance=30):
+        room = Classroom(name=name, building=building, capacity=capacity, num_lights=8, num_acs=2, num_fans=4)
+        db.session.add(room)
+        db.session.flush()
+        entry = Timetable(classroom_id=room.id, day_of_week='Monday', time_slot='09:00', subject='Databases',
+                          subject_type='theory', teacher_name='T', teacher_email='t@test.local',
+                          expected_attendance=attendance)
+        db.session.add(entry)
+        db.session.commit()
+        return room, entry
+    return make
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from models import db, AttendanceHistory, EnergyDecision
+import analytics_engine
+
+def record_attendance(entry, count, days_ago=1):
+    db.session.add(AttendanceHistory(timetable_id=entry.id, actual_attendance=count,
+                                     date=(datetime.utcnow() - timedelta(days=days_ago)).date()))
+    db.session.commit()
+
+def test_average_occupancy_is_share_of_capacity(app, make_room):
+    _, entry = make_room(capacity=50)
+    record_attendance(entry, 40)
+    assert analytics_engine.average_occupancy(db.engine, app.config) == 80.0
+
+def test_average_occupancy_averages_sessions_and_caps_overfull_rooms(app, make_room):
+    _, small = make_room(name='S1', capacity=50)
+    _, hall = make_room(name='H1', capacity=200)
+    record_attendance(small, 75)   # over capacity: counts as 100%
+    record_attendance(hall, 120)   # 60%
+    assert analytics_engine.average_occupancy(db.engine, app.config) == 80.0
+
+def test_average_occupancy_ignores_old_sessions(app, make_room):
+    _, entry = make_room(capacity=50)
+    record_attendance(entry, 10, days_ago=60)
+    record_attendance(entry, 40)
+    assert analytics_engine.average_occupancy(db.engine, app.config, days=30) == 80.0
+
+def test_average_occupancy_falls_back_to_decision_mix(app, make_room):
+    room, _ = make_room()
+    db.session.add_all([
+        EnergyDecision(classroom_id=room.id, predicted_occupancy='High', timestamp=datetime.utcnow() - timedelta(hours=2)),
+        EnergyDecision(classroom_id=room.id, predicted_occupancy='Low', timestamp=datetime.utcnow() - timedelta(hours=2)),
+    ])
+    db.session.commit()
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    expected = float(analytics_engine.OCCUPANCY_LEVEL_PERCENT[[0, 2]].mean())
+    assert analytics_engine.average_occupancy(db.engine, app.config) == round(expected, 1)
+
+def test_dashboard_reports_occupancy_against_capacity(app, client, auth_headers, make_room):
+    _, entry = make_room(capacity=50)
+    record_attendance(entry, 40)
+    response = client.get('https://localhost/api/dashboard/stats', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()['avg_occupancy'] == 80.0
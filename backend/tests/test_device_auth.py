@@ -0,0 +1,60 @@
+import pytest
+
+# An object without "readings" is rejected with 400 after authentication, so the
+# status tells whether the credentials were accepted without starting the write buffer
+NOT_A_BATCH = {}
+
+@pytest.fixture
+def device_key(app):
+    app.config['SENSOR_INGEST_KEY'] = 'device-secret'
+    return 'device-secret'
+
+def test_configured_key_is_required_even_with_a_jwt(client, auth_headers, device_key):
+    response = client.post('https://localhost/api/sensors/readings', json=NOT_A_BATCH, headers=auth_headers)
+    assert response.status_code == 401
+
+def test_wrong_device_key_is_rejected(client, device_key):
+    response = client.post('https://localhost/api/sensors/readings', json=NOT_A_BATCH,
+                           headers={'X-Sensor-Key': 'guess'})
+    assert response.status_code == 401
+
+def test_device_key_is_accepted(client, device_key):
+    response = client.post('https://localhost/api/sensors/readings', json=NOT_A_BATCH,
+                           headers={'X-Sensor-Key': device_key})
+    assert response.status_code == 400
+
+def test_jwt_is_accepted_when_no_key_is_configured(client, auth_headers):
+    response = client.post('https://localhost/api/sensors/readings', json=NOT_A_BATCH, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_anonymous_readings_are_rejected_without_a_key(client):
+    response = client.post('https://localhost/api/sensors/readings', json=NOT_A_BATCH)
+    assert response.status_code == 401
+
+@pytest.fixture
+def faculty_headers(app):
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+    from security import identity_claims
+
+    user = User(username='faculty', email='faculty@test.local', password_hash='x', role='faculty', is_active_account=True)
+    db.session.add(user)
+    db.session.commit()
+    token = create_access_token(identity=str(user.id), additional_claims=identity_claims(user))
+    return {'Authorization': f'Bearer {token}'}
+
+# Actuation is disabled in tests, so an ack that passes authentication answers 409
+ACKS = {'ids': [1]}
+
+def test_faculty_cannot_acknowledge_commands(client, faculty_headers):
+    response = client.post('https://localhost/api/actuation/acks', json=ACKS, headers=faculty_headers)
+    assert response.status_code == 401
+
+def test_admin_can_acknowledge_without_a_device_key(client, auth_headers):
+    response = client.post('https://localhost/api/actuation/acks', json=ACKS, headers=auth_headers)
+    assert response.status_code == 409
+
+def test_acks_need_the_configured_device_key(client, auth_headers, device_key):
+    assert client.post('https://localhost/api/actuation/acks', json=ACKS, headers=auth_headers).status_code == 401
+    response = client.post('https://localhost/api/actuation/acks', json=ACKS, headers={'X-Sensor-Key': device_key})
+    assert response.status_code == 409
@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+import pytest
+
+import ml_engine
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """MLEngine whose model, history and registry files live under tmp_path."""
+    for name, relative in (('MODEL_PATH', 'model.pkl'), ('MASTER_HISTORY_PATH', 'data/history.csv'),
+                           ('MODEL_CACHE_DIR', 'data/model_cache'), ('DIGEST_REGISTRY_PATH', 'data/digested.json'),
+                           ('INGEST_PROGRESS_DIR', 'data/progress')):
+        monkeypatch.setattr(ml_engine, name, str(tmp_path / relative))
+    return ml_engine.MLEngine()
+
+def training_frame():
+    return pd.DataFrame([{'day': day, 'hour': f'{hour:02d}:00', 'type': 'lab' if hour % 2 else 'theory',
+                          'attendance': (hour * 7 + i * 11) % 90}
+                         for i, day in enumerate(('Monday', 'Tue', 'Wednesday')) for hour in range(8, 20)])
+
+def leftover_temp_files(root):
+    return [name for _, _, files in os.walk(root) for name in files if name.endswith('.tmp')]
+
+def test_digest_registry_keeps_the_newest_entries(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(ml_engine, 'DIGEST_REGISTRY_LIMIT', 3)
+    for i in range(5):
+        engine._mark_digested(f'digest-{i}', {'fingerprint': f'fp-{i}'})
+    registry = engine._load_digest_registry()
+    assert len(registry) == 3
+    assert 'digest-4' in registry and 'digest-0' not in registry
+    assert leftover_temp_files(tmp_path) == []
+
+def test_rejected_rows_are_counted(engine):
+    frame = pd.concat([training_frame(), pd.DataFrame([
+        {'day': 'Funday', 'hour': '09:00', 'type': 'lab', 'attendance': 30},
+        {'day': 'Monday', 'hour': 'noon', 'type': 'lab', 'attendance': 30},
+        {'day': 'Monday', 'hour': '10:00', 'type': 'lab', 'attendance': 'lots'},
+    ])], ignore_index=True)
+    report, error = engine.digest_and_train(frame)
+    assert error is None
+    assert report['rejected_records'] == 3
+    assert report['ingested_records'] == len(frame) - 3
+
+def test_cached_artifact_replaces_the_model_file_whole(engine, tmp_path):
+    report, error = engine.digest_and_train(training_frame())
+    assert error is None
+    trained = open(ml_engine.MODEL_PATH, 'rb').read()
+
+    os.remove(ml_engine.MODEL_PATH)
+    model, cached = engine._load_cached_artifact(report['fingerprint'])
+    assert model is not None and cached['fingerprint'] == report['fingerprint']
+    assert open(ml_engine.MODEL_PATH, 'rb').read() == trained
+    assert leftover_temp_files(tmp_path) == []
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, CacheVersion, DecisionRollup, EnergyDecision
+from services import CacheService, EnergyService
+import analytics_engine
+
+SERIES_URL = 'https://localhost/api/analytics/series?grain=day&group_by=none'
+
+def decision(room, level='Low', kwh=1.0, hours_ago=3, **fields):
+    return EnergyDecision(classroom_id=room.id, predicted_occupancy=level, energy_saved_kwh=kwh,
+                          timestamp=datetime.utcnow() - timedelta(hours=hours_ago), **fields)
+
+def watermark():
+    mark = db.session.get(CacheVersion, analytics_engine.WATERMARK)
+    return mark.version if mark else None
+
+def totals(app):
+    end = datetime.utcnow() + timedelta(days=1)
+    return analytics_engine.series(db.engine, app.config, end - timedelta(days=7), end, group_by='none')['totals']
+
+@pytest.fixture
+def room(make_room):
+    return make_room()[0]
+
+def test_refresh_folds_decisions_once(app, room):
+    db.session.add_all([decision(room, 'Low', 2.0), decision(room, 'High', 0.0), decision(room, 'Medium', 1.5)])
+    db.session.commit()
+
+    assert analytics_engine.refresh_rollups(db.engine, app.config) == 3
+    assert watermark() == 3
+    assert analytics_engine.refresh_rollups(db.engine, app.config) == 0
+    result = totals(app)
+    assert result['decisions'] == 3
+    assert result['energy_saved'] == 3.5
+    assert result['occupancy_mix'] == {'low': 1, 'medium': 1, 'high': 1}
+
+def test_refresh_without_backfill_waits_for_the_watermark(app, room):
+    db.session.add(decision(room))
+    db.session.commit()
+    assert analytics_engine.refresh_rollups(db.engine, app.config, backfill=False) == 0
+    assert watermark() is None
+    assert DecisionRollup.query.count() == 0
+
+def test_log_decisions_folds_its_rows(app, room):
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    EnergyService.log_decisions([decision(room, kwh=1.0), decision(room, kwh=2.0)])
+    assert watermark() == 2
+    assert totals(app)['energy_saved'] == 3.0
+
+def test_settled_stops_at_a_recent_gap():
+    now = datetime.utcnow()
+    recent, old = now - timedelta(seconds=5), now - timedelta(seconds=analytics_engine.GAP_GRACE_SECONDS + 1)
+    contiguous = [(1, 0, recent), (2, 0, recent)]
+    assert analytics_engine._settled(contiguous, 0, now) == contiguous
+    assert analytics_engine._settled([(1, 0, recent), (3, 0, recent)], 0, now) == [(1, 0, recent)]
+    assert analytics_engine._settled([(1, 0, recent), (3, 0, old)], 0, now) == [(1, 0, recent), (3, 0, old)]
+    assert analytics_engine._settled([(2, 0, recent)], 0, now) == []
+
+def test_refresh_waits_out_an_id_gap(app, room):
+    # id 2 is missing, as when another transaction took it and has not committed yet
+    db.session.add_all([decision(room, id=1), decision(room, id=3, hours_ago=0)])
+    db.session.commit()
+    assert analytics_engine.refresh_rollups(db.engine, app.config) == 1
+    assert watermark() == 1
+
+    # Once the row after the gap is older than the grace period the gap is given up on
+    EnergyDecision.query.filter_by(id=3).update({'timestamp': datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    assert analytics_engine.refresh_rollups(db.engine, app.config) == 1
+    assert watermark() == 3
+    assert totals(app)['decisions'] == 2
+
+def test_refresh_that_loses_the_watermark_folds_nothing(app, room, monkeypatch):
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    db.session.add(decision(room))
+    db.session.commit()
+    settled = analytics_engine._settled
+
+    def other_worker_claims_first(rows, last_id, now):
+        CacheVersion.query.filter_by(name=analytics_engine.WATERMARK).update({'version': 1})
+        db.session.commit()
+        return settled(rows, last_id, now)
+
+    monkeypatch.setattr(analytics_engine, '_settled', other_worker_claims_first)
+    assert analytics_engine.refresh_rollups(db.engine, app.config) == 0
+    assert DecisionRollup.query.count() == 0
+
+def test_series_cache_follows_the_watermark(app, client, auth_headers, room):
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    first = client.get(SERIES_URL, headers=auth_headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert client.get(SERIES_URL, headers=dict(auth_headers, **{'If-None-Match': etag})).status_code == 304
+
+    # Decisions not yet folded in do not change the response
+    db.session.add(decision(room))
+    db.session.commit()
+    assert client.get(SERIES_URL, headers=auth_headers).headers['ETag'] == etag
+
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    refreshed = client.get(SERIES_URL, headers=auth_headers)
+    assert refreshed.headers['ETag'] != etag
+    assert refreshed.get_json()['totals']['decisions'] == 1
+
+def test_dashboard_stats_does_not_write(app, client, auth_headers, room):
+    analytics_engine.refresh_rollups(db.engine, app.config)
+    db.session.add(decision(room))
+    db.session.commit()
+    assert client.get('https://localhost/api/dashboard/stats', headers=auth_headers).status_code == 200
+    assert watermark() == 0
+    assert DecisionRollup.query.count() == 0
+
+def test_response_cache_is_bounded(app, client, auth_headers):
+    app.config['RESPONSE_CACHE_SIZE'] = 2
+    for day in range(1, 5):
+        client.get(f'{SERIES_URL}&start=2026-09-0{day}', headers=auth_headers)
+    assert len(CacheService._responses) == 2
+
+def test_parse_range_widens_to_whole_hours():
+    (start, end), error = analytics_engine.parse_range('2026-09-20T10:15', '2026-09-20T12:05')
+    assert error is None
+    assert (start, end) == (datetime(2026, 9, 20, 10), datetime(2026, 9, 20, 13))
+    assert analytics_engine.parse_range('2026-01-01', '2026-09-01', max_days=30)[1] == 'Range is limited to 30 days'
+    assert analytics_engine.parse_range('2026-09-20T10:00+02:00', None)[1] is not None
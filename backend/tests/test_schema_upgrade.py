@@ -0,0 +1,47 @@
+import sqlite3
+
+import config
+from app import create_app, seed_database
+from models import db, Classroom, Timetable
+
+# Classroom and Timetable as the first release created them
+OLD_SCHEMA = """
+CREATE TABLE classroom (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, building VARCHAR(50),
+    capacity INTEGER NOT NULL, num_lights INTEGER, num_acs INTEGER, num_fans INTEGER, is_active BOOLEAN);
+CREATE TABLE timetable (id INTEGER PRIMARY KEY, classroom_id INTEGER NOT NULL REFERENCES classroom (id),
+    day_of_week VARCHAR(20) NOT NULL, time_slot VARCHAR(20) NOT NULL, subject VARCHAR(100),
+    subject_type VARCHAR(20), teacher_name VARCHAR(100), teacher_email VARCHAR(120), expected_attendance FLOAT);
+INSERT INTO classroom VALUES (1, 'Room 101', 'A', 50, 8, 2, 4, 1);
+INSERT INTO timetable VALUES (1, 1, 'Tuesday', '10:30', 'Databases', 'theory', 'T', 't@x', 40);
+INSERT INTO timetable VALUES (2, 1, 'Someday', '10:30', 'Unknown', 'theory', 'T', 't@x', 40);
+"""
+
+def old_database_app(tmp_path, monkeypatch):
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(OLD_SCHEMA)
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{path}')
+    return create_app('testing')
+
+def test_seed_upgrades_and_backfills_an_old_database(tmp_path, monkeypatch):
+    app = old_database_app(tmp_path, monkeypatch)
+    seed_database(app)
+    with app.app_context():
+        entries = {e.id: e for e in Timetable.query.all()}
+        assert (entries[1].start_minute, entries[1].end_minute) == (1 * 1440 + 630, 1 * 1440 + 690)
+        assert entries[2].start_minute is None
+        assert entries[1].conflict_flag is None
+        assert Classroom.query.get(1).thermal_ramp_minutes is None
+        db.session.remove()
+
+def test_upgrade_is_idempotent(tmp_path, monkeypatch):
+    from models import upgrade_schema
+
+    app = old_database_app(tmp_path, monkeypatch)
+    with app.app_context():
+        db.create_all()
+        assert set(upgrade_schema(db.engine)) == {
+            'classroom.thermal_ramp_minutes', 'classroom.thermal_coast_minutes',
+            'timetable.start_minute', 'timetable.end_minute', 'timetable.conflict_flag'}
+        assert upgrade_schema(db.engine) == []
+        db.session.remove()
@@ -0,0 +1,182 @@
+"""
+Structured time-slot helpers and the in-memory timetable interval index.
+
+Timetable rows keep their free-form `day_of_week` / `time_slot` strings for
+display, but every write also stores a normalized [start_minute, end_minute)
+window measured in minutes since Monday 00:00. The index below is built
+from those windows and answers "what is happening at T" questions without
+touching the database.
+"""
+import bisect
+import threading
+from datetime import datetime
+
+DAY_INDEX = {'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3, 'Friday': 4, 'Saturday': 5, 'Sunday': 6}
+DAY_NAMES = list(DAY_INDEX)
+# Full names plus the short forms older timetables and CSV exports use ('Mon', 'Tues', 'Thurs')
+DAY_ALIASES = dict(DAY_INDEX, **{name[:3]: idx for name, idx in DAY_INDEX.items()}, Tues=1, Thur=3, Thurs=3)
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+DEFAULT_SESSION_MINUTES = 60
+
+def parse_day(day):
+    """'Monday' / 'mon ' / '0' -> 0. Returns None when unrecognised."""
+    text = str(day).strip()
+    if text.isdigit():
+        idx = int(text)
+        return idx if 0 <= idx < 7 else None
+    return DAY_ALIASES.get(text.capitalize())
+
+def parse_clock(text):
+    """'08:00' / '8:30' / '14' -> minutes since midnight, or None."""
+    try:
+        parts = str(text).strip().split(':')
+        hour = int(float(parts[0]))
+        minute = int(parts[1][:2]) if len(parts) > 1 else 0
+    except (ValueError, IndexError):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    return hour * 60 + minute
+
+def parse_slot(time_slot):
+    """'08:00' or '08:00-09:30' -> (start, end) minutes since midnight.
+
+    Slots without an explicit end last DEFAULT_SESSION_MINUTES.
+    """
+    text = str(time_slot).strip()
+    if '-' in text:
+        start_text, end_text = text.split('-', 1)
+        start, end = parse_clock(start_text), parse_clock(end_text)
+    else:
+        start, end = parse_clock(text), None
+    if start is None:
+        return None, None
+    if end is None or end <= start:
+        end = start + DEFAULT_SESSION_MINUTES
+    return start, min(end, DAY_MINUTES)
+
+def week_window(day_of_week, time_slot):
+    """Minute-of-week [start, end) window for a timetable entry, or (None, None)."""
+    day = parse_day(day_of_week)
+    start, end = parse_slot(time_slot)
+    if day is None or start is None:
+        return None, None
+    return day * DAY_MINUTES + start, day * DAY_MINUTES + end
+
+def minute_of_week(moment=None):
+    moment = moment or datetime.now()
+    return moment.weekday() * DAY_MINUTES + moment.hour * 60 + moment.minute
+
+def format_minute(minute_of_week_value):
+    """4830 -> ('Thursday', '08:30')"""
+    day, minute = divmod(int(minute_of_week_value) % WEEK_MINUTES, DAY_MINUTES)
+    return DAY_NAMES[day], f"{minute // 60:02d}:{minute % 60:02d}"
+
+class TimetableIndex:
+    """Immutable interval index over one week of timetable sessions.
+
+    All session boundaries are swept once into elementary segments, each
+    holding the sessions active inside it, so an "occupied at T" lookup is a
+    single bisect. Per-room sorted start lists answer "next session" by bisect
+    as well.
+    """
+    def __init__(self, sessions):
+        # sessions: iterable of dicts with entry_id, classroom_id, building, start, end
+        self.sessions = {s['entry_id']: s for s in sessions if s['start'] is not None}
+        self.rooms_by_building = {}
+        self.room_starts = {}
+        for s in self.sessions.values():
+            self.rooms_by_building.setdefault(s['building'], set()).add(s['classroom_id'])
+            self.room_starts.setdefault(s['classroom_id'], []).append((s['start'], s['entry_id']))
+        for starts in self.room_starts.values():
+            starts.sort()
+
+        events = []
+        for s in self.sessions.values():
+            events.append((s['start'], 1, s['entry_id']))
+            events.append((s['end'], -1, s['entry_id']))
+        events.sort()
+
+        self.boundaries = [0]
+        self.segments = [()]
+        active = set()
+        i = 0
+        while i < len(events):
+            point = events[i][0]
+            while i < len(events) and events[i][0] == point:
+                _, kind, entry_id = events[i]
+                if kind == 1:
+                    active.add(entry_id)
+                else:
+                    active.discard(entry_id)
+                i += 1
+            if point == self.boundaries[-1]:
+                self.segments[-1] = tuple(active)
+            else:
+                self.boundaries.append(point)
+                self.segments.append(tuple(active))
+
+    def active_at(self, minute):
+        """Sessions in progress at a minute-of-week, O(log n)."""
+        pos = bisect.bisect_right(self.boundaries, minute % WEEK_MINUTES) - 1
+        return [self.sessions[entry_id] for entry_id in self.segments[pos]]
+
+    def occupied_rooms(self, minute):
+        return {s['classroom_id'] for s in self.active_at(minute)}
+
+    def free_rooms(self, minute, building=None, all_rooms=None):
+        """Rooms with no session at `minute`; `all_rooms` maps classroom_id -> building."""
+        if all_rooms is not None:
+            candidates = {rid for rid, b in all_rooms.items() if building is None or b == building}
+        elif building is not None:
+            candidates = set(self.rooms_by_building.get(building, ()))
+        else:
+            candidates = set(self.room_starts)
+        return candidates - self.occupied_rooms(minute)
+
+    def next_session(self, classroom_id, minute):
+        """First session in a room starting at or after `minute`, wrapping past Sunday."""
+        starts = self.room_starts.get(classroom_id)
+        if not starts:
+            return None
+        pos = bisect.bisect_left(starts, (minute % WEEK_MINUTES, -1))
+        _, entry_id = starts[pos] if pos < len(starts) else starts[0]
+        return self.sessions[entry_id]
+
+    def next_sessions(self, minute):
+        return {room_id: self.next_session(room_id, minute) for room_id in self.room_starts}
+
+_index_lock = threading.Lock()
+_index_state = {'versions': None, 'index': None}
+
+def get_timetable_index():
+    """Return the process-wide index, rebuilding it when the timetable changed.
+
+    Staleness is detected with the same CacheVersion counters the timetable
+    write paths bump for the response cache, so every worker notices edits.
+    """
+    from models import Timetable, Classroom, db
+    from services import CacheService
+
+    versions = CacheService.get_versions(['timetable', 'classroom'])
+    with _index_lock:
+        if _index_state['versions'] == versions and _index_state['index'] is not None:
+            return _index_state['index']
+
+    rows = db.session.query(
+        Timetable.id, Timetable.classroom_id, Classroom.building,
+        Timetable.start_minute, Timetable.end_minute, Timetable.day_of_week, Timetable.time_slot
+    ).join(Classroom, Classroom.id == Timetable.classroom_id).filter(Classroom.is_active == True).all()
+
+    sessions = []
+    for entry_id, classroom_id, building, start, end, day, slot in rows:
+        if start is None:
+            # Rows written before the structured columns existed
+            start, end = week_window(day, slot)
+        sessions.append({'entry_id': entry_id, 'classroom_id': classroom_id,
+                         'building': building, 'start': start, 'end': end})
+    index = TimetableIndex(sessions)
+    with _index_lock:
+        _index_state.update(versions=versions, index=index)
+    return index